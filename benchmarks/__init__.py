@@ -0,0 +1,5 @@
+"""Offline benchmarks for the stages of an ETL pipeline.
+
+Source files are generated locally, with the same layout as CPC's files, so neither the NOAA FTP server nor IPFS is
+needed. Run with `nox -s benchmark`, or see `python -m benchmarks --help`.
+"""
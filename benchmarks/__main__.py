@@ -0,0 +1,94 @@
+"""Command line interface for the benchmarks."""
+
+import argparse
+import itertools
+import pathlib
+import sys
+
+from benchmarks import fetch, harness, pipeline
+from tests import synthetic
+
+SUITES = ("pipeline", "fetch")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    parser.add_argument(
+        "--scale",
+        action="append",
+        choices=synthetic.SCALES,
+        help="Scale to run at. May be repeated. Default is tiny, small, and medium.",
+    )
+    parser.add_argument(
+        "--suite", action="append", choices=SUITES, help="Suite to run. May be repeated. Default is all of them."
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Times to run each stage. Default is 3.")
+    parser.add_argument(
+        "--loader",
+        action="append",
+        choices=pipeline.LOADERS,
+        help="Loader to benchmark. May be repeated. Default is all of them.",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.02, help="Seconds the FTP server waits before each reply. Default is 0.02."
+    )
+    parser.add_argument(
+        "--bandwidth",
+        type=int,
+        default=50_000_000,
+        help="Bytes per second the FTP server sends for each download, or 0 for no limit. Default is 50000000.",
+    )
+    parser.add_argument(
+        "--workdir", type=pathlib.Path, default=pathlib.Path(".benchmarks"), help="Default is .benchmarks"
+    )
+    parser.add_argument("--output", type=pathlib.Path, help="Default is results.json in the working folder.")
+    parser.add_argument("--baseline", type=pathlib.Path, help="Default is baseline.json in the working folder.")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="Fraction slower than the baseline to allow. Default is 0.2."
+    )
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="Save the results as the new baseline instead of comparing."
+    )
+    args = parser.parse_args(argv)
+
+    scales = [synthetic.SCALES[name] for name in args.scale or ("tiny", "small", "medium")]
+    output = args.output or args.workdir / "results.json"
+    baseline = args.baseline or args.workdir / "baseline.json"
+
+    suites = args.suite or SUITES
+    runs = []
+    if "pipeline" in suites:
+        runs.append(pipeline.run(scales, args.workdir, args.repeat, args.loader or pipeline.LOADERS))
+    if "fetch" in suites:
+        runs.append(fetch.run(scales, args.workdir, args.repeat, args.latency, args.bandwidth or None))
+
+    measurements = []
+    print(f"{'stage':<32} {'scale':<8} {'seconds':>10} {'MB/s':>10} {'files/s':>10}")
+    for measurement in itertools.chain(*runs):
+        measurements.append(measurement)
+        print(
+            f"{measurement.stage:<32} {measurement.scale:<8} {measurement.seconds:>10.3f} "
+            f"{measurement.mb_per_s:>10.1f} {measurement.files_per_s:>10.2f}"
+        )
+
+    harness.write_results(measurements, output)
+    print(f"Results written to {output}")
+
+    if args.save_baseline:
+        harness.write_results(measurements, baseline)
+        print(f"Baseline written to {baseline}")
+        return 0
+
+    if not baseline.exists():
+        print(f"No baseline at {baseline} to compare with. Use --save-baseline to record one.")
+        return 0
+
+    regressions = harness.compare(measurements, harness.read_results(baseline), args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""Benchmarks for :class:`CPCFetcher`, run against a local FTP server serving synthetic CPC-like data."""
+
+from __future__ import annotations
+
+import concurrent.futures
+import pathlib
+import typing
+
+import numpy
+
+from dc_etl import filespec
+from dc_etl.fetch import Timespan
+from dc_etl.fetchers.cpc import CPCFetcher
+
+from benchmarks.harness import Measurement, best_of, empty_folder
+from tests import synthetic
+from tests.ftpserver import FTPServer
+
+WORKERS = (1, 2, 4, 8)
+
+
+def run(
+    scales: typing.Iterable[synthetic.Scale],
+    workdir: str | pathlib.Path,
+    repeat: int = 3,
+    latency: float = 0.02,
+    bandwidth: int | None = 50_000_000,
+    workers: typing.Iterable[int] = WORKERS,
+) -> typing.Generator[Measurement, None, None]:
+    """Benchmark fetching at each scale.
+
+    * `fetch:list`: Listing the remote files, as done by the first call to most of the fetcher's methods.
+    * `fetch:timespan`: Finding the remote timespan without a cache, which reads parts of the first and last files.
+    * `fetch:cold`: Fetching every file into an empty cache.
+    * `fetch:warm`: Fetching every file again, when they're all in the cache.
+    * `fetch:parallel:<n>`: Fetching every file into an empty cache with `n` fetchers, each on its own connection and
+      each fetching an equal share of the years, at the same time.
+
+    Parameters
+    ----------
+    scales : Iterable[synthetic.Scale]
+        The scales to run at.
+    workdir : str | pathlib.Path
+        Folder for source files and caches. The same source files are used as by :func:`benchmarks.pipeline.run`.
+    repeat : int
+        Number of times to run each benchmark. The fastest time is kept.
+    latency : float
+        Seconds the server waits before replying to each command. Default is 0.02, a modest round trip time.
+    bandwidth : int | None
+        Maximum bytes per second for each download, or `None` for no limit. Default is 50 MB/s.
+    workers : Iterable[int]
+        Numbers of parallel fetchers to benchmark.
+
+    Returns
+    -------
+    Generator[Measurement, None, None] :
+        A measurement for each benchmark at each scale, as each is taken.
+    """
+    for scale in scales:
+        folder = pathlib.Path(workdir) / scale.name
+        with FTPServer(folder, latency=latency, bandwidth=bandwidth) as server:
+            yield from _run_scale(scale, folder, server, repeat, workers)
+
+
+def _run_scale(scale, folder, server, repeat, workers):
+    paths = synthetic.cpc_files(folder / "Datasets" / "cpc_global_precip", scale.years, scale.lat, scale.lon)
+    source_bytes = sum(path.stat().st_size for path in paths)
+    files = len(paths)
+    years = [int(path.name.split(".")[1]) for path in paths]
+    span = Timespan(numpy.datetime64(f"{years[0]}-01-01"), numpy.datetime64(f"{years[-1]}-12-31"))
+    cache = folder / "cache"
+
+    def measure(stage, nbytes, run, setup=None):
+        seconds, value = best_of(repeat, run, setup)
+        return Measurement(f"fetch:{stage}", scale.name, seconds, nbytes, files)
+
+    def fetcher(cache=None):
+        return CPCFetcher("global_precip", cache, host=server.host, port=server.port)
+
+    yield measure("list", 0, lambda fetcher: fetcher._get_remote_files(), lambda: (fetcher(),))
+    yield measure("timespan", 0, lambda fetcher: fetcher.get_remote_timespan(), lambda: (fetcher(),))
+
+    def fetch(fetcher, span=span):
+        return list(fetcher.fetch(span))
+
+    yield measure("cold", source_bytes, fetch, lambda: (fetcher(filespec.file(empty_folder(cache))),))
+    yield measure("warm", source_bytes, fetch, lambda: (fetcher(filespec.file(cache)),))
+
+    for n in workers:
+
+        def setup():
+            # Each fetcher lists the remote files before this is timed, leaving only the downloads to be timed
+            fetchers = [fetcher(filespec.file(empty_folder(cache / str(i)))) for i in range(n)]
+            for each in fetchers:
+                each._get_remote_files()
+            return (fetchers,)
+
+        def parallel(fetchers):
+            spans = [
+                Timespan(numpy.datetime64(f"{share[0]}-01-01"), numpy.datetime64(f"{share[-1]}-12-31"))
+                for share in numpy.array_split(years, len(fetchers))
+                if len(share)
+            ]
+            with concurrent.futures.ThreadPoolExecutor(len(fetchers)) as pool:
+                return list(pool.map(fetch, fetchers, spans))
+
+        yield measure(f"parallel:{n}", source_bytes, parallel, setup)
@@ -0,0 +1,146 @@
+"""Timing, recording, and comparing benchmark results."""
+
+from __future__ import annotations
+
+import json
+import math
+import pathlib
+import platform
+import shutil
+import sys
+import time
+import typing
+
+
+class Measurement(typing.NamedTuple):
+    """How long one stage took at one scale."""
+
+    stage: str
+    """Name of the stage, eg "extract"."""
+
+    scale: str
+    """Name of the scale of the input."""
+
+    seconds: float
+    """Time taken, the fastest of any repeats."""
+
+    bytes: int
+    """Size of the input to the stage."""
+
+    files: int
+    """Number of source files the input came from."""
+
+    @property
+    def mb_per_s(self) -> float:
+        """Throughput in megabytes (10^6 bytes) per second."""
+        return self.bytes / 1e6 / self.seconds
+
+    @property
+    def files_per_s(self) -> float:
+        """Throughput in source files per second."""
+        return self.files / self.seconds
+
+
+def best_of(repeat: int, run: typing.Callable, setup: typing.Callable[[], tuple] | None = None):
+    """Run a function `repeat` times, and return the fastest time along with the function's last return value.
+
+    Parameters
+    ----------
+    repeat : int
+        Number of times to run the function.
+    run : Callable
+        The function to time.
+    setup : Callable[[], tuple] | None
+        If passed, called before each run, outside of the timing, to get the arguments to pass to `run`. Used when
+        each run needs fresh state, eg an empty folder to write to.
+
+    Returns
+    -------
+    tuple[float, Any] :
+        The fastest time, in seconds, and the value returned by the last run.
+    """
+    fastest = math.inf
+    for _ in range(repeat):
+        args = setup() if setup is not None else ()
+        start = time.perf_counter()
+        value = run(*args)
+        fastest = min(fastest, time.perf_counter() - start)
+
+    return fastest, value
+
+
+def empty_folder(folder: pathlib.Path) -> pathlib.Path:
+    """Make sure a folder exists and is empty, eg for a benchmark to write to. Returns the folder."""
+    shutil.rmtree(folder, ignore_errors=True)
+    folder.mkdir(parents=True)
+    return folder
+
+
+def write_results(measurements: typing.Iterable[Measurement], path: str | pathlib.Path):
+    """Write measurements to a JSON file, along with a description of the machine they were taken on."""
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    results = {
+        "machine": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "processor": platform.machine(),
+        },
+        "results": [
+            {**measurement._asdict(), "mb_per_s": measurement.mb_per_s, "files_per_s": measurement.files_per_s}
+            for measurement in measurements
+        ],
+    }
+    path.write_text(json.dumps(results, indent=2))
+
+
+def read_results(path: str | pathlib.Path) -> list[Measurement]:
+    """Read measurements written by :func:`write_results`."""
+    results = json.loads(pathlib.Path(path).read_text())["results"]
+    return [Measurement(*(result[field] for field in Measurement._fields)) for result in results]
+
+
+def compare(
+    measurements: typing.Iterable[Measurement],
+    baseline: typing.Iterable[Measurement],
+    tolerance: float = 0.2,
+    min_seconds: float = 0.01,
+) -> list[str]:
+    """Find stages which have slowed down compared to a baseline.
+
+    Only measurements of the same stage, at the same scale, of the same amount of input are compared. Timings are only
+    comparable between runs on the same machine, so a baseline should be recorded on the machine that it's compared on.
+
+    Parameters
+    ----------
+    measurements : Iterable[Measurement]
+        The new measurements.
+    baseline : Iterable[Measurement]
+        The measurements to compare against.
+    tolerance : float
+        How much slower, as a fraction of the baseline time, a stage may be before it counts as a regression. Default
+        is 0.2, or 20% slower.
+    min_seconds : float
+        How much slower, in seconds, a stage must also be to count as a regression, so that stages which take next to
+        no time don't fail on noise. Default is 0.01.
+
+    Returns
+    -------
+    list[str] :
+        A description of each regression. Empty if there are none.
+    """
+    baseline = {(measurement.stage, measurement.scale, measurement.bytes): measurement for measurement in baseline}
+    regressions = []
+    for measurement in measurements:
+        before = baseline.get((measurement.stage, measurement.scale, measurement.bytes))
+        if before is None:
+            continue
+
+        slower = measurement.seconds - before.seconds
+        if slower > before.seconds * tolerance and slower > min_seconds:
+            regressions.append(
+                f"{measurement.stage} ({measurement.scale}): {measurement.mb_per_s:.1f} MB/s, "
+                f"was {before.mb_per_s:.1f} MB/s ({slower / before.seconds:.0%} slower)"
+            )
+
+    return regressions
@@ -0,0 +1,373 @@
+"""Peak memory of the pipeline stages most likely to run out of memory, and how it scales with the size of the input.
+
+Each stage is run on synthetic inputs of growing size, each in a fresh process, so that measurements don't depend on
+what ran before. Peak memory is measured two ways: the peak of allocations traced by `tracemalloc`, which includes
+numpy arrays and is very repeatable, and the peak resident set size (RSS) above what it was when the stage started,
+which also includes allocations `tracemalloc` can't see, eg in HDF5 or Blosc.
+
+A power law, `peak = a * size ** exponent`, is fit to the peaks of each stage. An exponent near 0 means memory doesn't
+depend on the size of the input, as when data is streamed, and an exponent near 1 means memory grows with the input.
+
+Run with `nox -s memory`, or see `python -m benchmarks.memory --help`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import concurrent.futures
+import gc
+import json
+import multiprocessing
+import os
+import pathlib
+import resource
+import sys
+import threading
+import tracemalloc
+import typing
+
+import numpy
+
+from benchmarks.harness import empty_folder
+from tests import synthetic
+
+HERE = pathlib.Path(__file__).parent
+BASELINE = HERE / "memory_baseline.json"
+
+STAGES = ("combine", "open", "load")
+"""
+* `combine`: The default combiner, mostly `MultiZarrToZarr.translate`.
+* `open`: Opening the combined Zarr JSON with `xarray.open_dataset("reference://")`.
+* `load`: Writing the whole dataset with `to_zarr`, using the directory loader.
+"""
+
+
+class Peak(typing.NamedTuple):
+    """Peak memory of one stage on one input."""
+
+    stage: str
+    """Name of the stage."""
+
+    scale: str
+    """Name of the scale of the input."""
+
+    bytes: int
+    """Size of the input, as the uncompressed size of the dataset."""
+
+    traced: int
+    """Peak bytes allocated, as traced by `tracemalloc`."""
+
+    rss: int
+    """Peak resident set size, in bytes, above the resident set size when the stage started."""
+
+
+def peak_memory(run: typing.Callable[[], typing.Any], interval: float = 0.005) -> tuple[int, int]:
+    """Measure the peak memory used while running a function.
+
+    Parameters
+    ----------
+    run : Callable[[], Any]
+        The function to run.
+    interval : float
+        Seconds between samples of the resident set size.
+
+    Returns
+    -------
+    tuple[int, int] :
+        The peak bytes allocated, as traced by `tracemalloc`, and the peak resident set size, in bytes, above the
+        resident set size before `run` was called.
+    """
+    gc.collect()
+    sampler = _RSSSampler(interval)
+    tracemalloc.start()
+    sampler.start()
+    try:
+        run()
+    finally:
+        rss = sampler.stop()
+        _, traced = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return traced, rss
+
+
+def fit_exponent(sizes: typing.Sequence[float], peaks: typing.Sequence[float]) -> float:
+    """Fit `peak = a * size ** exponent` to measurements by least squares in log-log space, and return the exponent."""
+    exponent, _ = numpy.polyfit(numpy.log(sizes), numpy.log(numpy.maximum(peaks, 1)), 1)
+    return float(exponent)
+
+
+def run(
+    scales: typing.Sequence[synthetic.Scale], workdir: str | pathlib.Path, stages: typing.Iterable[str] = STAGES
+) -> dict:
+    """Measure the peak memory of each stage at each scale.
+
+    Parameters
+    ----------
+    scales : Sequence[synthetic.Scale]
+        The scales to run at, from smallest to largest. At least two are needed to fit exponents.
+    workdir : str | pathlib.Path
+        Folder for source files and intermediate output.
+    stages : Iterable[str]
+        The stages to measure. Default is all of them.
+
+    Returns
+    -------
+    dict :
+        For each stage, the peaks at each scale and the exponents fit to them.
+    """
+    workdir = pathlib.Path(workdir)
+    report = {}
+    for stage in stages:
+        peaks = []
+        for scale in scales:
+            folder = workdir / scale.name
+            _prepare(scale, folder)
+
+            # A fresh process for each measurement
+            context = multiprocessing.get_context("spawn")
+            with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as pool:
+                peaks.append(pool.submit(_measure, stage, scale, folder).result())
+
+        sizes = [peak.bytes for peak in peaks]
+        report[stage] = {
+            "peaks": [peak._asdict() for peak in peaks],
+            "traced_exponent": fit_exponent(sizes, [peak.traced for peak in peaks]),
+            "rss_exponent": fit_exponent(sizes, [peak.rss for peak in peaks]),
+        }
+
+    return report
+
+
+def compare(
+    report: dict,
+    baseline: dict,
+    tolerance: float = 0.25,
+    exponent_tolerance: float = 0.15,
+    min_bytes: int = 1_000_000,
+) -> list[str]:
+    """Find stages whose memory use has regressed compared to a baseline.
+
+    Traced peaks are compared at each scale that is in both, and the exponents fit to traced peaks are compared. RSS
+    is reported but not compared, since it varies with the allocator and the machine.
+
+    Parameters
+    ----------
+    report : dict
+        The new report, from :func:`run`.
+    baseline : dict
+        The report to compare against.
+    tolerance : float
+        How much more memory, as a fraction of the baseline peak, a stage may use before it counts as a regression.
+    exponent_tolerance : float
+        How much a scaling exponent may grow before it counts as a regression.
+    min_bytes : int
+        Peaks smaller than this aren't compared, and neither are the exponents of stages whose peaks are all smaller
+        than this, since at that size they are dominated by noise. Default is 1 MB.
+
+    Returns
+    -------
+    list[str] :
+        A description of each regression. Empty if there are none.
+    """
+    regressions = []
+    for stage, result in report.items():
+        before = baseline.get(stage)
+        if before is None:
+            continue
+
+        peaks = {(peak["scale"], peak["bytes"]): peak for peak in before["peaks"]}
+        for peak in result["peaks"]:
+            old = peaks.get((peak["scale"], peak["bytes"]))
+            if old is None or max(peak["traced"], old["traced"]) < min_bytes:
+                continue
+
+            if peak["traced"] > old["traced"] * (1 + tolerance):
+                regressions.append(f"{stage} ({peak['scale']}): peak {_mb(peak['traced'])}, was {_mb(old['traced'])}")
+
+        largest = max(peak["traced"] for peak in result["peaks"] + before["peaks"])
+        if largest >= min_bytes and result["traced_exponent"] > before["traced_exponent"] + exponent_tolerance:
+            regressions.append(
+                f"{stage}: scaling exponent {result['traced_exponent']:.2f}, was {before['traced_exponent']:.2f}"
+            )
+
+    return regressions
+
+
+def _prepare(scale, folder):
+    """Generate the source files and the outputs of the stages before the ones being measured, if not done already."""
+    from dc_etl import component, filespec
+
+    sources = synthetic.cpc_files(folder / "Datasets" / "cpc_global_precip", scale.years, scale.lat, scale.lon)
+    combined = folder / "combined"
+    if combined.exists():
+        return
+
+    extractor = component.extractor("netcdf", output_folder=filespec.file(folder / "extracted", auto_mkdir=True))
+    extracted = [out for source in sources for out in extractor(filespec.file(source))]
+    partial = empty_folder(folder / "partial")
+    _combiner(partial)(extracted)
+    partial.rename(combined)
+
+
+def _combiner(folder):
+    from dc_etl import component, filespec
+
+    return component.combiner(
+        "default",
+        output_folder=filespec.file(folder, auto_mkdir=True),
+        concat_dims=["time"],
+        identical_dims=["lat", "lon"],
+        preprocessors=[component.combine_preprocessor("fix_fill_value", synthetic.FILL_VALUE)],
+    )
+
+
+def _open(folder):
+    import xarray
+
+    (path,) = (folder / "combined").glob("*.json")
+    return xarray.open_dataset(
+        "reference://",
+        engine="zarr",
+        backend_kwargs={"consolidated": False, "storage_options": {"fo": str(path), "remote_protocol": "file"}},
+    )
+
+
+def _measure(stage, scale, folder) -> Peak:
+    """Measure one stage at one scale. Run in a fresh process."""
+    from dc_etl import component, filespec
+    from dc_etl.fetch import Timespan
+
+    dataset = _open(folder)
+    nbytes = dataset.nbytes
+
+    if stage == "combine":
+        extracted = [filespec.file(path) for path in sorted((folder / "extracted").glob("*.json"))]
+        combiner = _combiner(empty_folder(folder / "output"))
+        del dataset
+        traced, rss = peak_memory(lambda: combiner(extracted))
+
+    elif stage == "open":
+        del dataset
+        traced, rss = peak_memory(lambda: _open(folder))
+
+    else:
+        span = Timespan(dataset.time.values[0], dataset.time.values[-1])
+        loader = component.loader("directory", filespec.file(empty_folder(folder / "output")), time_dim="time")
+        traced, rss = peak_memory(lambda: loader.initial(dataset, span))
+
+    return Peak(stage, scale.name, nbytes, traced, rss)
+
+
+class _RSSSampler:
+    """Samples the resident set size of this process in a background thread, keeping the peak."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._start = self._peak = _rss()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> int:
+        """Stop sampling and return the peak above the resident set size when sampling started."""
+        self._stop.set()
+        self._thread.join()
+        self._peak = max(self._peak, _rss())
+        return max(self._peak - self._start, 0)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self._peak = max(self._peak, _rss())
+
+
+def _rss() -> int:
+    """Current resident set size of this process, in bytes."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+    except FileNotFoundError:  # Not Linux. Only the peak over the life of the process is available.
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def _mb(nbytes):
+    return f"{nbytes / 1e6:.1f} MB"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.memory", description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--stage", action="append", choices=STAGES, help="Stage to measure. May be repeated. Default is all of them."
+    )
+    parser.add_argument(
+        "--years",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4, 8],
+        help="Numbers of yearly files to measure with, smallest first. Default is 1 2 4 8.",
+    )
+    parser.add_argument(
+        "--grid", type=int, nargs=2, default=[90, 180], help="Latitudes and longitudes. Default is 90 180."
+    )
+    parser.add_argument(
+        "--workdir",
+        type=pathlib.Path,
+        default=pathlib.Path(".benchmarks/memory"),
+        help="Default is .benchmarks/memory",
+    )
+    parser.add_argument("--output", type=pathlib.Path, help="Default is results.json in the working folder.")
+    parser.add_argument("--baseline", type=pathlib.Path, default=BASELINE, help=f"Default is {BASELINE.name}.")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Fraction more memory than the baseline to allow. Default is 0.25.",
+    )
+    parser.add_argument(
+        "--exponent-tolerance", type=float, default=0.15, help="Growth of scaling exponents to allow. Default is 0.15."
+    )
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="Save the results as the new baseline instead of comparing."
+    )
+    args = parser.parse_args(argv)
+
+    lat, lon = args.grid
+    scales = [synthetic.Scale(f"{years}y", years, lat, lon) for years in args.years]
+    report = run(scales, args.workdir, args.stage or STAGES)
+
+    print(f"{'stage':<10} {'scale':<8} {'input':>12} {'traced':>12} {'rss':>12}")
+    for stage, result in report.items():
+        for peak in result["peaks"]:
+            print(
+                f"{stage:<10} {peak['scale']:<8} {_mb(peak['bytes']):>12} {_mb(peak['traced']):>12} "
+                f"{_mb(peak['rss']):>12}"
+            )
+        print(f"{stage:<10} exponent traced {result['traced_exponent']:.2f}, rss {result['rss_exponent']:.2f}")
+
+    output = args.output or args.workdir / "results.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {output}")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2))
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline} to compare with. Use --save-baseline to record one.")
+        return 0
+
+    regressions = compare(report, json.loads(args.baseline.read_text()), args.tolerance, args.exponent_tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""Benchmarks for each stage of a pipeline, run on synthetic CPC-like data."""
+
+from __future__ import annotations
+
+import pathlib
+import typing
+
+from dc_etl import component, filespec
+from dc_etl.fetch import Timespan
+
+from benchmarks.harness import Measurement, best_of, empty_folder
+from tests import synthetic
+
+LOADERS = ("directory", "memory")
+
+
+def run(
+    scales: typing.Iterable[synthetic.Scale],
+    workdir: str | pathlib.Path,
+    repeat: int = 3,
+    loaders: typing.Iterable[str] = LOADERS,
+) -> typing.Generator[Measurement, None, None]:
+    """Benchmark each stage of a pipeline at each scale.
+
+    Stages are run in pipeline order, each on the output of the one before:
+
+    * `extract`: The NetCDF extractor on each source file.
+    * `combine`: The default combiner on the extracted Zarr JSONs.
+    * `read`: Reading all of the data through the combined dataset, so the transformers and loaders that follow aren't
+      also timing reads of the source files.
+    * `transform:<name>`: Each of the transformers used for CPC data.
+    * `load:<name>`: An initial load of the whole dataset by each of `loaders`, which must be loaders that store data
+      locally.
+
+    Parameters
+    ----------
+    scales : Iterable[synthetic.Scale]
+        The scales to run at.
+    workdir : str | pathlib.Path
+        Folder for source files and intermediate output. Source files are kept between runs, since generating them
+        takes longer than the benchmarks themselves.
+    repeat : int
+        Number of times to run each stage. The fastest time is kept.
+    loaders : Iterable[str]
+        Names of the loaders to benchmark. Default is all of the loaders which store data locally.
+
+    Returns
+    -------
+    Generator[Measurement, None, None] :
+        A measurement for each stage at each scale, as each is taken.
+    """
+    for scale in scales:
+        yield from _run_scale(scale, pathlib.Path(workdir) / scale.name, repeat, loaders)
+
+
+def _run_scale(scale, folder, repeat, loaders):
+    paths = synthetic.cpc_files(
+        folder / "Datasets" / "cpc_global_precip", scale.years, scale.lat, scale.lon, scale.chunks
+    )
+    sources = [filespec.file(path) for path in paths]
+    source_bytes = sum(path.stat().st_size for path in paths)
+    files = len(paths)
+
+    def measure(stage, nbytes, run, setup=None):
+        seconds, value = best_of(repeat, run, setup)
+        return Measurement(stage, scale.name, seconds, nbytes, files), value
+
+    output = empty_folder(folder / "output")
+    extractor = component.extractor("netcdf", output_folder=filespec.file(output / "extracted", auto_mkdir=True))
+    measurement, extracted = measure(
+        "extract", source_bytes, lambda: [out for src in sources for out in extractor(src)]
+    )
+    yield measurement
+
+    combiner = component.combiner(
+        "default",
+        output_folder=filespec.file(output / "combined", auto_mkdir=True),
+        concat_dims=["time"],
+        identical_dims=["lat", "lon"],
+        preprocessors=[component.combine_preprocessor("fix_fill_value", synthetic.FILL_VALUE)],
+    )
+    measurement, dataset = measure("combine", source_bytes, lambda: combiner(extracted))
+    yield measurement
+
+    measurement, dataset = measure("read", dataset.nbytes, lambda: dataset.copy(deep=False).load())
+    yield measurement
+
+    transformers = {
+        "rename_dims": component.transformer("rename_dims", {"lat": "latitude", "lon": "longitude"}),
+        "normalize_longitudes": component.transformer("normalize_longitudes"),
+        "compress": component.transformer("compress", ["precip"]),
+    }
+    for name, transformer in transformers.items():
+        # Some transformers change the dataset in place, so each run gets its own copy
+        measurement, dataset = measure(
+            f"transform:{name}", dataset.nbytes, transformer, lambda: (dataset.copy(deep=False),)
+        )
+        yield measurement
+
+    span = Timespan(dataset.time.values[0], dataset.time.values[-1])
+    for name in loaders:
+        measurement, _ = measure(
+            f"load:{name}",
+            dataset.nbytes,
+            lambda loader: loader.initial(dataset, span),
+            lambda: (_loader(name, empty_folder(output / "loaded")),),
+        )
+        yield measurement
+
+
+def _loader(name, folder):
+    if name == "directory":
+        return component.loader(name, filespec.file(folder), time_dim="time")
+
+    return component.loader(name, time_dim="time")
@@ -1,4 +1,38 @@
+from __future__ import annotations
+
 import abc
+import typing
+
+if typing.TYPE_CHECKING:  # pragma NO COVER
+    from dc_etl.fetch import Timespan
+
+
+class Assessment(typing.NamedTuple):
+    """What needs to be done to bring a dataset up to date with its source.
+
+    Attributes
+    ----------
+    initial : Timespan | None
+        Write a new dataset covering this span, because none has been published yet.
+    append : Timespan | None
+        Append this span, which starts after the end of the published dataset.
+    replace : tuple[Timespan, ...]
+        Replace these spans of the published dataset, because their source data has changed. Spans don't overlap and
+        are in time order.
+    state : dict | None
+        The fetcher's remote state the assessment was made from, as returned by
+        :meth:`dc_etl.fetch.Fetcher.get_remote_state`, to be recorded with the dataset once it's loaded.
+    """
+
+    initial: Timespan | None = None
+    append: Timespan | None = None
+    replace: tuple[Timespan, ...] = ()
+    state: dict | None = None
+
+    @property
+    def nothing(self) -> bool:
+        """Whether there is nothing to do."""
+        return self.initial is None and self.append is None and not self.replace
 
 
 class Assessor(abc.ABC):
@@ -6,4 +40,14 @@ class Assessor(abc.ABC):
 
     @abc.abstractmethod
     def start(self, **kwargs):
-        """Start the analysis."""
+        """Start the analysis.
+
+        When called by a :class:`dc_etl.pipeline.Pipeline`, the pipeline's `fetcher` and `loader` are passed as keyword
+        arguments.
+
+        Returns
+        -------
+        Assessment | bool :
+            What needs to be done. Assessors which only return whether the pipeline should run leave it to the pipeline
+            to work out what to load.
+        """
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import typing
+
+import numpy
+
+from dc_etl.assessor import Assessment, Assessor
+from dc_etl.fetch import Timespan
+
+if typing.TYPE_CHECKING:  # pragma NO COVER
+    from dc_etl.fetch import Fetcher
+    from dc_etl.load import Loader
+
+
+class FreshnessAssessor(Assessor):
+    """Works out what has changed at the source since the dataset was last loaded, as cheaply as possible.
+
+    The fetcher's remote state, see :meth:`dc_etl.fetch.Fetcher.get_remote_state`, eg a listing of the remote files, is
+    compared with the state recorded in the published dataset's manifest, see :meth:`dc_etl.load.Loader.manifest`. If
+    they're the same, there is nothing to do, and nothing else is fetched or read. Otherwise, or if either state is
+    unavailable, the end of the remote timespan is compared with the end of the published dataset, and anything after
+    it is to be appended. If there is no manifest, eg because the dataset was published before the loader kept them,
+    the timespan of the published dataset is read from its time coordinate, see :meth:`dc_etl.load.Loader.dataset`,
+    using the loader's `time_dim`. Only if no dataset has been published at all is the whole remote timespan loaded
+    from scratch.
+
+    Where both states are available and their entries have `start` and `end` timestamps, entries which are new or
+    whose size or modification time have changed, and which lie entirely within the published dataset, are to be
+    replaced. Entries which extend past the end of the published dataset are taken to have had data added to them, the
+    way sources usually add data, and are only appended from.
+
+    Parameters
+    ----------
+    replace : bool
+        Whether to replace spans of the dataset whose source data has changed. Default is `True`. If `False`, changes
+        to data which has already been loaded are ignored.
+    state : bool
+        Whether to use the fetcher's remote state at all. Default is `True`. If `False`, only the end of the remote
+        timespan is compared with the published dataset.
+    """
+
+    def __init__(self, replace: bool = True, state: bool = True):
+        self.replace = replace
+        self.state = state
+
+    def start(self, fetcher: Fetcher, loader: Loader, **kwargs) -> Assessment:
+        """Implementation of :meth:`Assessor.start`"""
+        state = fetcher.get_remote_state() if self.state else None
+        manifest = loader.manifest()
+        published = _published(loader, manifest)
+        if published is None:
+            return Assessment(initial=fetcher.get_remote_timespan(), state=state)
+
+        recorded = manifest.get("source") if manifest is not None else None
+        if state is not None and state == recorded:
+            return Assessment(state=state)
+
+        replace = ()
+        if self.replace and state is not None and recorded is not None:
+            replace = _changed(state, recorded, published)
+
+        append = None
+        remote = fetcher.get_remote_timespan()
+        if remote.end > published.end:
+            # The span starts just after the last timestamp already loaded, whatever the time step
+            append = Timespan(published.end + numpy.timedelta64(1, "ns"), remote.end)
+
+        return Assessment(append=append, replace=replace, state=state)
+
+
+def _published(loader: Loader, manifest: dict | None) -> Timespan | None:
+    """Find the timespan of the published dataset, or `None` if there is no data published."""
+    if manifest is not None:
+        start, end = manifest["time"]["start"], manifest["time"]["end"]
+        if end is None:
+            return None
+
+        return Timespan(numpy.datetime64(start), numpy.datetime64(end))
+
+    dataset = loader.dataset()
+    if dataset is None or dataset.sizes.get(loader.time_dim, 0) == 0:
+        return None
+
+    times = dataset[loader.time_dim]
+    return Timespan(times[0].values, times[-1].values)
+
+
+def _changed(state: dict, recorded: dict, published: Timespan) -> tuple[Timespan, ...]:
+    """Find the spans of the published dataset covered by entries of the remote state which have changed."""
+    spans = []
+    for key, entry in state.items():
+        if not isinstance(entry, dict) or "start" not in entry or "end" not in entry:
+            continue
+
+        if entry == recorded.get(key):
+            continue
+
+        span = Timespan(numpy.datetime64(entry["start"]), numpy.datetime64(entry["end"]))
+        if span.end > published.end:
+            continue
+
+        if span.start <= published.end and span.end >= published.start:
+            spans.append(Timespan(max(span.start, published.start), span.end))
+
+    # Entries may overlap, eg when a source has more than one version of a file, so each span is replaced only once
+    merged = []
+    for span in sorted(spans):
+        if merged and span.start <= merged[-1].end:
+            merged[-1] = Timespan(merged[-1].start, max(merged[-1].end, span.end))
+        else:
+            merged.append(span)
+
+    return tuple(merged)
@@ -0,0 +1,255 @@
+"""An index summarizing the values in each chunk of a Zarr dataset, so readers can skip chunks which can't match.
+
+For each indexed data variable, the index records the minimum, maximum, and fill fraction, the fraction of values
+which are NaN, eg missing, of each of the variable's Zarr chunks. It is stored in the dataset itself, as one Zarr array
+per variable in the `_chunk_index` group, with the shape of the variable's grid of chunks plus a last dimension for the
+three summaries. xarray doesn't read groups when opening a dataset, so readers which don't use the index never see it.
+
+Loaders summarize chunks as they are written, see :func:`dc_etl.stats.to_zarr`, and only update the entries for the
+chunks written, so the index never needs the whole dataset to be read again.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import typing
+
+import numpy
+import xarray
+import zarr
+
+from numcodecs.compat import ensure_bytes
+
+from dc_etl.stats import Statistics
+
+GROUP = "_chunk_index"
+FIELDS = ("min", "max", "fill")
+
+# Most index entries per chunk of an index array
+_ENTRIES = 1 << 16
+
+
+def update(
+    store: typing.MutableMapping,
+    blocks: dict[str, dict[tuple, Statistics]],
+    offsets: typing.Mapping[str, int] | None = None,
+    append: bool = False,
+):
+    """Update the index with the summaries of chunks which have just been written.
+
+    Parameters
+    ----------
+    store : MutableMapping
+        The store the dataset was written to, with consolidated metadata.
+    blocks : dict[str, dict[tuple, Statistics]]
+        Statistics of each block of data written, by variable name, then by the block's location in the data written,
+        as collected by :func:`dc_etl.stats.to_zarr`. Each block must cover whole Zarr chunks, apart from at the ends
+        of the data written, eg as chunked by :func:`dc_etl.load.align_chunks`.
+    offsets : Mapping[str, int] | None
+        Position along each dimension at which the data was written, eg the previous length of the time dimension when
+        appending. Default is 0 for every dimension.
+    append : bool
+        Whether the data was appended. Chunks only partly covered by appended data are summarized by merging with their
+        existing summaries. Otherwise, eg when replacing data, they are read back from the store to be summarized.
+    """
+    offsets = offsets or {}
+    metadata = json.loads(ensure_bytes(store[".zmetadata"]))["metadata"]
+    dataset = None
+    for name, observed in blocks.items():
+        array = metadata[f"{name}/.zarray"]
+        dims = metadata.get(f"{name}/.zattrs", {}).get("_ARRAY_DIMENSIONS", [])
+        shape, chunks = array["shape"], array["chunks"]
+        index = _index_array(store, name, dims, shape, chunks)
+
+        summaries = {}
+        partial = {}
+        for location, statistics in observed.items():
+            start = [lo + offsets.get(dim, 0) for (lo, _), dim in zip(location, dims)]
+            stop = [hi + offsets.get(dim, 0) for (_, hi), dim in zip(location, dims)]
+            position = tuple(lo // size for lo, size in zip(start, chunks))
+            bounds = [(i * size, min((i + 1) * size, n)) for i, size, n in zip(position, chunks, shape)]
+            if [(lo, hi) for lo, hi in zip(start, stop)] == bounds:
+                summaries[position] = _summary(statistics)
+            else:
+                partial[position] = (statistics, start, bounds)
+
+        if partial:
+            existing = _read(index, list(partial))
+            for position, (statistics, start, bounds) in partial.items():
+                summary = None
+                if append:
+                    summary = _merge_appended(existing[position], statistics, start, bounds)
+                if summary is None:
+                    if dataset is None:
+                        dataset = xarray.open_zarr(store, consolidated=True)
+                    region = {dim: slice(lo, hi) for dim, (lo, hi) in zip(dims, bounds)}
+                    summary = _summary(Statistics.of(dataset[name].isel(region).values))
+                summaries[position] = summary
+
+        _write(index, summaries)
+
+    _consolidate(store, list(blocks))
+
+
+def candidate_chunks(
+    store: typing.Mapping, name: str, minimum: float | None = None, maximum: float | None = None
+) -> list[dict[str, slice]]:
+    """Find the chunks of a variable which may have values in a range, according to the index.
+
+    Chunks with no values, only NaNs, never match. Chunks which haven't been summarized always match.
+
+    Parameters
+    ----------
+    store : Mapping
+        The store the dataset is in.
+    name : str
+        Name of the variable.
+    minimum : float | None
+        Lower bound of the range, inclusive, or `None` for no lower bound.
+    maximum : float | None
+        Upper bound of the range, inclusive, or `None` for no upper bound.
+
+    Returns
+    -------
+    list[dict[str, slice]] :
+        The region covered by each candidate chunk, as a mapping of dimension name to slice, suitable for passing to
+        :meth:`xarray.Dataset.isel`.
+    """
+    index = zarr.open_array(store, path=f"{GROUP}/{name}", mode="r")
+    dims, chunks = index.attrs["dims"], index.attrs["chunks"]
+    summaries = index[...]
+    lowest, highest, fill = summaries[..., 0], summaries[..., 1], summaries[..., 2]
+
+    # Comparisons with NaN are false, so chunks which haven't been summarized are kept
+    candidates = ~(fill >= 1)
+    if minimum is not None:
+        candidates &= ~(highest < minimum)
+    if maximum is not None:
+        candidates &= ~(lowest > maximum)
+
+    return [
+        {dim: slice(int(i) * size, (int(i) + 1) * size) for dim, i, size in zip(dims, position, chunks)}
+        for position in zip(*numpy.nonzero(candidates))
+    ]
+
+
+def bounds(store: typing.Mapping, name: str) -> tuple[float, float] | None:
+    """Find the smallest and largest values of a variable from the index, without reading the variable itself.
+
+    Parameters
+    ----------
+    store : Mapping
+        The store the dataset is in.
+    name : str
+        Name of the variable.
+
+    Returns
+    -------
+    tuple[float, float] | None :
+        The smallest and largest values, NaN if the variable has no values, or `None` if any chunk of it hasn't been
+        summarized.
+    """
+    summaries = zarr.open_array(store, path=f"{GROUP}/{name}", mode="r")[...]
+    lowest, highest, fill = summaries[..., 0], summaries[..., 1], summaries[..., 2]
+    if numpy.isnan(fill).any():
+        return None
+
+    values = fill < 1
+    if not values.any():
+        return numpy.nan, numpy.nan
+
+    return float(lowest[values].min()), float(highest[values].max())
+
+
+def _index_array(store, name, dims, shape, chunks) -> zarr.Array:
+    """Open the index array for a variable, creating it or growing it to fit the variable's grid of chunks."""
+    grid = [math.ceil(size / chunk) for size, chunk in zip(shape, chunks)]
+    path = f"{GROUP}/{name}"
+    if f"{path}/.zarray" not in store:
+        index_chunks = list(grid)
+        while math.prod(index_chunks) > _ENTRIES:
+            axis = index_chunks.index(max(index_chunks))
+            index_chunks[axis] = math.ceil(index_chunks[axis] / 2)
+
+        index = zarr.create(
+            shape=(*grid, len(FIELDS)),
+            chunks=(*index_chunks, len(FIELDS)),
+            dtype="<f8",
+            fill_value=numpy.nan,
+            store=store,
+            path=path,
+        )
+        index.attrs.update({"variable": name, "dims": dims, "chunks": chunks, "fields": FIELDS})
+        return index
+
+    index = zarr.open_array(store, path=path, mode="r+")
+    if list(index.shape[:-1]) != grid:
+        index.resize(*grid, len(FIELDS))
+
+    return index
+
+
+def _bounding_box(positions):
+    return tuple(slice(min(axis), max(axis) + 1) for axis in zip(*positions))
+
+
+def _read(index, positions) -> dict[tuple, numpy.ndarray]:
+    """Read the existing summaries of some chunks."""
+    box = _bounding_box(positions)
+    summaries = index[box]
+    return {position: summaries[tuple(i - s.start for i, s in zip(position, box))] for position in positions}
+
+
+def _write(index, summaries):
+    """Write the summaries of some chunks, reading and writing only the part of the index around them."""
+    if not summaries:
+        return
+
+    box = _bounding_box(summaries)
+    current = index[box]
+    for position, summary in summaries.items():
+        current[tuple(i - s.start for i, s in zip(position, box))] = summary
+    index[box] = current
+
+
+def _summary(statistics: Statistics) -> tuple[float, float, float]:
+    size = statistics.count + statistics.nan_count
+    return statistics.minimum, statistics.maximum, statistics.nan_count / size if size else numpy.nan
+
+
+def _merge_appended(existing, statistics, start, bounds):
+    """Merge the summary of a chunk from before data was appended to it with the summary of the appended data.
+
+    Returns `None` if there is no usable summary from before, or the chunk wasn't simply extended.
+    """
+    lowest, highest, fill = existing
+    if numpy.isnan(fill):
+        return None
+
+    # The appended data must cover the chunk from where the data before it ended, along exactly one dimension
+    extended = [axis for axis, (lo, (chunk_lo, _)) in enumerate(zip(start, bounds)) if lo != chunk_lo]
+    if len(extended) != 1:
+        return None
+
+    axis = extended[0]
+    before = (start[axis] - bounds[axis][0]) * math.prod(hi - lo for i, (lo, hi) in enumerate(bounds) if i != axis)
+    size = before + statistics.count + statistics.nan_count
+    return (
+        numpy.fmin(lowest, statistics.minimum),
+        numpy.fmax(highest, statistics.maximum),
+        (round(fill * before) + statistics.nan_count) / size,
+    )
+
+
+def _consolidate(store, names):
+    """Add the index's metadata to the dataset's consolidated metadata, without listing the whole store."""
+    consolidated = json.loads(ensure_bytes(store[".zmetadata"]))
+    keys = [f"{GROUP}/.zgroup"]
+    for name in names:
+        keys.extend((f"{GROUP}/{name}/.zarray", f"{GROUP}/{name}/.zattrs"))
+
+    for key in keys:
+        consolidated["metadata"][key] = json.loads(ensure_bytes(store[key]))
+
+    store[".zmetadata"] = json.dumps(consolidated, indent=4, sort_keys=True).encode()
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import abc
+import os
 import time
 
 import orjson
@@ -61,6 +62,11 @@ class DefaultCombiner(Combiner):
         Postprocessors to apply when combining data. Postproccessors are callables of the same kind used by
         `kerchunk.MultiZarrToZarr`. What little documentation there is of them seems to be here:
         https://fsspec.github.io/kerchunk/tutorial.html#postprocessing
+
+    chunks : dict | str | None
+        Passed to `xarray.open_dataset` to open the combined dataset with dask. `{}` uses the chunks of the source
+        files, which loaders then align with the Zarr chunks they write, so that chunks can be read and encoded in
+        parallel. Default is `None`, which doesn't use dask.
     """
 
     @classmethod
@@ -78,12 +84,14 @@ class DefaultCombiner(Combiner):
         identical_dims: list[str],
         preprocessors: list[CombinePreprocessor] = (),
         postprocessors: list[CombinePostprocessor] = (),
+        chunks: dict | str | None = None,
     ):
         self.output_folder = output_folder
         self.concat_dims = concat_dims
         self.identical_dims = identical_dims
         self.preprocessors = preprocessors
         self.postprocessors = postprocessors
+        self.chunks = chunks
 
     def __call__(self, sources: list[FileSpec], **kwargs) -> xarray.Dataset:
         """Implementation of meth:`Combiner.__call__`.
@@ -118,13 +126,15 @@ class DefaultCombiner(Combiner):
             postprocess=postprocessor(self.postprocessors),
         )
 
-        output = self.output_folder / f"combined_zarr_{int(time.time()):d}.json"
+        # Unique even when several combiners share an output folder, eg in parallel processes
+        output = self.output_folder / f"combined_zarr_{time.time_ns():d}_{os.getpid():d}.json"
         with output.open("wb") as f_out:
             f_out.write(orjson.dumps(ensemble.translate()))
 
         return xarray.open_dataset(
             "reference://",
             engine="zarr",
+            chunks=self.chunks,
             backend_kwargs={
                 "consolidated": False,
                 "storage_options": {
@@ -1,11 +1,23 @@
-from dc_etl.ipld.loader import IPLDPublisher
-from dc_etl.load import Loader
-from .combine import Combiner, CombinePreprocessor, CombinePostprocessor
+"""Functions to get and configure components by name.
+
+The modules implementing components, and any heavy dependencies they have, are only imported when a component is
+requested.
+"""
+
+from __future__ import annotations
+
+import typing
+
 from .config import _get_component
-from .extract import Extractor
-from .fetch import Fetcher
-from .transform import Transformer
-from .assessor import Assessor
+
+if typing.TYPE_CHECKING:  # pragma NO COVER
+    from .assessor import Assessor
+    from .combine import Combiner, CombinePreprocessor, CombinePostprocessor
+    from .extract import Extractor
+    from .fetch import Fetcher
+    from .ipld.loader import IPLDPublisher
+    from .load import Loader
+    from .transform import Transformer
 
 
 def assessor(name: str, *args, **kwargs) -> Assessor:
@@ -123,3 +135,16 @@ def ipld_publisher(name: str, *args, **kwargs) -> IPLDPublisher:
         Any extra keyword arguments are passed to the implementation entry point to get an instance.
     """
     return _get_component("ipld_publisher", name, args, kwargs)
+
+
+def ipld_store(name: str, *args, **kwargs):
+    """Get and configure a ipld_store implementation by name.
+
+    Parameters
+    ----------
+    name : str
+        The registered name of the ipld_store implementation to get and configure.
+    **kwargs :
+        Any extra keyword arguments are passed to the implementation entry point to get an instance.
+    """
+    return _get_component("ipld_store", name, args, kwargs)
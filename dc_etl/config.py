@@ -2,16 +2,18 @@ from __future__ import annotations
 
 import collections
 import pathlib
-
-from importlib.metadata import entry_points
-
-import yaml
+import typing
 
 from dc_etl import errors
-from dc_etl.filespec import FileSpec
+
+if typing.TYPE_CHECKING:  # pragma NO COVER
+    from dc_etl.filespec import FileSpec
 
 _MISSING = object()
 
+# Entry points by group, then by name. Built the first time a component is looked up.
+_registry = None
+
 
 class _Configuration(collections.UserDict):
     """A wrapper for a dictionary that adds some minimal validation so that users get friendlier error messages if
@@ -20,6 +22,13 @@ class _Configuration(collections.UserDict):
 
     @classmethod
     def from_yaml(cls, path: FileSpec):
+        # Imported here, rather than when dc_etl is imported, so that code which doesn't read configuration doesn't pay
+        # for importing yaml and fsspec
+        import yaml
+
+        from dc_etl.filespec import FileSpec
+
+        yaml.add_constructor("!filespec", FileSpec._load_yaml)
         data = yaml.load(path.open(), Loader=yaml.Loader)
         return cls(data, path.path, [])
 
@@ -56,14 +65,39 @@ class _Configuration(collections.UserDict):
         return _get_component(group, name, (), config)
 
 
+def refresh_registry():
+    """Forget the entry points found so far, so that they are looked up again the next time a component is needed.
+
+    Entry points are only looked up once per process, since scanning the installed distributions is slow. Call this
+    after installing or otherwise registering a new plugin in a running process, eg in tests.
+    """
+    global _registry
+    _registry = None
+
+
+def _entry_points(group):
+    """Get the entry points in a group, by name."""
+    global _registry
+    if _registry is None:
+        from importlib.metadata import entry_points  # Slow to import, and only needed once
+
+        registry = collections.defaultdict(dict)
+        for entry_point in entry_points():
+            registry[entry_point.group].setdefault(entry_point.name, entry_point)
+        _registry = registry
+
+    return _registry.get(group, {})
+
+
 def _get_component(group, name, args, kwargs):
-    for component in entry_points(group=group):
-        if component.name == name:
-            factory = component.load()
+    component = _entry_points(group).get(name)
+    if component is None:
+        raise errors.MissingConfigurationError(f"Unable to find {group}: {name}")
 
-            if hasattr(factory, "_from_config") and isinstance(kwargs, _Configuration):
-                return factory._from_config(kwargs)
+    # Only now is the module that implements the component imported
+    factory = component.load()
 
-            return factory(*args, **kwargs)
+    if hasattr(factory, "_from_config") and isinstance(kwargs, _Configuration):
+        return factory._from_config(kwargs)
 
-    raise errors.MissingConfigurationError(f"Unable to find {group}: {name}")
+    return factory(*args, **kwargs)
@@ -1,2 +1,6 @@
 class MissingConfigurationError(KeyError):
     """Raised when configuration is missing."""
+
+
+class BlockStoreError(Exception):
+    """Raised when a block could not be stored as expected."""
@@ -1,9 +1,12 @@
+from __future__ import annotations
+
 import abc
 import typing
 
-import numpy
+if typing.TYPE_CHECKING:  # pragma NO COVER
+    import numpy
 
-from . import filespec
+    from . import filespec
 
 
 class Timespan(typing.NamedTuple):
@@ -32,3 +35,31 @@ class Fetcher(abc.ABC):
         typing.Generator[xarray.Dataset, None, None] :
             A generator that yields one `filespec.FileSpec` for each source data file from the data provider.
         """
+
+    @abc.abstractmethod
+    def get_remote_timespan(self, **kwargs) -> Timespan:
+        """Get the timespan of the data currently available from the remote data provider.
+
+        Returns
+        -------
+        Timespan :
+            The first and last timestamps available.
+        """
+
+    def get_remote_state(self, **kwargs) -> dict | None:
+        """Cheaply describe the data currently available from the remote data provider, without downloading any of it.
+
+        Used to poll for new or updated data: if the state is the same as from an earlier call, nothing has changed.
+        Implementations should get fresh information each time, eg by listing the remote files again, and make sure
+        that other methods, such as `get_remote_timespan`, reflect any changes found.
+
+        Returns
+        -------
+        dict | None :
+            A JSON serializable description of the remote data, eg the sizes and modification times of remote files.
+            The default implementation returns `None`, meaning there is no cheap way to tell.
+
+            If the values are dicts with `start` and `end` keys, the ISO 8601 first and last timestamps covered by an
+            entry, eg a file, then an assessor can tell which spans of data a change affects.
+        """
+        return None
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
-import functools
+import json
+import os
 import re
 
 from typing import Generator
@@ -32,26 +33,43 @@ class CPCFetcher(Fetcher):
         Which CPC dataset to fetch, eg "precip_global", "precip_us", etc...
     cache: FileSpec | None
         Optionally, a writable folder where downloaded files can be cached.
+    host: str
+        The FTP server to fetch from. Default is CPC's, "ftp.cdc.noaa.gov".
+    port: int
+        The port of the FTP server. Default is 21.
     """
 
-    def __init__(self, dataset: str, cache: FileSpec | None = None):
+    def __init__(self, dataset: str, cache: FileSpec | None = None, host: str = "ftp.cdc.noaa.gov", port: int = 21):
         glob = _GLOB.get(dataset)
         if glob is None:
             raise MissingConfigurationError(f"Unrecognized dataset: {dataset}, valid values are {', '.join(_GLOB)}")
 
         self._glob = glob
         self._cache = cache
+        self._host = host
+        self._port = port
+        self._connection = None
+        self._state = None
+        self._files = None
+        self._timespan = None
 
     @property
-    @functools.cache
     def _fs(self):
         """Get the FTP filesystem lazily.
 
-        Instantiating the fsspec filesystem creates a network connection, so it's better to this lazily."""
-        return fsspec.filesystem("ftp", host="ftp.cdc.noaa.gov")
+        Instantiating the fsspec filesystem creates a network connection, so it's better to this lazily. A process
+        forked from this one, eg to fetch in parallel, gets a connection of its own, since a connection can't be shared
+        between processes."""
+        pid = os.getpid()
+        if self._connection is None or self._connection[0] != pid:
+            self._connection = (pid, fsspec.filesystem("ftp", host=self._host, port=self._port))
+
+        return self._connection[1]
 
-    @functools.cache
     def _get_remote_files(self):
+        if self._files is not None:
+            return self._files
+
         seen_years = set()
         files = []
         for glob in self._glob:
@@ -66,15 +84,50 @@ class CPCFetcher(Fetcher):
                 files.append(file)
                 seen_years.add(year)
 
-        return sorted(files, key=_year)
+        self._files = sorted(files, key=_year)
+        return self._files
 
-    @functools.cache
     def get_remote_timespan(self, **kwargs) -> Timespan:
         """Implementation of :meth:`Fetcher.get_remote_timespan`"""
-        files = self._get_remote_files()
-        first = xarray.open_dataset(self._get_file_by_path(files[0]).open())
-        last = xarray.open_dataset(self._get_file_by_path(files[-1]).open())
-        return Timespan(first.time[0].values, last.time[-1].values)
+        if self._timespan is None:
+            files = self._get_remote_files()
+            first = xarray.open_dataset(self._get_file_by_path(files[0]).open())
+            last = xarray.open_dataset(self._get_file_by_path(files[-1]).open())
+            self._timespan = Timespan(first.time[0].values, last.time[-1].values)
+
+        return self._timespan
+
+    def get_remote_state(self, **kwargs) -> dict:
+        """Implementation of :meth:`Fetcher.get_remote_state`
+
+        Lists the remote files again, getting only their sizes and modification times, along with the year each file
+        covers as its `start` and `end`. CPC's file for the current year is rewritten as data is added, so if the
+        listing has changed, the remote timespan is found again. Any cached copy of a file whose size or modification
+        time has changed since it was downloaded is removed, so that it's downloaded again. Each cached file's listing
+        is kept next to it, so this works across processes. A cached file without one, eg from an older version of
+        this fetcher, is downloaded again too.
+        """
+        self._fs.invalidate_cache()
+        state = {}
+        listings = {}
+        for glob in self._glob:
+            for path, info in self._fs.glob(glob, detail=True).items():
+                if _DATA_FILE.match(path):
+                    year = _year(path)
+                    listings[path] = _listing(info)
+                    state[path] = {**listings[path], "start": f"{year}-01-01", "end": f"{year}-12-31"}
+
+        if state != self._state:
+            self._state = state
+            self._files = None
+            self._timespan = None
+            if self._cache:
+                for path, listing in listings.items():
+                    cache_path = self._cache_path(path)
+                    if cache_path.exists() and self._cached_listing(cache_path) != listing:
+                        cache_path.fs.rm(cache_path.path)
+
+        return state
 
     def prefetch(self, span: Timespan, **kwargs):
         """Implementation of :meth:`Fetcher.pre_fetch`"""
@@ -99,8 +152,7 @@ class CPCFetcher(Fetcher):
         # Check cache
         cache_path = self._cache_path(path)
         if not cache_path.exists():
-            # Download it to the cache
-            self._fs.get_file(path, cache_path.open("wb"))
+            self._download(path, cache_path)
 
         # Return the cached file
         return cache_path
@@ -120,10 +172,35 @@ class CPCFetcher(Fetcher):
         # Download it to the cache
         path = self._year_to_path(year)
         cache_path = self._cache_path(path)
-        self._fs.get_file(path, cache_path.open("wb"))
+        self._download(path, cache_path)
 
         return cache_path
 
+    def _download(self, path, cache_path):
+        """Download a file to the cache.
+
+        The file is downloaded under a temporary name and only renamed once complete, so that an interrupted download
+        doesn't leave a truncated file in the cache to be mistaken for the real thing later. The remote file's size and
+        modification time are saved next to it, so that :meth:`get_remote_state` can tell if it has changed since.
+        """
+        listing = _listing(self._fs.info(path))
+        partial = cache_path.with_suffix("partial")
+        with partial.open("wb") as f:
+            self._fs.get_file(path, f)
+
+        partial.fs.mv(partial.path, cache_path.path)
+        with cache_path.with_suffix("json").open("w") as f:
+            json.dump(listing, f)
+
+    def _cached_listing(self, cache_path):
+        """Get the remote file's size and modification time when it was downloaded to the cache, if known."""
+        saved = cache_path.with_suffix("json")
+        if not saved.exists():
+            return None
+
+        with saved.open("r") as f:
+            return json.load(f)
+
     def _cache_path(self, path):
         """Compute a file's path in the cache."""
         filename = path.split("/")[-1]
@@ -137,6 +214,11 @@ class CPCFetcher(Fetcher):
         raise KeyError(year)
 
 
+def _listing(info: dict) -> dict:
+    """Get the size and modification time of a remote file from its listing."""
+    return {"size": info.get("size"), "modified": info.get("modify")}
+
+
 def _year(path: str) -> int:
     """Given a file path for a CPC data file, return the year from the filename."""
     return int(path[-7:-3])  # "...YYYY.nc"
@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import collections
+import os
+import pathlib
+import threading
+import typing
+import uuid
+
+from multiformats import CID
+
+
+class BlockCache:
+    """A local, on disk cache of IPFS blocks, keyed by CID.
+
+    Because IPFS blocks are immutable, cached blocks never need to be invalidated. When the total size of the cache
+    exceeds `max_bytes`, the least recently used blocks are evicted. Blocks are written atomically, so the same cache
+    folder can be shared by any number of loaders and processes at the same time.
+
+    The cache folder is only listed once, the first time a block is put in the cache. After that, each instance keeps
+    track of the blocks it has seen in memory, in least recently used order, so evicting blocks costs nothing more than
+    deleting them. Blocks put in the cache by other processes are tracked once they are read.
+
+    Parameters
+    ----------
+    path : str | pathlib.Path
+        Folder in the local filesystem to store cached blocks in. It will be created if it doesn't exist.
+    max_bytes : int
+        Total size, in bytes, that the cache is allowed to grow to. Default is 1 GiB.
+    """
+
+    def __init__(self, path: str | pathlib.Path, max_bytes: int = 1 << 30):
+        self.path = pathlib.Path(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = 0
+        self._blocks = None
+        self._lock = threading.Lock()
+
+    def get(self, cid: CID) -> bytes | None:
+        """Get a block from the cache.
+
+        Returns `None` if the block isn't in the cache.
+        """
+        path = self._path(cid)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+                if self._blocks is not None and path in self._blocks:  # Evicted by another process
+                    self._size -= self._blocks.pop(path)
+            return None
+
+        try:
+            os.utime(path)  # Most recently used
+        except FileNotFoundError:  # Evicted by another process in the meantime
+            pass
+
+        with self._lock:
+            self.hits += 1
+            if self._blocks is not None:
+                self._track(path, len(data))
+        return data
+
+    def put(self, cid: CID, data: bytes):
+        """Put a block in the cache, evicting least recently used blocks if the cache is full."""
+        path = self._path(cid)
+        if path.exists():
+            return
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.parent / f".{uuid.uuid4().hex}.tmp"
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+        with self._lock:
+            if self._blocks is None:
+                self._blocks = collections.OrderedDict(
+                    (entry, size) for entry, size, _ in sorted(self._entries(), key=lambda entry: entry[2])
+                )
+                self._size = sum(self._blocks.values())
+            self._track(path, len(data))
+
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _track(self, path: pathlib.Path, size: int):
+        """Mark a block as the most recently used. Must be called with the lock held."""
+        if path in self._blocks:
+            self._blocks.move_to_end(path)
+        else:
+            self._blocks[path] = size
+            self._size += size
+
+    def _evict(self):
+        """Remove least recently used blocks until the cache fits in `max_bytes`. Must be called with the lock held."""
+        while self._size > self.max_bytes and self._blocks:
+            path, size = self._blocks.popitem(last=False)
+            try:
+                path.unlink()
+            except FileNotFoundError:  # Evicted by another process
+                pass
+
+            self._size -= size
+
+    def _entries(self):
+        """Generate `(path, size, mtime)` for every block in the cache."""
+        if not self.path.exists():
+            return
+
+        for folder in self.path.iterdir():
+            if not folder.is_dir():
+                continue
+
+            for path in folder.iterdir():
+                if path.name.startswith("."):
+                    continue
+
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:  # Evicted by another process
+                    continue
+
+                yield path, stat.st_size, stat.st_mtime_ns
+
+    def _path(self, cid: CID) -> pathlib.Path:
+        """Location of a block in the cache.
+
+        Blocks are spread over subfolders to keep any one folder from getting too large.
+        """
+        name = str(cid)
+        return self.path / name[-2:] / name
+
+
+class NodeCache:
+    """An in memory cache of HAMT nodes, keyed by CID, for use within a single process.
+
+    Looking up a key in a HAMT loads every node on the path from the root to the key. Keys in the same dataset share
+    most of their paths, and, because nodes are immutable and addressed by content, successive versions of a dataset
+    share every node that wasn't changed. One cache can be shared by any number of HAMTs, on the same or different
+    roots, so these nodes are only loaded once. When the total size of the cache exceeds `max_bytes`, the least
+    recently used nodes are evicted.
+
+    Only blocks with one of the given codecs are cached, so that data chunks don't crowd out HAMT nodes.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Total size, in bytes, that the cache is allowed to grow to. Default is 64 MiB.
+    codecs : Sequence[str]
+        Multicodecs of the blocks to cache. Default is `("dag-cbor",)`, which is HAMT nodes.
+    """
+
+    def __init__(self, max_bytes: int = 1 << 26, codecs: typing.Sequence[str] = ("dag-cbor",)):
+        self.max_bytes = max_bytes
+        self.codecs = set(codecs)
+        self.hits = 0
+        self.misses = 0
+        self._size = 0
+        self._blocks = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, cid: CID) -> bytes | None:
+        """Get a node from the cache.
+
+        Returns `None` if the node isn't in the cache.
+        """
+        with self._lock:
+            data = self._blocks.get(cid)
+            if data is None:
+                self.misses += 1
+                return None
+
+            self._blocks.move_to_end(cid)
+            self.hits += 1
+            return data
+
+    def put(self, cid: CID, data: bytes):
+        """Put a node in the cache, evicting least recently used nodes if the cache is full.
+
+        Blocks which aren't of one of the cached codecs are ignored.
+        """
+        if cid.codec.name not in self.codecs or len(data) > self.max_bytes:
+            return
+
+        with self._lock:
+            if cid in self._blocks:
+                return
+
+            self._blocks[cid] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._blocks.popitem(last=False)
+                self._size -= len(evicted)
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import os
+import pathlib
+import threading
+
+import dag_cbor
+
+from multiformats import CID, varint
+
+from dc_etl.ipld.stores import block_cid
+
+# Used as the root in the header of a CAR file before a real root has been written. It has the same encoded length as
+# any other CIDv1 with a 32 byte digest, so the header can later be rewritten in place.
+_NO_ROOT = block_cid(dag_cbor.encode(None), "dag-cbor")
+
+
+class CARStore:
+    """A py-hamt store that keeps blocks in a local CARv1 file rather than in IPFS.
+
+    This allows a dataset to be written on a machine with no IPFS daemon. The finished CAR file can then be imported
+    into IPFS in one go, eg with `ipfs dag import`. An existing CAR file can be opened to read from or append to it, so
+    `initial`, `append`, and `replace` all work with a CAR file as they do with IPFS.
+
+    New blocks are appended to the end of the file as they are saved. The root in the CAR file's header is updated when
+    the store is flushed.
+
+    Parameters
+    ----------
+    path : str | pathlib.Path
+        Path to the CAR file in the local filesystem. It will be created if it doesn't exist.
+    hasher : str
+        The multihash function used to address blocks. Default is "blake3", the same as `IPFSStore`.
+    """
+
+    def __init__(self, path: str | pathlib.Path, hasher: str = "blake3"):
+        self.path = pathlib.Path(path)
+        self.hasher = hasher
+        self._lock = threading.Lock()
+        self._index = {}
+
+        if not self.path.exists():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "wb") as f:
+                f.write(_header(_NO_ROOT))
+
+        self._file = open(self.path, "r+b")
+        self._header_length, self._root = self._read_header()
+        self._index_blocks()
+
+    @property
+    def root(self) -> CID | None:
+        """The root CID recorded in the CAR file's header, or `None` if a root hasn't been written yet."""
+        return None if self._root == _NO_ROOT else self._root
+
+    def save_raw(self, data: bytes) -> CID:
+        return self._save(data, "raw")
+
+    def save_dag_cbor(self, data: bytes) -> CID:
+        return self._save(data, "dag-cbor")
+
+    def load(self, id: CID) -> bytes:
+        with self._lock:
+            offset, length = self._index[id]
+            self._file.seek(offset)
+            return self._file.read(length)
+
+    def flush(self, root: CID | None = None):
+        """Make sure all blocks are written to disk and, if passed, write `root` to the header of the CAR file."""
+        with self._lock:
+            if root is not None and root != self._root:
+                self._write_root(root)
+
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        """Close the underlying file."""
+        self._file.close()
+
+    def _save(self, data, codec):
+        cid = block_cid(data, codec, self.hasher)
+        with self._lock:
+            if cid not in self._index:
+                cid_bytes = bytes(cid)
+                self._file.seek(0, os.SEEK_END)
+                self._file.write(varint.encode(len(cid_bytes) + len(data)))
+                self._file.write(cid_bytes)
+                offset = self._file.tell()
+                self._file.write(data)
+                self._index[cid] = (offset, len(data))
+
+        return cid
+
+    def _read_header(self):
+        self._file.seek(0)
+        length, prefix, _ = varint.decode_raw(self._file)
+        header = dag_cbor.decode(self._file.read(length))
+        if header.get("version") != 1:
+            raise ValueError(f"Unsupported CAR version in {self.path}: {header.get('version')}")
+
+        return prefix + length, header["roots"][0]
+
+    def _index_blocks(self):
+        size = self._file.seek(0, os.SEEK_END)
+        offset = self._header_length
+        self._file.seek(offset)
+        while offset < size:
+            length, prefix, _ = varint.decode_raw(self._file)
+            section = self._file.read(length)
+            cid_length = _cid_length(section)
+            self._index[CID.decode(section[:cid_length])] = (offset + prefix + cid_length, length - cid_length)
+            offset += prefix + length
+
+    def _write_root(self, root):
+        header = _header(root)
+        if len(header) == self._header_length:
+            self._file.seek(0)
+            self._file.write(header)
+
+        else:
+            # The header has changed size, so the whole file has to be rewritten
+            self._file.seek(self._header_length)
+            body = self._file.read()
+            self._file.seek(0)
+            self._file.write(header)
+            self._file.write(body)
+            self._file.truncate()
+            self._index = {
+                cid: (offset - self._header_length + len(header), length)
+                for cid, (offset, length) in self._index.items()
+            }
+            self._header_length = len(header)
+
+        self._root = root
+
+
+def _header(root: CID) -> bytes:
+    """Encode a CARv1 header, with its length prefix."""
+    header = dag_cbor.encode({"roots": [root], "version": 1})
+    return varint.encode(len(header)) + header
+
+
+def _cid_length(data: bytes) -> int:
+    """Get the length of the binary CID at the start of `data`."""
+    if data[0] == 0x12 and data[1] == 0x20:  # CIDv0, a bare sha2-256 multihash
+        return 34
+
+    length = 0
+    for _ in range(3):  # version, codec, multihash function
+        _, prefix, _ = varint.decode_raw(data[length:])
+        length += prefix
+
+    digest_size, prefix, _ = varint.decode_raw(data[length:])
+    return length + prefix + digest_size
@@ -1,73 +1,528 @@
 from __future__ import annotations
 
 import abc
+import contextlib
+import os
+import typing
 
+import dask
+import numpy
 import xarray
+import zarr
 from py_hamt import HAMT, IPFSStore
 
 from multiformats import CID
 
+from dc_etl import chunk_index, multiscale, stats
 from dc_etl.fetch import Timespan
-from dc_etl.load import Loader
+from dc_etl.ipld.cache import BlockCache, NodeCache
+from dc_etl.ipld.stores import (
+    BorrowedStore,
+    BulkStore,
+    CachingStore,
+    CopyingStore,
+    LinkingStore,
+    PipelinedStore,
+    closing,
+    flush,
+    prefetch,
+)
+from dc_etl.load import (
+    Loader,
+    align_chunks,
+    dataset_manifest,
+    encoding_chunks,
+    partition_bounds,
+    replace_regions,
+    zarr_chunks,
+)
+from dc_etl.mappers import ChunkCounts, DiffMapper, LockedMapper, ShardedMapper
+
+_SCHEDULERS = ("threads", "synchronous")
 
 
 class IPLDLoader(Loader):
-    """Use IPLD to store datasets."""
+    """Use IPLD to store datasets.
+
+    If a dataset has `multiscales` metadata, added by :func:`dc_etl.transformers.multiscales`, coarser overviews of it
+    are written to the same HAMT, and the spans of them covered by appended or replaced data are updated along with
+    the dataset. See :mod:`dc_etl.multiscale`.
+
+    Parameters
+    ----------
+    time_dim : str
+        Name of the time dimension.
+    publisher : IPLDPublisher
+        Publisher used to record and recall the CID of the dataset.
+    method : str | None
+        How to resolve the ends of a timespan to positions in the existing dataset when replacing data. `"nearest"`
+        (the default) uses the nearest timestamps. `None` requires them to match timestamps in the dataset exactly.
+    diff : bool
+        When replacing data, compare each encoded chunk with the chunk already stored and only write chunks that have
+        changed. Chunks are compared by CID, without loading the blocks already stored, unless they are in shards.
+        Default is `False`.
+    cache : BlockCache | None
+        Optional local cache for IPFS blocks. In configuration, this is a mapping of the arguments to
+        :class:`BlockCache`.
+    concurrency : int | None
+        If set, blocks are written with up to this many writes in flight at once, rather than one at a time. The HAMT
+        root is only published once every write has been acknowledged.
+    bulk : bool
+        If `True`, initial loads buffer HAMT nodes in memory and write only the nodes of the finished HAMT, each
+        exactly once, rather than rewriting nodes as each key is inserted. Default is `False`.
+    store : optional
+        The py-hamt store that blocks are saved to and loaded from. Default is a new `IPFSStore`. In configuration,
+        this is an `ipld_store` component, eg `{"name": "car", "path": "dataset.car"}` to write to a local CAR file.
+        A store passed in is left open after writing, for the caller to close.
+    scheduler : str | None
+        The dask scheduler used to read, encode, and write chunks, either `"threads"` or `"synchronous"`. If set, the
+        dataset is chunked with dask to match the Zarr chunks it is written to, so that each chunk is compressed
+        independently. Default is `None`, which uses dask's own default if the dataset is already chunked with dask.
+        Process based schedulers are not supported, since the HAMT is updated in this process.
+    num_workers : int | None
+        Number of chunks to encode at the same time. Default is the number of CPUs.
+    memory_limit : int | None
+        Roughly the most memory, in bytes, to use for chunks being encoded at one time. Reduces the number of workers
+        if necessary. Default is no limit.
+    shards : dict[str, int] | None
+        Number of Zarr chunks to store together, as a single block and HAMT entry, along each named dimension of newly
+        created arrays, eg `{"time": 16}`. Default is `None`, one chunk per block. Datasets written with shards can be
+        read back whatever this is set to, but only through :meth:`dataset` or a :class:`ShardedMapper`, since the
+        shards aren't part of the Zarr v2 format.
+    node_cache : NodeCache | None
+        Optional in memory cache of HAMT nodes, shared by every HAMT this loader opens. In configuration, this is a
+        mapping of the arguments to :class:`NodeCache`.
+    prefetch : int
+        Number of levels at the top of the HAMT to load, concurrently, when opening the dataset with :meth:`dataset`.
+        Only useful with a `node_cache`. Default is 0.
+    statistics : bool
+        If `True`, the count, NaN count, minimum, maximum, and mean of each numeric data variable are computed from the
+        data as it is written, see :mod:`dc_etl.stats`, and published in the manifest as `statistics`. Statistics of
+        appended data are merged with the totals so far. When data is replaced, the data it replaces is read again,
+        so that its statistics can be taken out of the totals. If that data had a variable's smallest or largest
+        value, the new one is found from the chunk index, if there is one, and is otherwise recorded as unknown.
+        Default is `False`.
+    chunk_index : bool
+        If `True`, the minimum, maximum, and fill fraction of every Zarr chunk of each numeric data variable are
+        recorded in an index stored with the dataset, see :mod:`dc_etl.chunk_index`, so that readers can skip chunks
+        which can't match a query. Only the entries for chunks written are updated. The dataset is chunked with dask to
+        match the Zarr chunks, so variables need explicit chunks in their encoding. Not written by
+        :meth:`initial_partition`. Default is `False`.
+    """
 
     @classmethod
     def _from_config(cls, config):
         config["publisher"] = config["publisher"].as_component("ipld_publisher")
+        if "cache" in config:
+            config["cache"] = BlockCache(**config["cache"])
+        if "node_cache" in config:
+            config["node_cache"] = NodeCache(**config["node_cache"])
+        if "store" in config:
+            config["store"] = config["store"].as_component("ipld_store")
         return cls(**config)
 
-    def __init__(self, time_dim: str, publisher: IPLDPublisher):
+    def __init__(
+        self,
+        time_dim: str,
+        publisher: IPLDPublisher,
+        method: str | None = "nearest",
+        diff: bool = False,
+        cache: BlockCache | None = None,
+        concurrency: int | None = None,
+        bulk: bool = False,
+        store=None,
+        scheduler: str | None = None,
+        num_workers: int | None = None,
+        memory_limit: int | None = None,
+        shards: dict[str, int] | None = None,
+        node_cache: NodeCache | None = None,
+        prefetch: int = 0,
+        statistics: bool = False,
+        chunk_index: bool = False,
+    ):
+        if scheduler is not None and scheduler not in _SCHEDULERS:
+            raise ValueError(f"Unsupported scheduler: {scheduler}. Must be one of: {', '.join(_SCHEDULERS)}")
+
         self.time_dim = time_dim
         self.publisher = publisher
+        self.method = method
+        self.diff = diff
+        self.cache = cache
+        self.concurrency = concurrency
+        self.bulk = bulk
+        self.store = store
+        self.scheduler = scheduler
+        self.num_workers = num_workers
+        self.memory_limit = memory_limit
+        self.shards = shards
+        self.node_cache = node_cache
+        self.prefetch = prefetch
+        self.statistics = statistics
+        self.chunk_index = chunk_index
 
     def initial(self, dataset: xarray.Dataset, span: Timespan | None = None, **kwargs):
         """Start writing a new dataset."""
-        mapper = self._mapper()
-        dataset = dataset.sel(**{self.time_dim: slice(*span)})
-        dataset.to_zarr(store=mapper, consolidated=True)
-        cid = mapper.root_node_id
-        self.publisher.publish(cid)
+        mapper, store = self._new_mapper()
+        with closing(store):
+            sharded = ShardedMapper(mapper, self.shards)
+            dataset = self._chunk(dataset.sel(**{self.time_dim: slice(*span)}), encoding_chunks(dataset))
+            with self._compute(dataset):
+                written, blocks = self._to_zarr(dataset, store=LockedMapper(sharded), consolidated=True)
+                if blocks is not None:
+                    chunk_index.update(sharded, blocks)
+                if multiscale.ATTR in dataset.attrs:
+                    multiscale.update(LockedMapper(sharded), self.time_dim)
+            sharded.flush()
+            self._publish(mapper, store, sharded, kwargs.get("state"), stats.totals(written))
+
+    def initial_partition(
+        self,
+        dataset: xarray.Dataset,
+        span: Timespan | None = None,
+        partition: int = 0,
+        partitions: int = 1,
+        dim: str | None = None,
+        **kwargs,
+    ) -> CID:
+        """Write one partition of a new dataset to a HAMT of its own, without publishing it.
+
+        Lets an initial load be spread over several workers, possibly on different machines, which each call this with
+        the same dataset and a different `partition`. A coordinator then combines the partitions with
+        :meth:`merge_partitions`. Every partition writes the dataset's metadata and coordinates, but only its own
+        share of the data.
+
+        Parameters
+        ----------
+        dataset : xarray.Dataset
+            The whole dataset. Only this partition's data is read from it.
+        span : Timespan | None
+            The timespan to write.
+        partition : int
+            Which partition to write, from 0 to `partitions - 1`.
+        partitions : int
+            Total number of partitions.
+        dim : str | None
+            Dimension to partition the data along, eg `"latitude"`. Partitions cover whole chunks (and shards, if used)
+            along this dimension. Variables without this dimension are written by partition 0. If `None`, the data is
+            partitioned by variable instead.
+
+        Returns
+        -------
+        CID :
+            The root of the partition's HAMT.
+        """
+        mapper, store = self._new_mapper()
+        with closing(store):
+            sharded = ShardedMapper(mapper, self.shards)
+            dataset = dataset.sel(**{self.time_dim: slice(*span)})
+            chunks = encoding_chunks(dataset)
+            whole, partial, bounds = self._partition(dataset, chunks, partition, partitions, dim)
+
+            # Data variables are made lazy so that only the metadata and coordinates are written here
+            template = dataset.copy()
+            for name, variable in dataset.data_vars.items():
+                if variable.ndim and not variable.chunks:
+                    template[name] = variable.chunk()
+            for name, variable in dataset.coords.items():
+                if variable.chunks:
+                    template[name] = variable.compute()
+            template.to_zarr(store=LockedMapper(sharded), compute=False)
+
+            writes = []
+            if whole:
+                part = dataset[whole].drop_vars(list(dataset[whole].coords))
+                writes.append((part, {name: slice(None) for name in part.dims}, {}))
+            if partial and bounds[1] > bounds[0]:
+                part = dataset[partial].drop_vars(list(dataset[partial].coords)).isel(**{dim: slice(*bounds)})
+                writes.append((part, {dim: slice(*bounds)}, {dim: bounds[0]}))
+
+            for part, region, offsets in writes:
+                part = self._chunk(part, chunks, offsets)
+                with self._compute(part):
+                    part.to_zarr(store=LockedMapper(sharded), region=region)
+
+            sharded.flush()
+            cid = mapper.root_node_id
+            flush(store, cid)
+            return cid
+
+    def merge_partitions(self, roots: typing.Sequence[CID]):
+        """Merge partitions written by :meth:`initial_partition` into one dataset, and publish it.
+
+        The keys of each partition's HAMT are added to a new HAMT, with consolidated metadata for the whole dataset.
+        Values are added by linking to the blocks the partitions already stored, so no data is loaded or saved again.
+
+        Parameters
+        ----------
+        roots : Sequence[CID]
+            The roots of the HAMTs of every partition.
+        """
+        mapper, store = self._new_mapper(copying=True)
+        with closing(store):
+            merged = set()
+            for root in roots:
+                partition = self._mapper(root, LinkingStore(store))
+                for key in partition:
+                    # Metadata and coordinates are the same in every partition, so are only linked to once
+                    if key not in merged and key.rpartition("/")[2] != ".zmetadata":
+                        mapper[key] = partition[key]
+                        merged.add(key)
+
+            sharded = ShardedMapper(mapper)
+            zarr.consolidate_metadata(sharded)
+            self._publish(mapper, store, sharded)
 
     def append(self, dataset: xarray.Dataset, span: Timespan | None = None, **kwargs):
         """Append data to an existing dataset."""
-        mapper = self._mapper(self.publisher.retrieve())
-        dataset = dataset.sel(**{self.time_dim: slice(*span)})
-        dataset.to_zarr(store=mapper, consolidated=True, append_dim=self.time_dim)
-        cid = mapper.root_node_id
-        self.publisher.publish(cid)
+        store = self._store(write=True)
+        with closing(store):
+            mapper = self._mapper(self.publisher.retrieve(), store)
+            sharded = ShardedMapper(mapper, self.shards)
+            dataset = dataset.sel(**{self.time_dim: slice(*span)})
+            overviews = multiscale.ATTR in dataset.attrs
+            if overviews or self._chunked(dataset):
+                metadata = zarr.open_consolidated(sharded, mode="r")
+                offset = metadata[self.time_dim].shape[0]
+                dataset = self._chunk(dataset, zarr_chunks(metadata), {self.time_dim: offset})
+
+            with self._compute(dataset):
+                written, blocks = self._to_zarr(
+                    dataset, store=LockedMapper(sharded), consolidated=True, append_dim=self.time_dim
+                )
+                if blocks is not None:
+                    chunk_index.update(sharded, blocks, {self.time_dim: offset}, append=True)
+                if overviews:
+                    multiscale.update(LockedMapper(sharded), self.time_dim, offset, append=True)
+            sharded.flush()
+            statistics = stats.totals(written, self.manifest() if written is not None else None, append=True)
+            self._publish(mapper, store, sharded, kwargs.get("state"), statistics)
+
+    def replace(self, replace_dataset: xarray.Dataset, span: Timespan | None = None, **kwargs) -> ChunkCounts | None:
+        """Replace a contiguous span of data in an existing dataset.
+
+        Returns
+        -------
+        ChunkCounts | None :
+            If `diff` is enabled, the number of chunks that were rewritten and left unchanged.
+        """
+        return self.replace_many(replace_dataset, [span], **kwargs)
+
+    def replace_many(
+        self, replace_dataset: xarray.Dataset, spans: typing.Sequence[Timespan], **kwargs
+    ) -> ChunkCounts | None:
+        """Replace several spans of data in an existing dataset.
+
+        Spans which overlap or are contiguous are merged, so that data covered by more than one is only written once.
+        All regions are written to the same HAMT and the result is published once.
+
+        Returns
+        -------
+        ChunkCounts | None :
+            If `diff` is enabled, the number of chunks that were rewritten and left unchanged.
+        """
+        store = self._store(write=True)
+        with closing(store):
+            root = self.publisher.retrieve()
+            hamt = self._mapper(root, store)
+            sharded = ShardedMapper(hamt, self.shards)
+            diff = DiffMapper(sharded, self._mapper(root, LinkingStore(store))) if self.diff else None
+            mapper = LockedMapper(diff or sharded)
+            metadata = zarr.open_consolidated(mapper, mode="r")
+
+            # The statistics of the data replaced are taken out of the totals, so it's read from the dataset as it was
+            manifest = self.manifest() if self.statistics else None
+            before = None
+            if manifest is not None and "statistics" in manifest:
+                before = xarray.open_zarr(ShardedMapper(self._mapper(root, store)), consolidated=True)
+
+            written = {} if self.statistics else None
+            replaced = {}
+            for start, stop, region in replace_regions(metadata, replace_dataset, spans, self.time_dim, self.method):
+                region = self._chunk(region, zarr_chunks(metadata), {self.time_dim: start})
+                with self._compute(region):
+                    if before is not None:
+                        old = before[list(region.data_vars)].isel(**{self.time_dim: slice(start, stop)})
+                        replaced = stats.combine(replaced, stats.of(old))
+
+                    # Dask chunks line up with Zarr chunks even where a region covers part of one. xarray can't check
+                    # that.
+                    statistics, blocks = self._to_zarr(
+                        region,
+                        store=mapper,
+                        consolidated=True,
+                        region={self.time_dim: slice(start, stop)},
+                        safe_chunks=False,
+                    )
+                    if statistics is not None:
+                        written = stats.combine(written, statistics)
+                    if blocks is not None:
+                        chunk_index.update(mapper, blocks, {self.time_dim: start})
+                    multiscale.update(mapper, self.time_dim, start, stop)
+
+            bounds = {}
+            if self.chunk_index and before is not None:
+                bounds = {name: chunk_index.bounds(mapper, name) for name in written}
+            statistics = stats.totals(written, manifest, replaced=replaced, bounds=bounds)
+            sharded.flush()
+            self._publish(hamt, store, sharded, kwargs.get("state"), statistics)
+
+            if self.diff:
+                return diff.counts
+
+    def manifest(self) -> dict | None:
+        """Implementation of :meth:`Loader.manifest`"""
+        return self.publisher.retrieve_manifest()
+
+    def candidate_chunks(
+        self, name: str, minimum: float | None = None, maximum: float | None = None
+    ) -> list[dict[str, slice]]:
+        """Find the chunks of a variable in the published dataset which may have values in a range.
+
+        The dataset must have been loaded with `chunk_index` enabled. See :func:`dc_etl.chunk_index.candidate_chunks`.
+        """
+        mapper = self._mapper(self.publisher.retrieve(), self._store())
+        return chunk_index.candidate_chunks(ShardedMapper(mapper), name, minimum, maximum)
 
-    def replace(self, replace_dataset: xarray.Dataset, span: Timespan | None = None, **kwargs):
-        """Replace a contiguous span of data in an existing dataset."""
-        mapper = self._mapper(self.publisher.retrieve())
-        original_dataset = self.dataset()
-        region = (
-            self._time_to_integer(original_dataset, span.start),
-            self._time_to_integer(original_dataset, span.end) + 1,
+    def overview(self, factor: int) -> xarray.Dataset:
+        """Convenience method to get one of the overviews of the currently published dataset.
+
+        See :func:`dc_etl.multiscale.open_overview`.
+        """
+        mapper = self._mapper(self.publisher.retrieve(), self._store())
+        return multiscale.open_overview(ShardedMapper(mapper), factor)
+
+    def dataset(self) -> xarray.Dataset | None:
+        """Implementation of :meth:`Loader.dataset`"""
+        root = self.publisher.retrieve()
+        if root is None:
+            return None
+
+        store = self._store()
+        if self.prefetch:
+            prefetch(store, root, self.prefetch)
+
+        mapper = self._mapper(root, store)
+        return xarray.open_zarr(store=ShardedMapper(mapper), consolidated=True)
+
+    def _mapper(self, root=None, store=None):
+        mapper = HAMT(store=store or self._store(), root_node_id=root)
+        return mapper
+
+    def _store(self, write=False):
+        if self.store is None:
+            store = IPFSStore()
+        elif write:
+            # Stores passed in are used for later writes and reads too, so closing after a write mustn't close them
+            store = BorrowedStore(self.store)
+        else:
+            store = self.store
+
+        if self.cache is not None:
+            store = CachingStore(store, self.cache)
+
+        if self.node_cache is not None:
+            store = CachingStore(store, self.node_cache)
+
+        if write and self.concurrency:
+            store = PipelinedStore(store, self.concurrency)
+
+        return store
+
+    def _new_mapper(self, copying=False):
+        """Make an empty HAMT to write a new dataset to. Returns the HAMT and the store it writes to."""
+        store = self._store(write=True)
+        if self.bulk:
+            store = bulk = BulkStore(store)
+        if copying:
+            store = CopyingStore(store)
+
+        mapper = self._mapper(store=store)
+        if self.bulk:
+            bulk.root = lambda: mapper.root_node_id
+
+        return mapper, store
+
+    def _partition(self, dataset, chunks, partition, partitions, dim):
+        """Work out which variables a partition writes. Returns the variables written whole, the variables written in
+        part, and the bounds of the part along `dim`."""
+        names = sorted(name for name, variable in dataset.data_vars.items() if variable.ndim)
+        if dim is None:
+            return names[partition::partitions], [], None
+
+        partial = [name for name in names if dim in dataset[name].dims]
+        whole = [name for name in names if name not in partial] if partition == 0 else []
+        sizes = {shape[dataset[name].dims.index(dim)] for name, shape in chunks.items() if name in partial}
+        if len(sizes) != 1:
+            raise ValueError(f"Variables must all have the same, explicit, chunk size along {dim} to be partitioned")
+
+        chunk = sizes.pop() * (self.shards or {}).get(dim, 1)
+        bounds = partition_bounds(dataset.sizes[dim], chunk, partitions)[partition]
+        return whole, partial, bounds
+
+    def _chunked(self, dataset):
+        """Whether a dataset will be written using dask."""
+        return (
+            self.scheduler is not None
+            or self.chunk_index
+            or any(variable.chunks for variable in dataset.variables.values())
         )
 
-        replace_dataset = replace_dataset.sel(**{self.time_dim: slice(*span)})
-        replace_dataset = replace_dataset.drop_vars([dim for dim in replace_dataset.dims if dim != self.time_dim])
-        replace_dataset.to_zarr(store=mapper, consolidated=True, region={self.time_dim: slice(*region)})
+    def _chunk(self, dataset, chunks, offsets=None):
+        """Line dask chunks up with the Zarr chunks being written to, so chunks can be written in parallel."""
+        if not self._chunked(dataset):
+            return dataset
+
+        return align_chunks(dataset, chunks, offsets)
+
+    def _to_zarr(self, dataset, **kwargs):
+        """Write a dataset, computing its statistics in the same pass if configured to. Returns the statistics and the
+        statistics of each chunk written, for the chunk index, or `None` for either if not configured."""
+        if not (self.statistics or self.chunk_index):
+            dataset.to_zarr(**kwargs)
+            return None, None
+
+        blocks = {} if self.chunk_index else None
+        statistics = stats.to_zarr(dataset, blocks=blocks, **kwargs)
+        return statistics if self.statistics else None, blocks
+
+    @contextlib.contextmanager
+    def _compute(self, dataset):
+        """Configure dask to write a dataset using the configured scheduler and limits."""
+        if self.scheduler is None:
+            yield
+            return
 
+        num_workers = self.num_workers or os.cpu_count()
+        if self.memory_limit:
+            # Each worker holds a chunk as it was read and as it is being encoded
+            largest = max((_chunk_bytes(variable) for variable in dataset.variables.values()), default=1)
+            num_workers = max(1, min(num_workers, self.memory_limit // (2 * largest)))
+
+        with dask.config.set(scheduler=self.scheduler, num_workers=num_workers):
+            yield
+
+    def _publish(self, mapper, store, zarr_store, state=None, statistics=None):
+        # Make sure every block is stored before the new root is made public
         cid = mapper.root_node_id
+        flush(store, cid)
+
+        if _keeps_manifests(self.publisher):
+            manifest = dataset_manifest(zarr_store, self.time_dim)
+            if state is not None:
+                manifest["source"] = state
+            if statistics is not None:
+                manifest["statistics"] = statistics
+            self.publisher.publish_manifest(cid, manifest)
+
         self.publisher.publish(cid)
 
-    def dataset(self) -> xarray.Dataset:
-        """Convenience method to get the currently published dataset."""
-        mapper = self._mapper(root=self.publisher.retrieve())
-        return xarray.open_zarr(store=mapper, consolidated=True)
 
-    def _mapper(self, root=None):
-        mapper = HAMT(store=IPFSStore(), root_node_id=root)
-        return mapper
+def _chunk_bytes(variable: xarray.Variable) -> int:
+    """Size in bytes of the largest dask chunk of a variable."""
+    if not variable.chunks:
+        return 0
 
-    def _time_to_integer(self, dataset, timestamp):
-        # It seems like an oversight in xarray that this is the best way to do this.
-        nearest = dataset.sel(**{self.time_dim: timestamp, "method": "nearest"})[self.time_dim]
-        return list(dataset[self.time_dim].values).index(nearest)
+    return int(numpy.prod([max(sizes) for sizes in variable.chunks])) * variable.dtype.itemsize
 
 
 class IPLDPublisher(abc.ABC):
@@ -79,5 +534,31 @@ class IPLDPublisher(abc.ABC):
     def publish(self, cid: CID):
         """Put the CID of a dataset in a place where it can be recalled later."""
 
+    def publish_manifest(self, cid: CID, manifest: dict):
+        """Store a small summary of a dataset, to be recalled along with its CID.
+
+        Called just before :meth:`publish` with the same CID. Publishers which store manifests override this, and
+        :meth:`retrieve_manifest`. For any other publisher, the loader doesn't make a manifest at all.
+
+        Parameters
+        ----------
+        cid : CID
+            The CID of the dataset.
+        manifest : dict
+            A small, JSON serializable summary of the dataset, as made by :func:`dc_etl.load.dataset_manifest`.
+        """
+
     def retrieve(self) -> CID:
         """Retreive the CID of the published dataset."""
+
+    def retrieve_manifest(self) -> dict | None:
+        """Retrieve the manifest published with the current CID, without reading the dataset itself.
+
+        Returns `None` if there is no manifest for the current CID, or the publisher doesn't store manifests.
+        """
+
+
+def _keeps_manifests(publisher) -> bool:
+    """Whether a publisher stores manifests, ie implements :meth:`IPLDPublisher.publish_manifest`."""
+    method = getattr(type(publisher), "publish_manifest", None)
+    return method is not None and method is not IPLDPublisher.publish_manifest
@@ -1,3 +1,5 @@
+import json
+
 from multiformats import CID
 
 from dc_etl.filespec import FileSpec
@@ -5,17 +7,42 @@ from dc_etl.ipld.loader import IPLDPublisher
 
 
 class LocalFileIPLDPublisher(IPLDPublisher):
-    """Publishes CID of dataset to a local file."""
+    """Publishes CID of dataset to a local file.
+
+    The manifest, if any, is written alongside it, to a file with the same name and the suffix `.manifest.json`.
+    """
 
     def __init__(self, path: FileSpec):
         self.path = path
 
+    @property
+    def manifest_path(self) -> FileSpec:
+        """Location of the manifest."""
+        return self.path.with_suffix("manifest.json")
+
     def publish(self, cid: CID):
         """Implementation of :meth:`IPLDPublisher.publish"""
         with self.path.open("w") as f:
             print(cid, file=f)
 
+    def publish_manifest(self, cid: CID, manifest: dict):
+        """Implementation of :meth:`IPLDPublisher.publish_manifest"""
+        # Written before the CID, so it is never older than the CID. A newer manifest is ignored by retrieve_manifest.
+        with self.manifest_path.open("w") as f:
+            json.dump({"cid": str(cid), **manifest}, f)
+
     def retrieve(self) -> CID:
         """Implementation of :meth:`IPLDPublisher.retrieve"""
         if self.path.exists():
             return CID.decode(self.path.open("r").read().strip())
+
+    def retrieve_manifest(self) -> dict | None:
+        """Implementation of :meth:`IPLDPublisher.retrieve_manifest"""
+        if not self.manifest_path.exists():
+            return None
+
+        manifest = json.load(self.manifest_path.open("r"))
+        if CID.decode(manifest.pop("cid")) != self.retrieve():
+            return None
+
+        return manifest
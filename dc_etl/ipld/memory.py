@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+from multiformats import CID
+
+from dc_etl.ipld.loader import IPLDLoader, IPLDPublisher
+from dc_etl.ipld.stores import block_cid
+
+
+class MemoryStore:
+    """A py-hamt store that keeps blocks in memory, addressed by content the same way as `IPFSStore`.
+
+    Lets HAMTs be written and read, and loaders be tested and profiled, without an IPFS node or network.
+
+    Parameters
+    ----------
+    hasher : str
+        The multihash function used to address blocks. Default is "blake3", the same as `IPFSStore`.
+    """
+
+    def __init__(self, hasher: str = "blake3"):
+        self.hasher = hasher
+        self.blocks = {}
+
+    def save_raw(self, data: bytes) -> CID:
+        return self._save(data, "raw")
+
+    def save_dag_cbor(self, data: bytes) -> CID:
+        return self._save(data, "dag-cbor")
+
+    def load(self, id: CID) -> bytes:
+        return self.blocks[id]
+
+    def _save(self, data, codec):
+        cid = block_cid(data, codec, self.hasher)
+        self.blocks[cid] = bytes(data)
+        return cid
+
+
+class MemoryIPLDPublisher(IPLDPublisher):
+    """Publishes the CID, and manifest, of a dataset to memory."""
+
+    def __init__(self):
+        self.cid = None
+        self.manifest = None
+        self._manifest_cid = None
+
+    def publish(self, cid: CID):
+        """Implementation of :meth:`IPLDPublisher.publish"""
+        self.cid = cid
+
+    def publish_manifest(self, cid: CID, manifest: dict):
+        """Implementation of :meth:`IPLDPublisher.publish_manifest"""
+        self.manifest = manifest
+        self._manifest_cid = cid
+
+    def retrieve(self) -> CID:
+        """Implementation of :meth:`IPLDPublisher.retrieve"""
+        return self.cid
+
+    def retrieve_manifest(self) -> dict | None:
+        """Implementation of :meth:`IPLDPublisher.retrieve_manifest"""
+        return self.manifest if self._manifest_cid == self.cid else None
+
+
+class MemoryIPLDLoader(IPLDLoader):
+    """An :class:`IPLDLoader` which keeps everything in memory, for testing and profiling.
+
+    Blocks are kept in a :class:`MemoryStore` and the CID is published with a :class:`MemoryIPLDPublisher`, unless
+    another store or publisher is passed. Any other arguments are the same as for :class:`IPLDLoader`.
+    """
+
+    @classmethod
+    def _from_config(cls, config):
+        # Unlike for IPLDLoader, the publisher is optional
+        if "publisher" not in config:
+            config["publisher"] = {"name": "memory"}
+        return super()._from_config(config)
+
+    def __init__(self, time_dim: str, publisher: IPLDPublisher | None = None, store=None, **kwargs):
+        super().__init__(
+            time_dim,
+            publisher if publisher is not None else MemoryIPLDPublisher(),
+            store=store if store is not None else MemoryStore(),
+            **kwargs,
+        )
@@ -0,0 +1,502 @@
+"""Wrappers for the py-hamt stores that HAMTs use to save and load IPLD blocks.
+
+Each wrapper implements the same interface as the store it wraps, so wrappers can be stacked, and any method that a
+wrapper doesn't implement itself is passed through to the wrapped store.
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import contextlib
+import functools
+import threading
+import typing
+
+import dag_cbor
+
+from multiformats import CID, multihash
+
+from dc_etl.errors import BlockStoreError
+from dc_etl.ipld.cache import BlockCache, NodeCache
+
+# The dag-cbor tag for CIDs
+_CID_TAG = b"\xd8\x2a"
+
+
+def block_cid(data: bytes, codec: str, hasher: str = "blake3") -> CID:
+    """Compute the CIDv1 that addresses a single block.
+
+    Parameters
+    ----------
+    data : bytes
+        Contents of the block.
+    codec : str
+        The multicodec of the block, eg "raw" or "dag-cbor".
+    hasher : str
+        The multihash function used to address blocks. Default is "blake3", which is what `IPFSStore` uses.
+
+    Returns
+    -------
+    CID :
+        The CID.
+    """
+    size = 32 if hasher == "blake3" else None
+    return CID("base32", 1, codec, multihash.digest(data, hasher, size=size))
+
+
+def flush(store, root: CID | None = None):
+    """Flush any writes pending in a store, if the store supports it.
+
+    Parameters
+    ----------
+    store :
+        The store to flush.
+    root : CID | None
+        The root of the structure, eg a HAMT, that was written to the store, if any.
+    """
+    method = getattr(store, "flush", None)
+    if method is not None:
+        method(root)
+
+
+def close(store):
+    """Release any resources held by a store, eg threads, if the store supports it.
+
+    Writes which are still pending are finished first, but not flushed, and any errors from them are ignored. Safe to
+    call after :func:`flush`, or instead of it when writing has failed.
+
+    Parameters
+    ----------
+    store :
+        The store to close.
+    """
+    method = getattr(store, "close", None)
+    if method is not None:
+        method()
+
+
+@contextlib.contextmanager
+def closing(store):
+    """Context manager which closes a store with :func:`close` on exit, whether or not writing to it succeeded."""
+    try:
+        yield store
+    finally:
+        close(store)
+
+
+def prefetch(store, root: CID, levels: int, concurrency: int = 8):
+    """Load the nodes in the top levels of a HAMT, so that they are in any caches wrapping `store`.
+
+    Nodes are loaded a level at a time, with the nodes of each level loaded concurrently.
+
+    Parameters
+    ----------
+    store :
+        The store to load nodes from, eg a :class:`CachingStore` with a :class:`NodeCache`.
+    root : CID
+        The root of the HAMT.
+    levels : int
+        Number of levels to load, counting the root as the first.
+    concurrency : int
+        Maximum number of nodes to load at the same time.
+    """
+    level = [root]
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as pool:
+        for _ in range(levels):
+            nodes = pool.map(store.load, level)
+            level = [link for node in nodes for link in _links(dag_cbor.decode(node)) if link.codec.name == "dag-cbor"]
+            if not level:
+                break
+
+
+class _StoreWrapper:
+    """Base class for store wrappers."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def flush(self, root: CID | None = None):
+        flush(self.store, root)
+
+    def close(self):
+        close(self.store)
+
+    def save_raw(self, data: bytes) -> CID:
+        return self.store.save_raw(data)
+
+    def save_dag_cbor(self, data: bytes) -> CID:
+        return self.store.save_dag_cbor(data)
+
+    def load(self, id: CID) -> bytes:
+        return self.store.load(id)
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+
+class CachingStore(_StoreWrapper):
+    """Reads blocks through a :class:`BlockCache` or :class:`NodeCache`.
+
+    Blocks that are saved are also written to the cache, since they are likely to be read again soon.
+
+    Parameters
+    ----------
+    store :
+        The store to wrap.
+    cache : BlockCache | NodeCache
+        The cache to use.
+    """
+
+    def __init__(self, store, cache: BlockCache | NodeCache):
+        super().__init__(store)
+        self.cache = cache
+
+    def save_raw(self, data: bytes) -> CID:
+        cid = self.store.save_raw(data)
+        self.cache.put(cid, data)
+        return cid
+
+    def save_dag_cbor(self, data: bytes) -> CID:
+        cid = self.store.save_dag_cbor(data)
+        self.cache.put(cid, data)
+        return cid
+
+    def load(self, id: CID) -> bytes:
+        data = self.cache.get(id)
+        if data is None:
+            data = self.store.load(id)
+            self.cache.put(id, data)
+
+        return data
+
+
+class BorrowedStore(_StoreWrapper):
+    """Wraps a store which belongs to the caller, so that closing the wrappers around it leaves it open.
+
+    A loader closes the stores it writes through when it's done with them. A store that was passed to the loader, eg a
+    :class:`dc_etl.ipld.car.CARStore`, is used again for the next write or read, so only the caller should close it.
+
+    Parameters
+    ----------
+    store :
+        The store to wrap.
+    """
+
+    def close(self):
+        pass
+
+
+class Link(bytes):
+    """Stands in for the contents of a data block which hasn't been loaded, so it can be saved again by reference.
+
+    Its value is the dag-cbor encoding of the block's CID. py-hamt decodes the values it loads with dag-cbor, so a
+    value read from a HAMT through a :class:`LinkingStore` is the CID itself, which the HAMT encodes the same way when
+    it is written again. Only a :class:`CopyingStore` saves either form by reference, so links must never be written
+    through any other store.
+    """
+
+    cid: CID
+
+    def __new__(cls, cid: CID):
+        link = super().__new__(cls, dag_cbor.encode(cid))
+        link.cid = cid
+        return link
+
+
+def linked_block(value) -> CID | None:
+    """The CID of the block that a value read through a :class:`LinkingStore` stands in for, or `None` if the value
+    isn't a link.
+
+    Parameters
+    ----------
+    value :
+        A value read from a HAMT, or the data a HAMT is saving, which is the dag-cbor encoding of the value.
+    """
+    if isinstance(value, Link):
+        return value.cid
+
+    if isinstance(value, CID):
+        return value
+
+    # Tag 42, a byte string of the rest of the value, then the binary CID after a zero byte
+    if isinstance(value, bytes) and 5 < len(value) < 260 and value[:5] == _CID_TAG + bytes([0x58, len(value) - 4, 0]):
+        try:
+            return CID.decode(value[5:])
+        except (ValueError, LookupError):
+            return None
+
+    return None
+
+
+def same_block(link, data: bytes) -> bool:
+    """Whether a value read through a :class:`LinkingStore` stands in for a block holding `data`, without loading it.
+
+    Parameters
+    ----------
+    link :
+        The value as read from the HAMT. See :func:`linked_block`.
+    data : bytes
+        The value to compare with, as it would be written to the HAMT.
+    """
+    cid = linked_block(link)
+    if not isinstance(link, Link):
+        # The HAMT decoded the link, so it encodes values with dag-cbor before saving them
+        data = dag_cbor.encode(data)
+
+    return cid == block_cid(data, "raw", cid.hashfun.name)
+
+
+class LinkingStore(_StoreWrapper):
+    """Loads data (`raw`) blocks as :class:`Link` placeholders, without reading them.
+
+    Values read from a HAMT through this store can be written to another HAMT through a :class:`CopyingStore` on the
+    same underlying store, so that the new HAMT links to the blocks already stored. HAMT nodes are loaded as usual.
+
+    Parameters
+    ----------
+    store :
+        The store to wrap.
+    """
+
+    def load(self, id: CID) -> bytes:
+        if id.codec.name == "raw":
+            return Link(id)
+
+        return self.store.load(id)
+
+
+class CopyingStore(_StoreWrapper):
+    """Saves :class:`Link` placeholders, loaded through a :class:`LinkingStore`, by reference.
+
+    Saving a placeholder, as is or as encoded by the HAMT, just returns the CID of the block it stands in for, which is
+    already stored, so values copied from one HAMT to another are neither loaded nor saved again. Anything else is
+    saved as usual.
+
+    Parameters
+    ----------
+    store :
+        The store to wrap.
+    """
+
+    def save_raw(self, data: bytes) -> CID:
+        cid = linked_block(data)
+        if cid is not None:
+            return cid
+
+        return self.store.save_raw(data)
+
+
+class PipelinedStore(_StoreWrapper):
+    """Saves blocks to the wrapped store concurrently.
+
+    CIDs are computed locally, so saving a block returns immediately while the block is written in the background by a
+    bounded pool of threads. When all threads are busy, saving waits until one is free. Blocks which are still being
+    written are loaded from memory.
+
+    :meth:`flush` must be called to wait for all writes to be acknowledged before anything written through this store,
+    such as a HAMT root, is used elsewhere.
+
+    The wrapped store must address blocks by CIDv1 using the same hash function as this store, the way `IPFSStore` does
+    by default. A mismatch is raised as a :class:`BlockStoreError` when flushing.
+
+    Parameters
+    ----------
+    store :
+        The store to wrap.
+    concurrency : int
+        Maximum number of blocks to write at the same time.
+    hasher : str
+        The multihash function used to address blocks. Default is "blake3".
+    """
+
+    def __init__(self, store, concurrency: int, hasher: str = "blake3"):
+        super().__init__(store)
+        self.concurrency = concurrency
+        self.hasher = hasher
+        self._pool = None
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._errors = []
+
+    def save_raw(self, data: bytes) -> CID:
+        return self._save(data, "raw", self.store.save_raw)
+
+    def save_dag_cbor(self, data: bytes) -> CID:
+        return self._save(data, "dag-cbor", self.store.save_dag_cbor)
+
+    def load(self, id: CID) -> bytes:
+        with self._lock:
+            data = self._pending.get(id)
+
+        if data is None:
+            data = self.store.load(id)
+
+        return data
+
+    def flush(self, root: CID | None = None):
+        """Wait for all pending writes to finish, then flush the wrapped store."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+        self._raise_errors()
+        super().flush(root)
+
+    def close(self):
+        """Wait for any pending writes to finish and stop the threads writing them, then close the wrapped store."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+        super().close()
+
+    def _save(self, data, codec, save):
+        self._raise_errors()
+        cid = block_cid(data, codec, self.hasher)
+        with self._lock:
+            if cid in self._pending:
+                return cid
+
+            self._pending[cid] = data
+
+        self._slots.acquire()
+        if self._pool is None:
+            self._pool = concurrent.futures.ThreadPoolExecutor(self.concurrency)
+
+        future = self._pool.submit(save, data)
+        future.add_done_callback(functools.partial(self._saved, cid))
+
+        return cid
+
+    def _saved(self, cid, future):
+        error = future.exception()
+        if error is None and future.result() != cid:
+            error = BlockStoreError(f"Expected block to be saved as {cid}, but store returned {future.result()}")
+
+        with self._lock:
+            del self._pending[cid]
+            if error is not None:
+                self._errors.append(error)
+
+        self._slots.release()
+
+    def _raise_errors(self):
+        with self._lock:
+            if self._errors:
+                error, self._errors = self._errors[0], []
+                raise error
+
+
+class BulkStore(_StoreWrapper):
+    """Buffers HAMT nodes in memory so that only the final version of each node is written.
+
+    Building a HAMT one key at a time rewrites the nodes along the path from the root to the key for every insertion,
+    so most of the nodes written are superseded almost immediately. This store keeps nodes (`dag-cbor` blocks) in
+    memory while the HAMT is built, periodically discarding nodes which can no longer be reached from the current root.
+    When flushed, it writes each node reachable from the final root exactly once, children before parents. Data (`raw`)
+    blocks are passed straight through to the wrapped store.
+
+    Parameters
+    ----------
+    store :
+        The store to wrap.
+    root : Callable[[], CID | None]
+        Returns the current root of the HAMT being built. Used to discard unreachable nodes.
+    compact_bytes : int
+        Discard unreachable nodes each time this many bytes of nodes have been buffered. Default is 64 MiB.
+    hasher : str
+        The multihash function used to address blocks. Default is "blake3".
+    """
+
+    def __init__(
+        self,
+        store,
+        root: typing.Callable[[], CID | None] = lambda: None,
+        compact_bytes: int = 1 << 26,
+        hasher: str = "blake3",
+    ):
+        super().__init__(store)
+        self.root = root
+        self.compact_bytes = compact_bytes
+        self.hasher = hasher
+        self._nodes = {}
+        self._buffered = 0
+
+    def save_dag_cbor(self, data: bytes) -> CID:
+        cid = block_cid(data, "dag-cbor", self.hasher)
+
+        # Nodes are kept in the order they were saved, most recent last, which compaction relies on
+        self._nodes.pop(cid, None)
+        self._nodes[cid] = data
+        self._buffered += len(data)
+        if self._buffered >= self.compact_bytes:
+            self.compact()
+
+        return cid
+
+    def load(self, id: CID) -> bytes:
+        data = self._nodes.get(id)
+        if data is None:
+            data = self.store.load(id)
+
+        return data
+
+    def compact(self):
+        """Discard buffered nodes which can no longer be reached from the current root."""
+        self._buffered = 0
+        root = self.root()
+        if root not in self._nodes:
+            return
+
+        # Nodes saved after the root may be part of an insertion that is still in progress, so are kept
+        saved = list(self._nodes)
+        keep = set(saved[saved.index(root) :])
+        keep.update(self._reachable(root))
+        self._nodes = {cid: data for cid, data in self._nodes.items() if cid in keep}
+
+    def flush(self, root: CID | None = None):
+        """Write every buffered node reachable from `root`, children before parents, then flush the wrapped store."""
+        if root is not None:
+            for cid in self._reachable(root):
+                saved = self.store.save_dag_cbor(self._nodes[cid])
+                if saved != cid:
+                    raise BlockStoreError(f"Expected block to be saved as {cid}, but store returned {saved}")
+
+        self._nodes = {}
+        self._buffered = 0
+        super().flush(root)
+
+    def _reachable(self, root: CID) -> list[CID]:
+        """Buffered nodes reachable from `root`, in post order (children before parents)."""
+        order = []
+        seen = set()
+        stack = [(root, False)]
+        while stack:
+            cid, expanded = stack.pop()
+            if expanded:
+                order.append(cid)
+                continue
+
+            if cid in seen or cid not in self._nodes:
+                continue
+
+            seen.add(cid)
+            stack.append((cid, True))
+            stack.extend((link, False) for link in _links(dag_cbor.decode(self._nodes[cid])))
+
+        return order
+
+
+def _links(node) -> typing.Generator[CID, None, None]:
+    """Find all of the CIDs linked to from a decoded IPLD node."""
+    if isinstance(node, CID):
+        yield node
+
+    elif isinstance(node, dict):
+        for value in node.values():
+            yield from _links(value)
+
+    elif isinstance(node, list):
+        for value in node:
+            yield from _links(value)
@@ -1,6 +1,14 @@
+from __future__ import annotations
+
 import abc
+import json
+import typing
 
+import numpy
 import xarray
+import zarr
+
+from numcodecs.compat import ensure_bytes
 
 from dc_etl.fetch import Timespan
 
@@ -18,3 +26,347 @@ class Loader(abc.ABC):
     @abc.abstractmethod
     def replace(self, dataset: xarray.Dataset, span: Timespan | None = None, **kwargs):
         """Replace a contiguous span of data in an existing dataset."""
+
+    def replace_many(self, dataset: xarray.Dataset, spans: typing.Sequence[Timespan], **kwargs):
+        """Replace several spans of data in an existing dataset.
+
+        The default implementation calls :meth:`replace` once per span. Implementations are encouraged to override this
+        to do the work in a single pass.
+        """
+        for span in spans:
+            self.replace(dataset, span, **kwargs)
+
+    def manifest(self) -> dict | None:
+        """Summarize the currently published dataset, without reading the dataset itself.
+
+        The summary is made by :func:`dataset_manifest` when the dataset is written. If data was loaded with a `state`
+        keyword argument, the fetcher's remote state it was loaded from, that is recorded as `source`.
+
+        Returns `None` if no dataset has been published, or the loader doesn't keep manifests.
+        """
+        return None
+
+    def dataset(self) -> xarray.Dataset | None:
+        """Get the currently published dataset.
+
+        Returns `None` if no dataset has been published, or the loader can't read it back.
+        """
+        return None
+
+
+def time_regions(
+    times: numpy.ndarray, spans: Timespan | typing.Sequence[Timespan], method: str | None = None
+) -> numpy.ndarray:
+    """Resolve timespans to integer regions along a time coordinate.
+
+    Uses a binary search directly on the `datetime64` array, so resolving a span is O(log n) in the length of the time
+    coordinate, and any number of spans can be resolved in a single vectorized call.
+
+    Parameters
+    ----------
+    times : numpy.ndarray
+        The time coordinate of a dataset. Must be sorted in ascending order.
+    spans : Timespan | Sequence[Timespan]
+        A single timespan or a sequence of timespans to resolve. Span ends are inclusive.
+    method : str | None
+        `None` (the default) requires every span start and end to be present in `times` exactly. `"nearest"` resolves
+        each span start and end to the nearest timestamp in `times`, preferring the later timestamp on a tie, the
+        way `xarray.Dataset.sel` does.
+
+    Returns
+    -------
+    numpy.ndarray :
+        An integer array of shape `(len(spans), 2)`. Each row is the `(start, stop)` of a region, where `stop` is
+        exclusive, suitable for use as `slice(start, stop)`.
+    """
+    times = numpy.asarray(times)
+    spans = numpy.asarray(spans, dtype=times.dtype).reshape(-1, 2)
+    if (spans[:, 0] > spans[:, 1]).any():
+        raise ValueError("Timespans must not end before they start")
+
+    if not len(times):
+        raise KeyError("Cannot resolve timespans against an empty time coordinate")
+
+    timestamps = spans.ravel()
+    if method is None:
+        indexes = numpy.searchsorted(times, timestamps).clip(max=len(times) - 1)
+        missing = times[indexes] != timestamps
+        if missing.any():
+            raise KeyError(f"Timestamps not found: {', '.join(map(str, timestamps[missing]))}")
+
+    elif method == "nearest":
+        right = numpy.searchsorted(times, timestamps).clip(max=len(times) - 1)
+        left = (right - 1).clip(min=0)
+        # Ties go to the later timestamp, as in pandas
+        nearer_left = (timestamps - times[left]) < (times[right] - timestamps)
+        indexes = numpy.where(nearer_left, left, right)
+
+    else:
+        raise ValueError(f"Unsupported method: {method}")
+
+    regions = indexes.reshape(-1, 2)
+    regions[:, 1] += 1
+
+    return regions
+
+
+def merge_regions(regions: numpy.ndarray) -> list[tuple[int, int]]:
+    """Merge integer regions along the time dimension which overlap or are contiguous.
+
+    Regions separated by a gap are kept apart, even if they share a chunk, so that data in the gap is never rewritten.
+
+    Parameters
+    ----------
+    regions : numpy.ndarray
+        Regions as returned by :func:`time_regions`, in any order.
+
+    Returns
+    -------
+    list[tuple[int, int]] :
+        Sorted, non-overlapping `(start, stop)` regions.
+    """
+    merged = []
+    for start, stop in sorted((int(start), int(stop)) for start, stop in regions):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+            continue
+
+        merged.append((start, stop))
+
+    return merged
+
+
+def replace_regions(
+    metadata: zarr.Group,
+    dataset: xarray.Dataset,
+    spans: typing.Sequence[Timespan],
+    time_dim: str,
+    method: str | None = None,
+) -> list[tuple[int, int, xarray.Dataset]]:
+    """Work out where in an existing Zarr dataset to write replacement data, and what to write there.
+
+    The spans are resolved with :func:`time_regions` against the time coordinate of the existing dataset, and merged
+    with :func:`merge_regions`, so that no value is written more than once.
+
+    Parameters
+    ----------
+    metadata : zarr.Group
+        The root group of the existing dataset, as opened by `zarr.open_consolidated`.
+    dataset : xarray.Dataset
+        The replacement data, with the same variables as the existing dataset, covering at least each of the spans.
+    spans : Sequence[Timespan]
+        The spans of data to replace.
+    time_dim : str
+        Name of the time dimension.
+    method : str | None
+        How to resolve span ends to positions in the time coordinate, see :func:`time_regions`.
+
+    Returns
+    -------
+    list[tuple[int, int, xarray.Dataset]] :
+        The `(start, stop)` of each region of the existing dataset to write to, with the replacement data to write
+        there. Coordinates are dropped from the data, so it can be written with `to_zarr(region=...)`.
+    """
+    times = time_coordinate(metadata, time_dim)
+    dataset = dataset.drop_vars([dim for dim in dataset.dims if dim != time_dim])
+    return [
+        (start, stop, dataset.sel(**{time_dim: times[start:stop]}).drop_vars(time_dim))
+        for start, stop in merge_regions(time_regions(times, spans, method=method))
+    ]
+
+
+def time_coordinate(metadata: zarr.Group, time_dim: str) -> numpy.ndarray:
+    """Read the time coordinate of a Zarr dataset without opening the whole dataset.
+
+    Only the chunks of the time coordinate itself are read from the store.
+
+    Parameters
+    ----------
+    metadata : zarr.Group
+        The root group of the dataset, as opened by `zarr.open_consolidated`.
+    time_dim : str
+        Name of the time dimension.
+
+    Returns
+    -------
+    numpy.ndarray :
+        The decoded time coordinate.
+    """
+    array = metadata[time_dim]
+    attrs = {key: value for key, value in array.attrs.items() if key != "_ARRAY_DIMENSIONS"}
+    dataset = xarray.decode_cf(xarray.Dataset({time_dim: xarray.Variable(time_dim, array[:], attrs)}))
+    return dataset[time_dim].values
+
+
+def dataset_manifest(store: typing.Mapping, time_dim: str) -> dict:
+    """Summarize a Zarr dataset, for publishing along with it.
+
+    Only the consolidated metadata and the time coordinate are read from the store.
+
+    Parameters
+    ----------
+    store : Mapping
+        The store the dataset was written to, with consolidated metadata.
+    time_dim : str
+        Name of the time dimension.
+
+    Returns
+    -------
+    dict :
+        A JSON serializable summary of the dataset, with the keys:
+
+        `time`:
+            The `start` and `end` of the time coordinate, as ISO 8601 strings, and its `length`.
+        `dims`:
+            The size of each dimension.
+        `variables`:
+            For each array at the top level of the dataset, its `dims`, `shape`, `chunks`, `dtype`, `compressor`,
+            `filters`, and `fill_value`, as recorded in its Zarr metadata.
+    """
+    metadata = json.loads(ensure_bytes(store[".zmetadata"]))["metadata"]
+    times = time_coordinate(zarr.open_consolidated(store, mode="r"), time_dim)
+    if numpy.issubdtype(times.dtype, numpy.datetime64):
+        times = numpy.datetime_as_string(times)
+
+    dims = {}
+    variables = {}
+    for key, array in sorted(metadata.items()):
+        if not key.endswith(".zarray"):
+            continue
+
+        name = key[: -len(".zarray")].rstrip("/")
+        if "/" in name:
+            # Arrays in groups, eg the chunk index, aren't part of the dataset as xarray sees it
+            continue
+
+        array_dims = metadata.get(f"{name}/.zattrs", {}).get("_ARRAY_DIMENSIONS", [])
+        dims.update(zip(array_dims, array["shape"]))
+        variables[name] = {
+            "dims": array_dims,
+            "shape": array["shape"],
+            "chunks": array["chunks"],
+            "dtype": array["dtype"],
+            "compressor": array["compressor"],
+            "filters": array["filters"],
+            "fill_value": array["fill_value"],
+        }
+
+    return {
+        "time": {
+            "start": str(times[0]) if len(times) else None,
+            "end": str(times[-1]) if len(times) else None,
+            "length": len(times),
+        },
+        "dims": dims,
+        "variables": variables,
+    }
+
+
+def encoding_chunks(dataset: xarray.Dataset) -> dict[str, tuple[int, ...]]:
+    """Get the Zarr chunks that the variables of a dataset will be written with, from their encodings.
+
+    Variables with no chunks in their encoding are left out, as Zarr will choose their chunks itself.
+
+    Parameters
+    ----------
+    dataset : xarray.Dataset
+        The dataset about to be written.
+
+    Returns
+    -------
+    dict[str, tuple[int, ...]] :
+        Chunk shape of each variable, by name.
+    """
+    return {
+        name: tuple(variable.encoding["chunks"])
+        for name, variable in dataset.variables.items()
+        if variable.encoding.get("chunks")
+    }
+
+
+def zarr_chunks(metadata: zarr.Group) -> dict[str, tuple[int, ...]]:
+    """Get the chunks of the arrays in an existing Zarr dataset.
+
+    Parameters
+    ----------
+    metadata : zarr.Group
+        The root group of the dataset, as opened by `zarr.open_consolidated`.
+
+    Returns
+    -------
+    dict[str, tuple[int, ...]] :
+        Chunk shape of each array, by name.
+    """
+    return {name: array.chunks for name, array in metadata.arrays()}
+
+
+def align_chunks(
+    dataset: xarray.Dataset,
+    chunks: typing.Mapping[str, tuple[int, ...]],
+    offsets: typing.Mapping[str, int] | None = None,
+) -> xarray.Dataset:
+    """Chunk a dataset with dask so that each dask chunk covers whole chunks of the Zarr arrays it will be written to.
+
+    Dask chunks that line up with Zarr chunks can be encoded and written in parallel, since no two tasks ever write to
+    the same Zarr chunk.
+
+    Parameters
+    ----------
+    dataset : xarray.Dataset
+        The dataset to chunk.
+    chunks : Mapping[str, tuple[int, ...]]
+        Chunk shape of the Zarr array for each variable, by name, as returned by :func:`encoding_chunks` or
+        :func:`zarr_chunks`. Variables not in `chunks` are left as they are.
+    offsets : Mapping[str, int] | None
+        Position along each dimension of the Zarr arrays at which the dataset will be written, eg the current length of
+        the time dimension when appending. Default is 0 for every dimension.
+
+    Returns
+    -------
+    xarray.Dataset :
+        The chunked dataset.
+    """
+    offsets = offsets or {}
+    dataset = dataset.copy()
+    for name, shape in chunks.items():
+        if name not in dataset.variables:
+            continue
+
+        variable = dataset.variables[name]
+        dataset[name] = variable.chunk(
+            {dim: _split(variable.sizes[dim], size, offsets.get(dim, 0)) for dim, size in zip(variable.dims, shape)}
+        )
+
+    return dataset
+
+
+def partition_bounds(size: int, chunk: int, partitions: int) -> list[tuple[int, int]]:
+    """Divide a dimension into contiguous partitions which each cover whole chunks.
+
+    Chunks are shared out as evenly as possible, so that no two partitions write to the same chunk.
+
+    Parameters
+    ----------
+    size : int
+        Length of the dimension.
+    chunk : int
+        Length of the chunks along the dimension.
+    partitions : int
+        Number of partitions. Trailing partitions are empty if there are fewer chunks than partitions.
+
+    Returns
+    -------
+    list[tuple[int, int]] :
+        The `(start, stop)` of each partition, where `stop` is exclusive.
+    """
+    chunks = -(-size // chunk)
+    edges = [min(size, chunk * (chunks * i // partitions)) for i in range(partitions + 1)]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def _split(length: int, chunk: int, offset: int = 0) -> tuple[int, ...]:
+    """Split a dimension of `length` into dask chunks which line up with Zarr chunks of size `chunk`, starting at
+    position `offset` in the Zarr array."""
+    first = min(length, chunk - offset % chunk)
+    full, last = divmod(length - first, chunk)
+    return (first,) + (chunk,) * full + ((last,) if last else ())
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import json
+import typing
+
+import xarray
+import zarr
+
+from dc_etl import chunk_index, multiscale, stats
+from dc_etl.fetch import Timespan
+from dc_etl.filespec import FileSpec
+from dc_etl.load import (
+    Loader,
+    align_chunks,
+    dataset_manifest,
+    encoding_chunks,
+    replace_regions,
+    zarr_chunks,
+)
+
+
+class DirectoryLoader(Loader):
+    """Store datasets as Zarr in a folder, usually in the local filesystem.
+
+    Needs no IPFS node or network, so is useful for staging data, and for testing and profiling the rest of a pipeline
+    in isolation.
+
+    A manifest of the dataset, see :meth:`Loader.manifest`, is written alongside the folder, to a file with the same
+    name and the suffix `.manifest.json`.
+
+    Overviews are written for datasets with `multiscales` metadata. See :class:`dc_etl.ipld.loader.IPLDLoader`.
+
+    Parameters
+    ----------
+    path : FileSpec
+        The folder to write the dataset to.
+    time_dim : str
+        Name of the time dimension.
+    method : str | None
+        How to resolve the ends of a timespan to positions in the existing dataset when replacing data. See
+        :class:`dc_etl.ipld.loader.IPLDLoader`.
+    statistics : bool
+        If `True`, statistics of each numeric data variable are computed as data is written, and recorded in the
+        manifest. See :class:`dc_etl.ipld.loader.IPLDLoader`.
+    chunk_index : bool
+        If `True`, a summary of every Zarr chunk written is recorded in an index stored with the dataset, see
+        :mod:`dc_etl.chunk_index`. See :class:`dc_etl.ipld.loader.IPLDLoader`.
+    """
+
+    def __init__(
+        self,
+        path: FileSpec,
+        time_dim: str,
+        method: str | None = "nearest",
+        statistics: bool = False,
+        chunk_index: bool = False,
+    ):
+        self.path = path
+        self.time_dim = time_dim
+        self.method = method
+        self.statistics = statistics
+        self.chunk_index = chunk_index
+
+    def initial(self, dataset: xarray.Dataset, span: Timespan | None = None, **kwargs):
+        """Start writing a new dataset."""
+        store = self._store()
+        dataset = self._chunk(dataset.sel(**{self.time_dim: slice(*span)}), encoding_chunks(dataset))
+        written, blocks = self._to_zarr(dataset, store=store, mode="w", consolidated=True)
+        if blocks is not None:
+            chunk_index.update(store, blocks)
+        if multiscale.ATTR in dataset.attrs:
+            multiscale.update(store, self.time_dim)
+        self._write_manifest(kwargs.get("state"), stats.totals(written))
+
+    def append(self, dataset: xarray.Dataset, span: Timespan | None = None, **kwargs):
+        """Append data to an existing dataset."""
+        store = self._store()
+        dataset = dataset.sel(**{self.time_dim: slice(*span)})
+        metadata = zarr.open_consolidated(store, mode="r")
+        offset = metadata[self.time_dim].shape[0]
+        dataset = self._chunk(dataset, zarr_chunks(metadata), {self.time_dim: offset})
+
+        written, blocks = self._to_zarr(dataset, store=store, consolidated=True, append_dim=self.time_dim)
+        if blocks is not None:
+            chunk_index.update(store, blocks, {self.time_dim: offset}, append=True)
+        if multiscale.ATTR in dataset.attrs:
+            multiscale.update(store, self.time_dim, offset, append=True)
+        statistics = stats.totals(written, self.manifest() if written is not None else None, append=True)
+        self._write_manifest(kwargs.get("state"), statistics)
+
+    def replace(self, replace_dataset: xarray.Dataset, span: Timespan | None = None, **kwargs):
+        """Replace a contiguous span of data in an existing dataset."""
+        self.replace_many(replace_dataset, [span], **kwargs)
+
+    def replace_many(self, replace_dataset: xarray.Dataset, spans: typing.Sequence[Timespan], **kwargs):
+        """Replace several spans of data in an existing dataset.
+
+        Spans which overlap or are contiguous are merged, so that data covered by more than one is only written once.
+        """
+        store = self._store()
+        metadata = zarr.open_consolidated(store, mode="r")
+        manifest = self.manifest() if self.statistics else None
+        update_totals = manifest is not None and "statistics" in manifest
+        written = {} if self.statistics else None
+        replaced = {}
+        for start, stop, region in replace_regions(metadata, replace_dataset, spans, self.time_dim, self.method):
+            region = self._chunk(region, zarr_chunks(metadata), {self.time_dim: start})
+            if update_totals:
+                # The data is replaced in place, so its statistics are taken out of the totals before it's overwritten
+                old = xarray.open_zarr(store, consolidated=True)[list(region.data_vars)]
+                replaced = stats.combine(replaced, stats.of(old.isel(**{self.time_dim: slice(start, stop)})))
+
+            statistics, blocks = self._to_zarr(
+                region,
+                store=store,
+                consolidated=True,
+                region={self.time_dim: slice(start, stop)},
+                safe_chunks=not self.chunk_index,
+            )
+            if statistics is not None:
+                written = stats.combine(written, statistics)
+            if blocks is not None:
+                chunk_index.update(store, blocks, {self.time_dim: start})
+            multiscale.update(store, self.time_dim, start, stop)
+
+        bounds = {}
+        if self.chunk_index and update_totals:
+            bounds = {name: chunk_index.bounds(store, name) for name in written}
+        self._write_manifest(kwargs.get("state"), stats.totals(written, manifest, replaced=replaced, bounds=bounds))
+
+    def manifest(self) -> dict | None:
+        """Implementation of :meth:`Loader.manifest`"""
+        path = self._manifest_path()
+        if not path.exists():
+            return None
+
+        with path.open("r") as f:
+            return json.load(f)
+
+    def candidate_chunks(
+        self, name: str, minimum: float | None = None, maximum: float | None = None
+    ) -> list[dict[str, slice]]:
+        """Find the chunks of a variable in the dataset which may have values in a range.
+
+        The dataset must have been loaded with `chunk_index` enabled. See :func:`dc_etl.chunk_index.candidate_chunks`.
+        """
+        return chunk_index.candidate_chunks(self._store(), name, minimum, maximum)
+
+    def overview(self, factor: int) -> xarray.Dataset:
+        """Convenience method to get one of the overviews of the current dataset.
+
+        See :func:`dc_etl.multiscale.open_overview`.
+        """
+        return multiscale.open_overview(self._store(), factor)
+
+    def dataset(self) -> xarray.Dataset | None:
+        """Implementation of :meth:`Loader.dataset`"""
+        if not (self.path / ".zmetadata").exists():
+            return None
+
+        return xarray.open_zarr(store=self._store(), consolidated=True)
+
+    def _store(self):
+        return zarr.storage.FSStore(self.path.path, fs=self.path.fs)
+
+    def _chunk(self, dataset, chunks, offsets=None):
+        """Line dask chunks up with Zarr chunks, so that each chunk written can be summarized for the chunk index."""
+        if not self.chunk_index:
+            return dataset
+
+        return align_chunks(dataset, chunks, offsets)
+
+    def _to_zarr(self, dataset, **kwargs):
+        """Write a dataset, computing its statistics in the same pass if configured to. Returns the statistics and the
+        statistics of each chunk written, for the chunk index, or `None` for either if not configured."""
+        if not (self.statistics or self.chunk_index):
+            dataset.to_zarr(**kwargs)
+            return None, None
+
+        blocks = {} if self.chunk_index else None
+        statistics = stats.to_zarr(dataset, blocks=blocks, **kwargs)
+        return statistics if self.statistics else None, blocks
+
+    def _manifest_path(self):
+        return self.path.with_suffix("manifest.json")
+
+    def _write_manifest(self, state, statistics=None):
+        manifest = dataset_manifest(self._store(), self.time_dim)
+        if state is not None:
+            manifest["source"] = state
+        if statistics is not None:
+            manifest["statistics"] = statistics
+
+        with self._manifest_path().open("w") as f:
+            json.dump(manifest, f)
@@ -0,0 +1,437 @@
+"""Wrappers for the key/value stores that Zarr writes datasets to.
+
+Each wrapper is itself a `MutableMapping` which can be passed to `xarray.Dataset.to_zarr` in place of the store it
+wraps.
+"""
+
+from __future__ import annotations
+
+import collections
+import collections.abc
+import itertools
+import json
+import math
+import threading
+import typing
+
+import numpy
+
+from numcodecs.compat import ensure_bytes
+
+from dc_etl.ipld.stores import same_block
+
+# Marks a chunk missing from a shard in the shard index
+_MISSING = 2**64 - 1
+
+
+class ChunkCounts(typing.NamedTuple):
+    """Number of chunks rewritten or left unchanged by a write."""
+
+    rewritten: int
+    unchanged: int
+
+
+class DiffMapper(collections.abc.MutableMapping):
+    """Skips writing values which are identical to the values already in the store.
+
+    Chunks are encoded as usual by Zarr, then compared with what is already stored under the same key. Unchanged chunks
+    are not written, which, for a content addressed store, means no new blocks and no rewritten HAMT nodes.
+
+    Given `links`, the same HAMT read through a :class:`dc_etl.ipld.stores.LinkingStore`, values are compared by the
+    CID of the block already stored, so existing chunks are never downloaded just to be compared. Values which aren't
+    found there, eg chunks stored in shards, are read from `store` to be compared.
+
+    Only chunks of arrays at the top level of the dataset are counted, not those of groups written along with it, such
+    as overviews or the chunk index.
+
+    Parameters
+    ----------
+    store : MutableMapping
+        The store to wrap.
+    links : Mapping | None
+        The HAMT that `store` writes to, read through a `LinkingStore`.
+    """
+
+    def __init__(self, store: typing.MutableMapping, links: typing.Mapping | None = None):
+        self.store = store
+        self.links = links
+        self.rewritten = 0
+        self.unchanged = 0
+        self._read = {}
+
+    @property
+    def counts(self) -> ChunkCounts:
+        """Chunks rewritten and left unchanged so far."""
+        return ChunkCounts(self.rewritten, self.unchanged)
+
+    def __getitem__(self, key):
+        # Zarr reads partially overwritten chunks before writing them. Remember them so they needn't be read again for
+        # comparison.
+        value = self._read[key] = self.store[key]
+        return value
+
+    def __setitem__(self, key, value):
+        value = ensure_bytes(value)
+        counted = _is_chunk(key) and key.count("/") == 1
+        if self._unchanged(key, value):
+            if counted:
+                self.unchanged += 1
+            return
+
+        self.store[key] = value
+        if counted:
+            self.rewritten += 1
+
+    def _unchanged(self, key, value):
+        existing = self._read.pop(key, None)
+        if existing is None and self.links is not None:
+            link = self.links.get(key)
+            if link is not None:
+                return same_block(link, value)
+
+        if existing is None:
+            existing = self.store.get(key)
+
+        return existing is not None and ensure_bytes(existing) == value
+
+    def __delitem__(self, key):
+        self._read.pop(key, None)
+        del self.store[key]
+
+    def __iter__(self):
+        return iter(self.store)
+
+    def __len__(self):
+        return len(self.store)
+
+    def __contains__(self, key):
+        return key in self.store
+
+
+class ShardedMapper(collections.abc.MutableMapping):
+    """Stores many Zarr chunks together in each value of the wrapped store.
+
+    Zarr v2 has no sharding of its own, so chunks are grouped into shards by this mapper, underneath Zarr, using the
+    same binary layout as the Zarr v3 sharding codec: the chunks of a shard are concatenated, followed by an index of
+    little endian `uint64` `(offset, nbytes)` pairs, one per chunk in C order, with `2**64 - 1` for missing chunks. The
+    index has no checksum. Each shard is one value, so, for a HAMT, one block and one HAMT entry, in place of many.
+
+    The number of chunks per shard along each dimension is recorded for each sharded array under the `.zshard` key in
+    the array's folder, so reading a sharded dataset through this mapper needs no configuration. Only arrays created
+    through this mapper are sharded. Arrays that already exist keep the layout they were written with.
+
+    Chunks written to a shard are buffered until the shard is complete or :meth:`flush` is called, so that each shard
+    is only written once per write to the dataset. Recently read shards are kept in memory, so reading the chunks of a
+    shard one after another only reads the shard once.
+
+    Iterating over the mapper lists the keys of every chunk covered by each stored shard, worked out from the array's
+    metadata without reading any shards, so it may include chunks which were never written. Like any missing chunk,
+    they can't be read, and Zarr fills them in with the array's fill value.
+
+    The `.zshard` key and the `shards/` folders are particular to this mapper, not part of the Zarr v2 format. A
+    sharded dataset must always be read through this mapper. Read directly, eg by `xarray.open_zarr` on the HAMT, its
+    sharded arrays have no chunks, so every value reads as the fill value, without any error.
+
+    Parameters
+    ----------
+    store : MutableMapping
+        The store to wrap.
+    shards : Mapping[str, int] | None
+        Number of chunks per shard along each named dimension, for newly created arrays. Dimensions not named have one
+        chunk per shard. Default is `None`, which doesn't shard new arrays.
+    cache_size : int
+        Number of recently read shards to keep in memory. Default is 16.
+    """
+
+    def __init__(self, store: typing.MutableMapping, shards: typing.Mapping[str, int] | None = None, cache_size=16):
+        self.store = store
+        self.shards = shards
+        self.cache_size = cache_size
+        self._layouts = {}
+        self._grids = {}
+        self._created = set()
+        self._pending = {}
+        self._cache = collections.OrderedDict()
+
+    def flush(self):
+        """Write every shard with buffered chunks."""
+        for key in list(self._pending):
+            self._write_shard(key)
+
+    def __getitem__(self, key):
+        located = self._locate(key)
+        if located is None:
+            return self.store[key]
+
+        shard_key, index = located
+        pending = self._pending.get(shard_key, {})
+        if index in pending:
+            if pending[index] is None:
+                raise KeyError(key)
+            return pending[index]
+
+        chunk = self._read_shard(shard_key).get(index)
+        if chunk is None:
+            raise KeyError(key)
+
+        return chunk
+
+    def __setitem__(self, key, value):
+        if key.endswith("/.zarray") or key == ".zarray":
+            array = key[: -len(".zarray")].rstrip("/")
+            if array not in self._layouts and key not in self.store:
+                self._created.add(array)
+            self._layouts.pop(array, None)
+            self._grids.pop(array, None)
+
+        located = self._locate(key, create=True)
+        if located is None:
+            self.store[key] = value
+            return
+
+        shard_key, index = located
+        self._pending.setdefault(shard_key, {})[index] = ensure_bytes(value)
+        self._write_if_complete(shard_key)
+
+    def __delitem__(self, key):
+        located = self._locate(key)
+        if located is None:
+            del self.store[key]
+            return
+
+        if key not in self:
+            raise KeyError(key)
+
+        shard_key, index = located
+        self._pending.setdefault(shard_key, {})[index] = None
+
+    def __iter__(self):
+        seen = set()
+        stored = list(self.store)
+        for key in itertools.chain(stored, list(self._pending)):
+            keys = self._shard_chunk_keys(key, key in self.store) if self._is_shard(key) else (key,)
+            for key in keys:
+                if key not in seen:
+                    seen.add(key)
+                    yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __contains__(self, key):
+        if self._locate(key) is None:
+            return key in self.store
+
+        try:
+            self[key]
+        except KeyError:
+            return False
+
+        return True
+
+    def _is_shard(self, key):
+        """Whether a key in the wrapped store is a shard."""
+        folder = key.rpartition("/")[0]
+        return folder.rpartition("/")[2] == "shards" and self._layout(_shard_array(key)) is not None
+
+    def _locate(self, key, create=False):
+        """Find the shard a chunk is stored in and the chunk's position in it, or `None` if `key` isn't sharded."""
+        if not _is_chunk(key):
+            return None
+
+        array, _, name = key.rpartition("/")
+        layout = self._layout(array, create)
+        if layout is None:
+            return None
+
+        coords = [int(coord) for coord in name.split(".")]
+        shard = [coord // per_shard for coord, per_shard in zip(coords, layout)]
+        index = [coord % per_shard for coord, per_shard in zip(coords, layout)]
+        prefix = f"{array}/" if array else ""
+        return f"{prefix}shards/{'.'.join(map(str, shard))}", int(numpy.ravel_multi_index(index, layout))
+
+    def _layout(self, array, create=False):
+        """Chunks per shard along each dimension of an array, or `None` if the array isn't sharded."""
+        if array in self._layouts:
+            return self._layouts[array]
+
+        prefix = f"{array}/" if array else ""
+        layout = self.store.get(f"{prefix}.zshard")
+        if layout is not None:
+            layout = tuple(json.loads(ensure_bytes(layout))["chunks_per_shard"])
+
+        elif create and self.shards and array in self._created:
+            metadata = json.loads(ensure_bytes(self.store[f"{prefix}.zarray"]))
+            attrs = json.loads(ensure_bytes(self.store.get(f"{prefix}.zattrs", b"{}")))
+            dims = attrs.get("_ARRAY_DIMENSIONS", [])
+            if metadata.get("dimension_separator", ".") == "." and len(dims) == len(metadata["shape"]):
+                layout = tuple(self.shards.get(dim, 1) for dim in dims)
+                if all(per_shard == 1 for per_shard in layout):
+                    layout = None
+                else:
+                    self.store[f"{prefix}.zshard"] = json.dumps({"chunks_per_shard": layout}).encode()
+
+        elif array in self._created:
+            # Not decided until the first chunk is written
+            return None
+
+        self._layouts[array] = layout
+        return layout
+
+    def _grid(self, array):
+        """Number of chunks along each dimension of an array."""
+        grid = self._grids.get(array)
+        if grid is None:
+            prefix = f"{array}/" if array else ""
+            metadata = json.loads(ensure_bytes(self.store[f"{prefix}.zarray"]))
+            grid = self._grids[array] = [
+                math.ceil(size / chunk) for size, chunk in zip(metadata["shape"], metadata["chunks"])
+            ]
+
+        return grid
+
+    def _write_if_complete(self, shard_key):
+        """Write a shard if every one of its chunks has been buffered."""
+        layout = self._layouts[_shard_array(shard_key)]
+        grid = self._grid(_shard_array(shard_key))
+        expected = math.prod(
+            min(per_shard, size - coord * per_shard)
+            for coord, per_shard, size in zip(_shard_coords(shard_key), layout, grid)
+        )
+        if len(self._pending[shard_key]) >= expected:
+            self._write_shard(shard_key)
+
+    def _write_shard(self, shard_key):
+        pending = self._pending.pop(shard_key)
+        chunks = dict(self._read_shard(shard_key))
+        chunks.update(pending)
+        chunks = {index: chunk for index, chunk in chunks.items() if chunk is not None}
+
+        self._cache.pop(shard_key, None)
+        if not chunks:
+            self.store.pop(shard_key, None)
+            return
+
+        layout = self._layouts[_shard_array(shard_key)]
+        self.store[shard_key] = _encode_shard(chunks, math.prod(layout))
+
+    def _read_shard(self, shard_key):
+        """Decoded chunks of a shard as stored, by position, using recently read shards where possible."""
+        chunks = self._cache.get(shard_key)
+        if chunks is not None:
+            self._cache.move_to_end(shard_key)
+            return chunks
+
+        data = self.store.get(shard_key)
+        layout = self._layouts[_shard_array(shard_key)]
+        chunks = {} if data is None else _decode_shard(ensure_bytes(data), math.prod(layout))
+        self._cache[shard_key] = chunks
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+        return chunks
+
+    def _shard_chunk_keys(self, shard_key, stored):
+        """Keys of the chunks in a shard, worked out from the array's grid of chunks without reading the shard.
+
+        Every position the shard covers is included if the shard is `stored`, otherwise only chunks buffered for it.
+        Chunks buffered for deletion are left out.
+        """
+        array = _shard_array(shard_key)
+        layout = self._layout(array)
+        shard = _shard_coords(shard_key)
+        pending = self._pending.get(shard_key, {})
+        if stored:
+            grid = self._grid(array)
+            counts = [min(per_shard, size - coord * per_shard) for coord, per_shard, size in zip(shard, layout, grid)]
+            positions = itertools.product(*(range(count) for count in counts))
+            chunks = {int(numpy.ravel_multi_index(position, layout)) for position in positions}
+        else:
+            chunks = set()
+
+        chunks.update(index for index, chunk in pending.items() if chunk is not None)
+        chunks.difference_update(index for index, chunk in pending.items() if chunk is None)
+
+        prefix = f"{array}/" if array else ""
+        for index in sorted(chunks):
+            position = numpy.unravel_index(index, layout)
+            coords = [coord * per_shard + offset for coord, per_shard, offset in zip(shard, layout, position)]
+            yield prefix + ".".join(map(str, coords))
+
+
+def _shard_array(shard_key: str) -> str:
+    """Path of the array a shard belongs to."""
+    return shard_key.rpartition("/")[0].rpartition("/")[0]
+
+
+def _shard_coords(shard_key: str) -> list[int]:
+    """Position of a shard in the grid of shards of its array."""
+    return [int(coord) for coord in shard_key.rpartition("/")[2].split(".")]
+
+
+def _encode_shard(chunks: dict[int, bytes], size: int) -> bytes:
+    """Concatenate chunks and append a Zarr v3 style shard index."""
+    index = numpy.full((size, 2), _MISSING, dtype="<u8")
+    offset = 0
+    for position in sorted(chunks):
+        index[position] = offset, len(chunks[position])
+        offset += len(chunks[position])
+
+    return b"".join(chunks[position] for position in sorted(chunks)) + index.tobytes()
+
+
+def _decode_shard(data: bytes, size: int) -> dict[int, bytes]:
+    """Split a shard with room for `size` chunks into its chunks, by position."""
+    index = numpy.frombuffer(data, dtype="<u8", offset=len(data) - size * 16).reshape(size, 2)
+    return {
+        position: data[int(offset) : int(offset + nbytes)]
+        for position, (offset, nbytes) in enumerate(index)
+        if offset != _MISSING
+    }
+
+
+def _is_chunk(key: str) -> bool:
+    """Whether a Zarr key is for a chunk, as opposed to metadata."""
+    return not key.rsplit("/", 1)[-1].startswith(".")
+
+
+class LockedMapper(collections.abc.MutableMapping):
+    """Serializes access to a store which is not safe to use from more than one thread at a time.
+
+    Zarr encodes chunks in whatever thread dask runs a task in, then writes them to the store from that same thread.
+    Wrapping a HAMT in this mapper lets chunks be compressed in parallel while the HAMT itself is only ever updated by
+    one thread at a time.
+
+    Parameters
+    ----------
+    store : MutableMapping
+        The store to wrap.
+    """
+
+    def __init__(self, store: typing.MutableMapping):
+        self.store = store
+        self._lock = threading.RLock()
+
+    def __getitem__(self, key):
+        with self._lock:
+            return self.store[key]
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self.store[key] = value
+
+    def __delitem__(self, key):
+        with self._lock:
+            del self.store[key]
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self.store))
+
+    def __len__(self):
+        with self._lock:
+            return len(self.store)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self.store
@@ -0,0 +1,205 @@
+"""Overviews of a dataset at coarser resolutions, so clients displaying it at low zoom can read much less data.
+
+Overviews are described by `multiscales` metadata in the root attributes of the dataset, as added by the
+:func:`dc_etl.transformers.multiscales` transformer, following the multiscales convention used by ndpyramid and
+other Zarr map clients: a list of the datasets making up the pyramid, from the full resolution dataset at `.` down to
+the coarsest overview. Each overview is a complete dataset in a group next to the full resolution arrays, named for its
+coarsening factor, eg `overview_4`, which can be opened with :func:`open_overview` or
+`xarray.open_zarr(store, group="overview_4")`.
+
+Only the named spatial dimensions are coarsened, so each overview has the same time coordinate as the full resolution
+dataset, and data written for some span of time only changes the same span of each overview. Each overview is computed
+from the one before it, as read back from the store, the way GDAL builds overviews, so the source data is only read
+once however many overviews there are.
+"""
+
+from __future__ import annotations
+
+import collections
+import json
+import typing
+
+import xarray
+
+from numcodecs.compat import ensure_bytes
+
+from dc_etl.load import align_chunks, encoding_chunks
+
+ATTR = "multiscales"
+METHODS = ("mean", "max")
+
+
+def metadata(factors: typing.Sequence[int], dims: typing.Sequence[str], method: str = "mean") -> list[dict]:
+    """Make the `multiscales` metadata describing a pyramid of overviews.
+
+    Parameters
+    ----------
+    factors : Sequence[int]
+        Coarsening factor of each overview, eg `[2, 4, 8]`. Each factor must be a multiple of the one before it.
+    dims : Sequence[str]
+        Names of the dimensions to coarsen, eg `["latitude", "longitude"]`.
+    method : str
+        How the values covered by each value of an overview are aggregated, `"mean"` or `"max"`. Default is `"mean"`.
+
+    Returns
+    -------
+    list[dict] :
+        The metadata, to be stored in the dataset's attributes under the `multiscales` key.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unsupported method: {method}. Must be one of: {', '.join(METHODS)}")
+
+    previous = 1
+    for factor in factors:
+        if factor <= previous or factor % previous:
+            raise ValueError(f"Each factor must be a multiple of the one before it, got: {list(factors)}")
+        previous = factor
+
+    datasets = [{"path": ".", "factor": 1}]
+    datasets.extend({"path": overview_path(factor), "factor": factor} for factor in factors)
+    return [
+        {
+            "datasets": datasets,
+            "type": method,
+            "metadata": {"method": "xarray.Dataset.coarsen", "kwargs": {"dims": list(dims), "boundary": "pad"}},
+        }
+    ]
+
+
+def overview_path(factor: int) -> str:
+    """Name of the group an overview is stored in."""
+    return f"overview_{factor}"
+
+
+def update(
+    store: typing.MutableMapping,
+    time_dim: str,
+    start: int | None = None,
+    stop: int | None = None,
+    append: bool = False,
+):
+    """Update the overviews of a dataset after data has been written to it.
+
+    Does nothing if the dataset has no `multiscales` metadata. Overviews which don't exist yet, eg because the metadata
+    was added to an existing dataset, are built from scratch. The dataset's consolidated metadata is updated once, in
+    place, when every overview has been written.
+
+    Parameters
+    ----------
+    store : MutableMapping
+        The store the dataset was written to, with consolidated metadata. It must be safe to use from dask's worker
+        threads.
+    time_dim : str
+        Name of the time dimension.
+    start : int | None
+        Position along the time dimension of the first value written. `None`, the default, rewrites every overview
+        from scratch, eg after writing a new dataset.
+    stop : int | None
+        Position along the time dimension just after the last value written. Default is the end of the dataset.
+    append : bool
+        Whether the data was appended, in which case the overviews are appended to. Otherwise they are overwritten from
+        `start` to `stop`.
+    """
+    attrs = json.loads(ensure_bytes(store[".zattrs"])) if ".zattrs" in store else {}
+    if ATTR not in attrs:
+        return
+
+    multiscales = attrs[ATTR][0]
+    method = multiscales["type"]
+    dims = multiscales["metadata"]["kwargs"]["dims"]
+    datasets = multiscales["datasets"]
+
+    # Until the consolidated metadata is written, overviews are read back through the metadata consolidated so far
+    consolidated = json.loads(ensure_bytes(store[".zmetadata"]))
+    metadata = consolidated["metadata"]
+    for finer, coarser in zip(datasets, datasets[1:]):
+        group = None if finer["path"] == "." else finer["path"]
+        view = collections.ChainMap({".zmetadata": json.dumps(consolidated).encode()}, store)
+        source = xarray.open_zarr(view, group=group, consolidated=True)
+
+        path = coarser["path"]
+        rebuild = start is None or f"{path}/.zgroup" not in metadata
+        if not rebuild:
+            source = source.isel({time_dim: slice(start, stop)})
+
+        overview = _coarsen(source, {dim: coarser["factor"] // finer["factor"] for dim in dims}, method)
+        names = list(overview.variables)
+        if rebuild:
+            overview = align_chunks(overview, encoding_chunks(overview))
+            overview.to_zarr(store=store, group=path, mode="w", consolidated=False)
+            _consolidate(store, metadata, path, names)
+            continue
+
+        chunks = {name: tuple(metadata[f"{path}/{name}/.zarray"]["chunks"]) for name in names}
+        overview = align_chunks(overview, chunks, {time_dim: start})
+        if append:
+            overview.to_zarr(store=store, group=path, append_dim=time_dim, consolidated=False)
+
+        else:
+            overview = overview.drop_vars(
+                [
+                    name
+                    for name, variable in overview.variables.items()
+                    if time_dim not in variable.dims or name == time_dim
+                ]
+            )
+            # Dask chunks line up with Zarr chunks even where the region covers part of one. xarray can't check that.
+            overview.to_zarr(
+                store=store,
+                group=path,
+                region={time_dim: slice(start, start + overview.sizes[time_dim])},
+                consolidated=False,
+                safe_chunks=False,
+            )
+
+        _consolidate(store, metadata, path, names)
+
+    store[".zmetadata"] = json.dumps(consolidated, indent=4, sort_keys=True).encode()
+
+
+def open_overview(store: typing.Mapping, factor: int) -> xarray.Dataset:
+    """Open one of the overviews of a dataset.
+
+    Parameters
+    ----------
+    store : Mapping
+        The store the dataset is in.
+    factor : int
+        Coarsening factor of the overview.
+
+    Returns
+    -------
+    xarray.Dataset :
+        The overview.
+    """
+    return xarray.open_zarr(store, group=overview_path(factor), consolidated=True)
+
+
+def _coarsen(dataset: xarray.Dataset, windows: dict[str, int], method: str) -> xarray.Dataset:
+    """Coarsen a dataset read from Zarr, keeping the encoding it needs to be written as an overview."""
+    windows = {dim: size for dim, size in windows.items() if dim in dataset.dims}
+    overview = getattr(dataset.coarsen(windows, boundary="pad", coord_func="mean"), method)()
+    overview.attrs.pop(ATTR, None)
+    for name, variable in overview.variables.items():
+        encoding = dataset[name].encoding
+        variable.encoding = {key: encoding[key] for key in ("compressor", "filters") if key in encoding}
+
+        # The same chunk shape as the dataset it was coarsened from, so fewer chunks cover the same area
+        variable.encoding["chunks"] = tuple(
+            min(chunk, size) for chunk, size in zip(encoding["chunks"], variable.shape)
+        )
+
+    return overview
+
+
+def _consolidate(store, metadata, path, names):
+    """Replace an overview's consolidated metadata with what was just written, without listing the whole store."""
+    for key in [key for key in metadata if key.startswith(f"{path}/")]:
+        del metadata[key]
+
+    keys = [f"{path}/.zgroup", f"{path}/.zattrs"]
+    for name in names:
+        keys.extend((f"{path}/{name}/.zarray", f"{path}/{name}/.zattrs"))
+
+    for key in keys:
+        metadata[key] = json.loads(ensure_bytes(store[key]))
@@ -1,15 +1,24 @@
 from __future__ import annotations
 
+import itertools
 import pathlib
+import typing
 
-from dc_etl.combine import Combiner
+from dc_etl.assessor import Assessment
 from dc_etl.config import _Configuration
-from dc_etl.extract import Extractor
-from dc_etl.fetch import Fetcher
-from dc_etl.filespec import FileSpec, file
-from dc_etl.load import Loader
-from dc_etl.transform import Transformer, identity
-from dc_etl.assessor import Assessor
+from dc_etl.fetch import Timespan
+from dc_etl.transform import identity
+
+if typing.TYPE_CHECKING:  # pragma NO COVER
+    import xarray
+
+    from dc_etl.assessor import Assessor
+    from dc_etl.combine import Combiner
+    from dc_etl.extract import Extractor
+    from dc_etl.fetch import Fetcher
+    from dc_etl.filespec import FileSpec
+    from dc_etl.load import Loader
+    from dc_etl.transform import Transformer
 
 
 class Pipeline:
@@ -34,6 +43,8 @@ class Pipeline:
     @classmethod
     def from_yaml(cls, path: pathlib.Path | FileSpec) -> Pipeline:
         """Import configuration from a yaml file."""
+        from dc_etl.filespec import FileSpec, file
+
         if not isinstance(path, FileSpec):
             path = file(path)
 
@@ -69,3 +80,76 @@ class Pipeline:
         self.combiner = combiner
         self.transformer = transformer
         self.loader = loader
+
+    def assess(self, **kwargs) -> Assessment:
+        """Ask the assessor what needs to be done to bring the dataset up to date.
+
+        The assessor is passed the pipeline's `fetcher` and `loader`. If it only says whether the pipeline should run,
+        rather than returning an :class:`Assessment`, the remote timespan is compared with the published dataset, as
+        :class:`dc_etl.assessors.freshness.FreshnessAssessor` does without remote state.
+        """
+        assessment = self.assessor.start(fetcher=self.fetcher, loader=self.loader, **kwargs)
+        if isinstance(assessment, Assessment):
+            return assessment
+
+        if not assessment:
+            return Assessment()
+
+        from dc_etl.assessors.freshness import FreshnessAssessor
+
+        return FreshnessAssessor(replace=False, state=False).start(fetcher=self.fetcher, loader=self.loader)
+
+    def run(self, **kwargs) -> Assessment:
+        """Bring the dataset up to date with its source.
+
+        The assessor is consulted first, see :meth:`assess`, and nothing is fetched or extracted unless it finds
+        something to do. Changed spans are replaced, then new data appended, each in a single pass. The remote state
+        the assessment was made from is passed to the loader as `state` with the last of these, to be recorded for the
+        next assessment once everything has been loaded.
+
+        Returns
+        -------
+        Assessment :
+            What was done.
+        """
+        assessment = self.assess(**kwargs)
+
+        # Only the last step records the state, so that if any step fails, the next assessment still finds its work
+        if assessment.append is not None:
+            last = "append"
+        elif assessment.replace:
+            last = "replace"
+        else:
+            last = "initial"
+
+        def state(step):
+            return assessment.state if step == last else None
+
+        if assessment.initial is not None:
+            self.loader.initial(self.prepare([assessment.initial]), assessment.initial, state=state("initial"))
+
+        if assessment.replace:
+            dataset = self.prepare(assessment.replace)
+            self.loader.replace_many(dataset, assessment.replace, state=state("replace"))
+
+        if assessment.append is not None:
+            self.loader.append(self.prepare([assessment.append]), assessment.append, state=state("append"))
+
+        return assessment
+
+    def prepare(self, spans: typing.Sequence[Timespan]) -> xarray.Dataset:
+        """Fetch, extract, combine, and transform the source data for one or more spans.
+
+        Parameters
+        ----------
+        spans : Sequence[Timespan]
+            The spans to prepare, in time order.
+
+        Returns
+        -------
+        xarray.Dataset :
+            The transformed dataset, covering at least the given spans.
+        """
+        sources = itertools.chain(*[self.fetcher.fetch(span) for span in spans])
+        extracted = list(itertools.chain(*[self.extractor(source) for source in sources]))
+        return self.transformer(self.combiner(extracted))
@@ -0,0 +1,288 @@
+"""Summary statistics of the data variables in a dataset, computed in the same pass that writes it.
+
+Statistics are computed for each chunk of data as it is written, then merged, so the data is only read once. Merging
+uses the pairwise update of Chan, Golub, and LeVeque, which is numerically stable, so statistics for data appended
+later can be merged with the totals for the data already written without reading it again. When data is replaced, only
+the data replaced is read again, so that its statistics can be taken out of the totals.
+"""
+
+from __future__ import annotations
+
+import functools
+import typing
+import uuid
+
+import dask
+import numpy
+import xarray
+
+
+class Statistics(typing.NamedTuple):
+    """Summary statistics of some data.
+
+    Attributes
+    ----------
+    count : int
+        Number of values which aren't NaN.
+    nan_count : int
+        Number of NaN values.
+    minimum : float
+        The smallest value, or NaN if there are no values or it isn't known, eg because the data it was in has been
+        replaced.
+    maximum : float
+        The largest value, or NaN if there are no values or it isn't known.
+    mean : float
+        The mean of the values, or NaN if there are no values.
+    m2 : float
+        The sum of the squared differences of the values from their mean. Kept so that statistics can be merged.
+    """
+
+    count: int = 0
+    nan_count: int = 0
+    minimum: float = numpy.nan
+    maximum: float = numpy.nan
+    mean: float = numpy.nan
+    m2: float = 0.0
+
+    @classmethod
+    def of(cls, values: numpy.ndarray) -> Statistics:
+        """Compute the statistics of an array of values."""
+        values = numpy.asarray(values)
+        nan_count = 0
+        if numpy.issubdtype(values.dtype, numpy.inexact):
+            nans = numpy.isnan(values)
+            nan_count = int(nans.sum())
+            if nan_count:
+                values = values[~nans]
+
+        if not values.size:
+            return cls(nan_count=nan_count)
+
+        mean = values.mean(dtype=numpy.float64)
+        return cls(
+            count=int(values.size),
+            nan_count=nan_count,
+            minimum=float(values.min()),
+            maximum=float(values.max()),
+            mean=float(mean),
+            m2=float(numpy.square(values - mean, dtype=numpy.float64).sum()),
+        )
+
+    @property
+    def variance(self) -> float:
+        """The population variance of the values, or NaN if there are no values."""
+        return self.m2 / self.count if self.count else numpy.nan
+
+    def merge(self, other: Statistics) -> Statistics:
+        """Combine these statistics with those of other values, as if they had been computed over all of them."""
+        if not other.count:
+            return self._replace(nan_count=self.nan_count + other.nan_count)
+
+        if not self.count:
+            return other._replace(nan_count=self.nan_count + other.nan_count)
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        return Statistics(
+            count=count,
+            nan_count=self.nan_count + other.nan_count,
+            # An unknown minimum or maximum, NaN, stays unknown
+            minimum=float(numpy.minimum(self.minimum, other.minimum)),
+            maximum=float(numpy.maximum(self.maximum, other.maximum)),
+            mean=self.mean + delta * other.count / count,
+            m2=self.m2 + other.m2 + delta * delta * self.count * other.count / count,
+        )
+
+    def remove(self, other: Statistics) -> Statistics:
+        """Take the statistics of some of the values out of these statistics, undoing :meth:`merge`.
+
+        The minimum and maximum can't be undone, so they are left as they are. They are still right if `other` doesn't
+        have the smallest or largest value.
+        """
+        count = self.count - other.count
+        nan_count = self.nan_count - other.nan_count
+        if not other.count:
+            return self._replace(nan_count=nan_count)
+
+        if not count:
+            return Statistics(nan_count=nan_count)
+
+        mean = (self.mean * self.count - other.mean * other.count) / count
+        delta = other.mean - mean
+        m2 = self.m2 - other.m2 - delta * delta * count * other.count / self.count
+        return self._replace(count=count, nan_count=nan_count, mean=mean, m2=max(m2, 0.0))
+
+    def to_dict(self) -> dict:
+        """Convert to a JSON serializable dict, with `None` in place of NaN."""
+        return {name: None if value != value else value for name, value in self._asdict().items()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> Statistics:
+        """Convert back from a dict made by :meth:`to_dict`."""
+        return cls(**{name: numpy.nan if value is None else value for name, value in data.items()})
+
+
+def to_zarr(dataset: xarray.Dataset, blocks: dict | None = None, **kwargs) -> dict[str, Statistics]:
+    """Write a dataset to Zarr, computing the statistics of its numeric data variables in the same pass.
+
+    Variables backed by dask are observed chunk by chunk as they are written, so no chunk is read more than once. This
+    needs a scheduler which runs tasks in this process, eg "threads" or "synchronous". Other variables are already in
+    memory, so their statistics are computed directly.
+
+    Parameters
+    ----------
+    dataset : xarray.Dataset
+        The dataset to write.
+    blocks : dict | None
+        If given, the statistics of each dask chunk written are added to it, by variable name, then by the chunk's
+        location in `dataset`, as a tuple of `(start, stop)` pairs, one for each dimension of the variable.
+    **kwargs
+        Passed to :meth:`xarray.Dataset.to_zarr`.
+
+    Returns
+    -------
+    dict[str, Statistics] :
+        The statistics of each numeric data variable, by name.
+    """
+    statistics = {}
+    observed = {}
+    observing = dataset.copy()
+    for name, variable in dataset.data_vars.items():
+        if not (numpy.issubdtype(variable.dtype, numpy.number) or variable.dtype == bool):
+            continue
+
+        if variable.chunks:
+            # A unique name, so the chunks of variables which share data are each observed
+            chunks = observed[name] = {}
+            data = variable.data.map_blocks(
+                functools.partial(_observe, chunks), dtype=variable.dtype, name=f"observe-{uuid.uuid4().hex}"
+            )
+            observing[name] = variable.copy(data=data)
+        else:
+            statistics[name] = Statistics.of(variable.values)
+
+    observing.to_zarr(**kwargs)
+    for name, chunks in observed.items():
+        # In order of the chunks' locations, so the result doesn't depend on the order chunks were written in
+        statistics[name] = functools.reduce(Statistics.merge, (chunks[key] for key in sorted(chunks)), Statistics())
+        if blocks is not None:
+            blocks[name] = chunks
+
+    return statistics
+
+
+def of(dataset: xarray.Dataset) -> dict[str, Statistics]:
+    """Compute the statistics of the numeric data variables of a dataset, eg of data about to be replaced.
+
+    Variables backed by dask are read a chunk at a time, using dask's current scheduler.
+
+    Parameters
+    ----------
+    dataset : xarray.Dataset
+        The dataset to summarize.
+
+    Returns
+    -------
+    dict[str, Statistics] :
+        The statistics of each numeric data variable, by name.
+    """
+    statistics = {}
+    for name, variable in dataset.data_vars.items():
+        if not (numpy.issubdtype(variable.dtype, numpy.number) or variable.dtype == bool):
+            continue
+
+        if variable.chunks:
+            chunks = dask.compute(*(dask.delayed(Statistics.of)(chunk) for chunk in variable.data.to_delayed().flat))
+            statistics[name] = functools.reduce(Statistics.merge, chunks, Statistics())
+        else:
+            statistics[name] = Statistics.of(variable.values)
+
+    return statistics
+
+
+def combine(first: dict[str, Statistics], second: dict[str, Statistics]) -> dict[str, Statistics]:
+    """Merge the statistics of two lots of data, eg two regions written, variable by variable."""
+    return {name: first.get(name, Statistics()).merge(second.get(name, Statistics())) for name in {**first, **second}}
+
+
+def totals(
+    statistics: dict[str, Statistics] | None,
+    manifest: dict | None = None,
+    append: bool = False,
+    replaced: dict[str, Statistics] | None = None,
+    bounds: dict[str, tuple[float, float] | None] | None = None,
+) -> dict[str, dict] | None:
+    """Work out the statistics of a whole dataset, for its manifest, after data has been written to it.
+
+    Parameters
+    ----------
+    statistics : dict[str, Statistics] | None
+        The statistics of the data just written, or `None` if they weren't computed.
+    manifest : dict | None
+        When data has been appended or replaced, the manifest of the dataset it was written to, whose `statistics` are
+        the totals so far.
+    append : bool
+        Whether the data was appended to an existing dataset, rather than written to a new one.
+    replaced : dict[str, Statistics] | None
+        When data has been replaced, the statistics of the data it replaced, see :func:`of`. These are taken out of the
+        totals so far before the statistics of the data written are merged in.
+    bounds : dict[str, tuple[float, float] | None] | None
+        When data has been replaced, the smallest and largest values of any variables, once replaced, if known, eg
+        from the chunk index, see :func:`dc_etl.chunk_index.bounds`. Otherwise, if the data replaced had a variable's
+        smallest or largest value, that is no longer known, and is left out of its totals.
+
+    Returns
+    -------
+    dict[str, dict] | None :
+        The totals for each variable, as made by :meth:`Statistics.to_dict`, or `None` if they aren't known, because
+        statistics weren't computed or there are no totals for the data appended to or replaced.
+    """
+    if statistics is None:
+        return None
+
+    previous = {}
+    if append or replaced is not None:
+        previous = (manifest or {}).get("statistics")
+        if previous is None:
+            return None
+
+    if replaced is not None:
+        return _replace_totals(statistics, previous, replaced, bounds or {})
+
+    merged = {}
+    for name, stats in statistics.items():
+        if name in previous:
+            stats = Statistics.from_dict(previous[name]).merge(stats)
+        merged[name] = stats.to_dict()
+
+    return merged
+
+
+def _replace_totals(statistics, previous, replaced, bounds):
+    """Work out the totals after data has been replaced, for :func:`totals`."""
+    merged = {}
+    for name, total in previous.items():
+        if name not in statistics:
+            merged[name] = total
+            continue
+
+        total = Statistics.from_dict(total)
+        old = replaced[name]
+        rest = total.remove(old)
+        stats = rest.merge(statistics[name])
+        if rest.count and old.count:
+            # The rest of the data's minimum and maximum are only known if the data replaced didn't have them
+            lowest, highest = bounds.get(name) or (numpy.nan, numpy.nan)
+            if not old.minimum > total.minimum:
+                stats = stats._replace(minimum=lowest)
+            if not old.maximum < total.maximum:
+                stats = stats._replace(maximum=highest)
+        merged[name] = stats.to_dict()
+
+    return merged
+
+
+def _observe(observed: dict, chunk: numpy.ndarray, block_info=None) -> numpy.ndarray:
+    """Record the statistics of a chunk, by its location, and pass it on unchanged."""
+    observed[tuple(map(tuple, block_info[None]["array-location"]))] = Statistics.of(chunk)
+    return chunk
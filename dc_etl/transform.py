@@ -1,6 +1,10 @@
+from __future__ import annotations
+
 import abc
+import typing
 
-import xarray
+if typing.TYPE_CHECKING:  # pragma NO COVER
+    import xarray
 
 
 class Transformer(abc.ABC):
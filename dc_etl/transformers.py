@@ -1,6 +1,9 @@
+import typing
+
 import numcodecs
 import xarray
 
+from . import multiscale
 from .transform import Transformer
 
 
@@ -94,3 +97,37 @@ def compress(variables: list[str]) -> Transformer:
         return dataset
 
     return compress
+
+
+def multiscales(
+    factors: typing.Sequence[int] = (2, 4, 8),
+    dims: typing.Sequence[str] = ("latitude", "longitude"),
+    method: str = "mean",
+) -> Transformer:
+    """Transformer to have loaders write coarser overviews of a dataset alongside it, for display at low zoom.
+
+    Adds `multiscales` metadata describing the overviews to the dataset's attributes. Loaders which find it in a
+    dataset they write build the overviews from the data written, see :mod:`dc_etl.multiscale`.
+
+    Parameters
+    ----------
+    factors : Sequence[int]
+        Coarsening factor of each overview. Each factor must be a multiple of the one before it. Default is
+        `(2, 4, 8)`.
+    dims : Sequence[str]
+        Names of the dimensions to coarsen. Default is `("latitude", "longitude")`.
+    method : str
+        How values are aggregated, `"mean"` or `"max"`. Default is `"mean"`.
+
+    Returns
+    -------
+    Transformer :
+        The transformer.
+    """
+    metadata = multiscale.metadata(factors, dims, method)
+
+    def multiscales(dataset: xarray.Dataset, **kwargs) -> xarray.Dataset:
+        dataset.attrs[multiscale.ATTR] = metadata
+        return dataset
+
+    return multiscales
@@ -4,20 +4,33 @@ ETL Pipeline for {name}
 Usage:
     {script} [options] init
     {script} [options] append
+    {script} [options] backfill
+    {script} [options] update
+    {script} [options] watch
     {script} interact
 
 Options:
     -h --help         Show this screen.
     --timespan SPAN   How much data to load along the time axis. [default: 5Y]
+    --window SPAN     How much data each worker prepares at a time when backfilling. [default: 1Y]
+    --workers N       Number of worker processes to prepare data with when backfilling. [default: 4]
+    --interval SECS   Seconds between polls for new data when watching. [default: 3600]
+    --jitter FRACTION Vary each interval randomly by up to this fraction of it. [default: 0.1]
     --overwrite       Allow data to be overwritten.
     --pdb             Drop into debugger on error.
 """
 
 import code
+import collections
+import concurrent.futures
 import datetime
 import itertools
+import multiprocessing
 import pdb
+import random
 import sys
+import time
+import traceback
 
 import docopt
 import numpy
@@ -29,6 +42,10 @@ from dc_etl.pipeline import Pipeline
 
 ONE_DAY = relativedelta(days=1)
 
+# The pipeline used by backfill workers. Pipelines can contain closures, so can't be pickled and sent to workers, but
+# are inherited by forked processes.
+_PIPELINE = None
+
 
 def main(pipeline: Pipeline):
     args = _parse_args()
@@ -49,18 +66,41 @@ def main(pipeline: Pipeline):
             if not cid:
                 raise docopt.DocoptExit("Dataset has not been initialized.")
 
+            if not append(pipeline, _parse_timedelta(args["--timespan"])):
+                print("No more data to load.")
+
+        elif args["backfill"]:
             timedelta = _parse_timedelta(args["--timespan"])
             remote_span = pipeline.fetcher.get_remote_timespan()
-            existing = pipeline.loader.dataset()
-            existing_end = existing.time[-1].values
-            if existing_end >= remote_span.end:
-                print("No more data to load.")
-                return
+            if cid:
+                existing_end = _existing_end(pipeline)
+                if existing_end >= remote_span.end:
+                    print("No more data to load.")
+                    return
+
+                load_begin = _add_delta(existing_end, ONE_DAY)
+            else:
+                load_begin = remote_span.start
 
-            load_begin = _add_delta(existing_end, ONE_DAY)
             load_end = _add_delta(load_begin, timedelta - ONE_DAY)
             load_span = Timespan(load_begin, min(load_end, remote_span.end))
-            run_pipeline(pipeline, load_span, pipeline.loader.append)
+            window = _parse_timedelta(args["--window"])
+            backfill(pipeline, load_span, window, int(args["--workers"]), initial=not cid)
+
+        elif args["update"]:
+            if not cid:
+                raise docopt.DocoptExit("Dataset has not been initialized.")
+
+            assessment = pipeline.run()
+            if assessment.nothing:
+                print("No more data to load.")
+
+        elif args["watch"]:
+            if not cid:
+                raise docopt.DocoptExit("Dataset has not been initialized.")
+
+            timedelta = _parse_timedelta(args["--timespan"])
+            watch(pipeline, timedelta, float(args["--interval"]), float(args["--jitter"]))
 
         else:
             dataset = pipeline.loader.dataset()
@@ -73,15 +113,112 @@ def main(pipeline: Pipeline):
 
 
 def run_pipeline(pipeline, span, load):
+    _print_span(span)
+    pipeline.assessor.start(fetcher=pipeline.fetcher, loader=pipeline.loader)
+    load(pipeline.prepare([span]), span)
+
+
+def append(pipeline, timedelta):
+    """Append the next span of new data, if there is any.
+
+    Returns whether anything was appended.
+    """
+    remote_span = pipeline.fetcher.get_remote_timespan()
+    existing_end = _existing_end(pipeline)
+    if existing_end >= remote_span.end:
+        return False
+
+    load_begin = _add_delta(existing_end, ONE_DAY)
+    load_end = _add_delta(load_begin, timedelta - ONE_DAY)
+    load_span = Timespan(load_begin, min(load_end, remote_span.end))
+    run_pipeline(pipeline, load_span, pipeline.loader.append)
+    return True
+
+
+def watch(pipeline, timedelta, interval, jitter):
+    """Poll for new data and append it as it appears, until interrupted.
+
+    The pipeline stays in memory between polls, along with the fetcher's connection and any caches the loader keeps.
+    Each poll only gets the fetcher's remote state, eg a listing of the remote files, and the rest of the pipeline only
+    runs when that has changed. Polls are spread randomly around the interval, so that watchers started at the same
+    time don't keep polling at the same time.
+    """
+    state = None
+    while True:
+        try:
+            polled = pipeline.fetcher.get_remote_state()
+            if polled is None or polled != state:
+                while append(pipeline, timedelta):
+                    pass
+
+                # Not updated if appending fails, so that the next poll tries again
+                state = polled
+
+        except Exception:
+            traceback.print_exc()
+
+        time.sleep(interval * random.uniform(1 - jitter, 1 + jitter))
+
+
+def backfill(pipeline, span, window, workers, initial):
+    """Load a long span one window at a time, preparing several windows at once in worker processes.
+
+    Fetching, extracting, combining, and transforming, as well as reading the data, happen in the workers. Windows are
+    loaded strictly in time order, each only after the one before it, so the result is the same as loading them one
+    after another.
+    """
+    global _PIPELINE
+    _PIPELINE = pipeline
+    pipeline.assessor.start(fetcher=pipeline.fetcher, loader=pipeline.loader)
+    windows = _windows(span, window)
+    loads = itertools.chain([pipeline.loader.initial] if initial else [], itertools.repeat(pipeline.loader.append))
+
+    context = multiprocessing.get_context("fork")
+    with concurrent.futures.ProcessPoolExecutor(workers, mp_context=context) as pool:
+        # Only a couple of windows per worker are prepared ahead of loading, so prepared data doesn't pile up in memory
+        pending = collections.deque(
+            (ahead, pool.submit(_prepare_window, ahead)) for ahead in itertools.islice(windows, workers * 2)
+        )
+        while pending:
+            current, future = pending.popleft()
+            dataset = future.result()
+            _print_span(current)
+            next(loads)(dataset, current)
+
+            ahead = next(windows, None)
+            if ahead is not None:
+                pending.append((ahead, pool.submit(_prepare_window, ahead)))
+
+
+def _prepare_window(span):
+    """Prepare one window for backfill. Run in a worker process."""
+    return _PIPELINE.prepare([span]).load()
+
+
+def _windows(span, window):
+    """Split a span into consecutive windows."""
+    start = span.start
+    while start <= span.end:
+        end = min(_add_delta(start, window - ONE_DAY), span.end)
+        yield Timespan(start, end)
+        start = _add_delta(end, ONE_DAY)
+
+
+def _print_span(span):
     print(
         f"Loading {span.start.astype('<M8[s]').astype(object):%Y-%m-%d} "
         f"to {span.end.astype('<M8[s]').astype(object):%Y-%m-%d}"
     )
-    pipeline.assessor.start()
-    sources = pipeline.fetcher.fetch(span)
-    extracted = list(itertools.chain(*[pipeline.extractor(source) for source in sources]))
-    combined = pipeline.transformer(pipeline.combiner(extracted))
-    load(combined, span)
+
+
+def _existing_end(pipeline):
+    # The manifest is published with the CID, so doesn't require reading the dataset itself
+    manifest = pipeline.loader.manifest()
+    if manifest is not None:
+        return numpy.datetime64(manifest["time"]["end"])
+
+    existing = pipeline.loader.dataset()
+    return existing.time[-1].values
 
 
 def _parse_args():
@@ -35,7 +35,7 @@ def cover(session):
 def lint(session):
     session.install("black", "flake8", "flake8-pyproject")
     run_black(session, check=True)
-    session.run("flake8", CODE, "tests")
+    session.run("flake8", CODE, "tests", "benchmarks")
 
 
 @nox.session(py=DEFAULT_INTERPRETER)
@@ -49,7 +49,7 @@ def run_black(session, check=False):
     args = ["black"]
     if check:
         args.append("--check")
-    args.extend(["noxfile.py", CODE, "tests"])
+    args.extend(["noxfile.py", CODE, "tests", "benchmarks"])
     session.run(*args)
 
 
@@ -70,6 +70,22 @@ def system(session):
     )
 
 
+# Benchmarks are opt in, eg `nox -s benchmark memory`, so running `nox` on its own only runs the checks it always has.
+# CI runs the memory session as a separate step, since it measures against a committed baseline.
+@nox.session(py=DEFAULT_INTERPRETER, default=False)
+def benchmark(session):
+    # Arguments after `--` are passed through, eg `nox -s benchmark -- --scale large --save-baseline`
+    session.install("-e", ".")
+    session.run("python", "-m", "benchmarks", *session.posargs)
+
+
+@nox.session(py=DEFAULT_INTERPRETER, default=False)
+def memory(session):
+    # Fails if peak memory, or how it scales with the size of the input, has regressed since the committed baseline
+    session.install("-e", ".")
+    session.run("python", "-m", "benchmarks.memory", *session.posargs)
+
+
 # @nox.session(py=DEFAULT_INTERPRETER)
 # def doc(session):
 #     session.install("-e", ".[doc]")
@@ -0,0 +1,313 @@
+"""A local stand-in for an FTP server like CPC's, for testing and benchmarking fetchers without a network."""
+
+from __future__ import annotations
+
+import collections
+import datetime
+import pathlib
+import socket
+import socketserver
+import threading
+import time
+
+
+class FTPServer:
+    """A read only FTP server on the loopback interface that serves the files in a local folder.
+
+    Only the commands that `ftplib` and fsspec's FTP filesystem use to list and download files are implemented, in
+    passive mode only. Anonymous logins are accepted.
+
+    Network conditions can be injected, and may be changed while the server is running.
+
+    Parameters
+    ----------
+    root : str | pathlib.Path
+        The folder to serve, which becomes `/` on the server.
+    latency : float
+        Seconds to wait before each reply to a command, to simulate the round trip time to a distant server.
+    bandwidth : int | None
+        Maximum bytes per second sent by each file transfer, or `None` for no limit.
+    drop_after : int | None
+        Drop the connection, without a reply, after sending this many bytes of a file, or `None` to never drop
+        connections.
+    drops : int | None
+        Number of connections to drop before transfers are allowed to finish again, or `None` to drop every transfer
+        which reaches `drop_after`.
+
+    Attributes
+    ----------
+    host : str
+        The address the server is listening on, once started.
+    port : int
+        The port the server is listening on, once started.
+    commands : collections.Counter
+        Number of times each command has been received, eg `commands["RETR"]`.
+    connections : int
+        Number of control connections accepted.
+    bytes_sent : int
+        Number of bytes of file data and listings sent.
+    """
+
+    def __init__(
+        self,
+        root: str | pathlib.Path,
+        latency: float = 0.0,
+        bandwidth: int | None = None,
+        drop_after: int | None = None,
+        drops: int | None = None,
+    ):
+        self.root = pathlib.Path(root).resolve()
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.drop_after = drop_after
+        self.drops = drops
+        self.commands = collections.Counter()
+        self.connections = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def host(self) -> str:
+        return self._server.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self) -> FTPServer:
+        """Start serving in a background thread."""
+        self._server = _TCPServer(("127.0.0.1", 0), _Handler)
+        self._server.ftp = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the listening socket."""
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def reset_stats(self):
+        """Zero the command, connection, and byte counts."""
+        with self._lock:
+            self.commands.clear()
+            self.connections = 0
+            self.bytes_sent = 0
+
+    def __enter__(self) -> FTPServer:
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _count(self, command=None, sent=0, connection=False):
+        with self._lock:
+            if command is not None:
+                self.commands[command] += 1
+            self.bytes_sent += sent
+            self.connections += connection
+
+    def _should_drop(self, sent: int) -> bool:
+        with self._lock:
+            if self.drop_after is None or sent < self.drop_after or self.drops == 0:
+                return False
+
+            if self.drops is not None:
+                self.drops -= 1
+
+            return True
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Dropped(Exception):
+    """Raised to drop a connection."""
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Handles one control connection."""
+
+    def setup(self):
+        super().setup()
+
+        # ftplib sends ABOR as urgent data, which would otherwise be left out of the normal stream
+        self.request.setsockopt(socket.SOL_SOCKET, socket.SO_OOBINLINE, 1)
+        self.ftp = self.server.ftp
+        self.cwd = "/"
+        self.rest = 0
+        self.passive = None
+
+    def handle(self):
+        self.ftp._count(connection=True)
+        self.reply("220 Service ready")
+        try:
+            for line in self.rfile:
+                # Anything before the command, eg the telnet interrupt sent with ABOR, is ignored
+                command, _, arg = line.decode("utf-8", "replace").strip().lstrip("\xff\xf4\xf2").partition(" ")
+                command = command.upper()
+                self.ftp._count(command)
+                method = getattr(self, f"ftp_{command}", None)
+                if method is None:
+                    self.reply(f"502 {command} not implemented")
+                elif method(arg) is False:
+                    break
+
+        except (_Dropped, ConnectionError):
+            pass
+
+        finally:
+            if self.passive is not None:
+                self.passive.close()
+
+    def reply(self, line: str):
+        if self.ftp.latency:
+            time.sleep(self.ftp.latency)
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def ftp_USER(self, arg):
+        self.reply("331 Send password")
+
+    def ftp_PASS(self, arg):
+        self.reply("230 Logged in")
+
+    def ftp_QUIT(self, arg):
+        self.reply("221 Bye")
+        return False
+
+    def ftp_NOOP(self, arg):
+        self.reply("200 OK")
+
+    def ftp_TYPE(self, arg):
+        self.reply(f"200 Type set to {arg}")
+
+    def ftp_PWD(self, arg):
+        self.reply(f'257 "{self.cwd}"')
+
+    def ftp_CWD(self, arg):
+        path = self._path(arg)
+        if path is None or not path.is_dir():
+            self.reply(f"550 {arg}: No such directory")
+        else:
+            self.cwd = "/" + path.relative_to(self.ftp.root).as_posix().lstrip(".")
+            self.reply("250 OK")
+
+    def ftp_SIZE(self, arg):
+        path = self._path(arg)
+        if path is None or not path.is_file():
+            self.reply(f"550 {arg}: No such file")
+        else:
+            self.reply(f"213 {path.stat().st_size}")
+
+    def ftp_MDTM(self, arg):
+        path = self._path(arg)
+        if path is None or not path.exists():
+            self.reply(f"550 {arg}: No such file")
+        else:
+            self.reply(f"213 {_timestamp(path)}")
+
+    def ftp_REST(self, arg):
+        self.rest = int(arg)
+        self.reply(f"350 Restarting at {self.rest}")
+
+    def ftp_ABOR(self, arg):
+        self.reply("226 Abort successful")
+
+    def ftp_PASV(self, arg):
+        if self.passive is not None:
+            self.passive.close()
+
+        self.passive = socket.create_server(("127.0.0.1", 0))
+        host, port = self.passive.getsockname()
+        self.reply(f"227 Entering Passive Mode ({host.replace('.', ',')},{port >> 8},{port & 0xFF})")
+
+    def ftp_EPSV(self, arg):
+        if self.passive is not None:
+            self.passive.close()
+
+        self.passive = socket.create_server(("127.0.0.1", 0))
+        self.reply(f"229 Entering Extended Passive Mode (|||{self.passive.getsockname()[1]}|)")
+
+    def ftp_MLSD(self, arg):
+        path = self._path(arg or self.cwd)
+        if path is None or not path.is_dir():
+            self.reply(f"550 {arg}: No such directory")
+            return
+
+        lines = []
+        for child in sorted(path.iterdir()):
+            if child.is_dir():
+                facts = f"type=dir;modify={_timestamp(child)};"
+            else:
+                facts = f"type=file;size={child.stat().st_size};modify={_timestamp(child)};"
+            lines.append(f"{facts} {child.name}\r\n")
+
+        self._send(b"".join(line.encode() for line in lines))
+
+    def ftp_RETR(self, arg):
+        path = self._path(arg)
+        rest, self.rest = self.rest, 0
+        if path is None or not path.is_file():
+            self.reply(f"550 {arg}: No such file")
+            return
+
+        with open(path, "rb") as f:
+            f.seek(rest)
+            self._send(f.read(), drop=True)
+
+    def _send(self, data: bytes, drop: bool = False):
+        """Send data over the passive data connection, subject to the configured bandwidth and dropped connections."""
+        if self.passive is None:
+            self.reply("425 Use PASV first")
+            return
+
+        self.reply("150 Opening data connection")
+        passive, self.passive = self.passive, None
+        with passive:
+            conn, _ = passive.accept()
+
+        sent = 0
+        started = time.monotonic()
+        try:
+            with conn:
+                while sent < len(data):
+                    block = data[sent : sent + (1 << 14)]
+                    conn.sendall(block)
+                    sent += len(block)
+                    self.ftp._count(sent=len(block))
+
+                    if drop and self.ftp._should_drop(sent):
+                        raise _Dropped
+
+                    bandwidth = self.ftp.bandwidth
+                    if bandwidth:
+                        ahead = sent / bandwidth - (time.monotonic() - started)
+                        if ahead > 0:
+                            time.sleep(ahead)
+
+        except (BrokenPipeError, ConnectionResetError):
+            # The client closed the data connection early, eg to read only part of a file
+            self.reply("426 Connection closed; transfer aborted")
+            return
+
+        self.reply("226 Transfer complete")
+
+    def _path(self, arg: str) -> pathlib.Path | None:
+        """Resolve a path on the server to a path in the served folder, or `None` if it's outside of it."""
+        path = arg if arg.startswith("/") else f"{self.cwd.rstrip('/')}/{arg}"
+        resolved = (self.ftp.root / path.lstrip("/")).resolve()
+        if resolved != self.ftp.root and self.ftp.root not in resolved.parents:
+            return None
+
+        return resolved
+
+
+def _timestamp(path: pathlib.Path) -> str:
+    """Modification time of a file in the format used by MLSD and MDTM."""
+    mtime = datetime.datetime.fromtimestamp(path.stat().st_mtime, datetime.timezone.utc)
+    return mtime.strftime("%Y%m%d%H%M%S")
@@ -0,0 +1,122 @@
+"""Generators of synthetic source data, for testing and benchmarking without real data."""
+
+from __future__ import annotations
+
+import pathlib
+import typing
+
+import numpy
+import xarray
+
+# The fill value used by CPC's files
+FILL_VALUE = -9.96921e36
+
+
+class Scale(typing.NamedTuple):
+    """The size of a synthetic dataset."""
+
+    name: str
+    """Used to identify results at this scale."""
+
+    years: int
+    """Number of yearly files."""
+
+    lat: int
+    """Number of latitudes in the grid."""
+
+    lon: int
+    """Number of longitudes in the grid."""
+
+    chunks: tuple[int, int, int] | None = None
+    """Chunk shape, as (time, lat, lon), of the NetCDF files. The default is one day per chunk, the same as CPC."""
+
+
+SCALES = {
+    scale.name: scale
+    for scale in (
+        Scale("tiny", 1, 36, 72),
+        Scale("small", 2, 90, 180),
+        Scale("medium", 3, 180, 360),
+        Scale("large", 5, 360, 720),
+    )
+}
+
+
+def cpc_files(
+    folder: str | pathlib.Path,
+    years: int,
+    lat: int,
+    lon: int,
+    chunks: tuple[int, int, int] | None = None,
+    start_year: int = 1979,
+    seed: int = 0,
+) -> list[pathlib.Path]:
+    """Write yearly NetCDF4 files that look like CPC's global precipitation files.
+
+    Files are named `precip.YYYY.nc` and contain one `precip` variable of daily values on a `(time, lat, lon)` grid,
+    with longitudes from 0 to 360 and latitudes from north to south. As with CPC, cells over the ocean are always
+    missing. Files which already exist in `folder` are reused, so pass a different folder for each scale.
+
+    Parameters
+    ----------
+    folder : str | pathlib.Path
+        The folder to write files to. It will be created if it doesn't exist.
+    years : int
+        Number of yearly files to write.
+    lat : int
+        Number of latitudes in the grid.
+    lon : int
+        Number of longitudes in the grid.
+    chunks : tuple[int, int, int] | None
+        Chunk shape of the `precip` variable, as (time, lat, lon). Default is one day per chunk.
+    start_year : int
+        Year of the first file. Default is 1979, the first year of CPC's global precipitation.
+    seed : int
+        Seed for the random number generator, so that the same files are generated each time.
+
+    Returns
+    -------
+    list[pathlib.Path] :
+        The files, in time order.
+    """
+    folder = pathlib.Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    rng = numpy.random.default_rng(seed)
+
+    # Cell centers
+    latitudes = numpy.linspace(90 - 90 / lat, -90 + 90 / lat, lat)
+    longitudes = numpy.linspace(180 / lon, 360 - 180 / lon, lon)
+    ocean = rng.random((lat, lon)) > 0.3
+
+    paths = []
+    for year in range(start_year, start_year + years):
+        path = folder / f"precip.{year}.nc"
+        paths.append(path)
+        if path.exists():
+            continue
+
+        times = numpy.arange(f"{year}-01-01", f"{year + 1}-01-01", dtype="datetime64[D]").astype("datetime64[ns]")
+
+        # Mostly dry days with the occasional downpour, roughly the distribution of daily precipitation
+        precip = rng.gamma(0.5, 6.0, (len(times), lat, lon)).astype("float32")
+        precip[:, ocean] = numpy.nan
+
+        dataset = xarray.Dataset(
+            {"precip": (("time", "lat", "lon"), precip, {"long_name": "Daily total of precipitation", "units": "mm"})},
+            coords={
+                "time": ("time", times),
+                "lat": ("lat", latitudes.astype("float32"), {"units": "degrees_north"}),
+                "lon": ("lon", longitudes.astype("float32"), {"units": "degrees_east"}),
+            },
+        )
+        encoding = {
+            "precip": {"zlib": True, "_FillValue": FILL_VALUE, "chunksizes": chunks or (1, lat, lon)},
+            "time": {"units": "hours since 1900-01-01", "dtype": "float64"},
+        }
+
+        # Written to a temporary file first so that an interrupted run doesn't leave a partial file to be reused
+        partial = folder / f".{path.name}.partial"
+        dataset.to_netcdf(partial, format="NETCDF4", engine="netcdf4", encoding=encoding)
+        partial.rename(path)
+
+    return paths
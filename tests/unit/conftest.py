@@ -35,9 +35,19 @@ class MockFilesystem:
     def __init__(self, contents: dict[str, bytes]):
         self.contents = contents
 
-    def glob(self, glob):
+    def glob(self, glob, detail=False):
         start, end = glob.split("*")
-        return [name for name in self.contents if name.startswith(start) and name.endswith(end)]
+        names = [name for name in self.contents if name.startswith(start) and name.endswith(end)]
+        if detail:
+            return {name: self.info(name) for name in names}
+
+        return names
+
+    def info(self, path):
+        return {"name": path, "size": len(self.contents[path]), "modify": "19700101000000"}
+
+    def invalidate_cache(self, path=None):
+        pass
 
     def open(self, path, mode="rb"):
         assert mode.endswith("b")
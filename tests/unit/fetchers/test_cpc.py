@@ -1,3 +1,4 @@
+import ftplib
 import numpy
 import os
 import pytest
@@ -7,6 +8,8 @@ from dc_etl.errors import MissingConfigurationError
 from dc_etl.fetch import Timespan
 from dc_etl.fetchers.cpc import CPCFetcher
 from dc_etl.filespec import file
+from tests import synthetic
+from tests.ftpserver import FTPServer
 
 from ..conftest import mock_serialized_dataset, MockFilesystem
 
@@ -19,7 +22,7 @@ class TestCPCFetcher:
         assert fetcher._glob == ["/Datasets/cpc_global_precip/precip.*.nc"]
         assert fetcher._fs == fsspec.filesystem.return_value
         assert fetcher._cache is None
-        fsspec.filesystem.assert_called_once_with("ftp", host="ftp.cdc.noaa.gov")
+        fsspec.filesystem.assert_called_once_with("ftp", host="ftp.cdc.noaa.gov", port=21)
 
     def test_constructor_with_cache(self, mocker):
         fsspec = mocker.patch("dc_etl.fetchers.cpc.fsspec")
@@ -31,7 +34,27 @@ class TestCPCFetcher:
         ]
         assert fetcher._fs == fsspec.filesystem.return_value
         assert fetcher._cache is cache
-        fsspec.filesystem.assert_called_once_with("ftp", host="ftp.cdc.noaa.gov")
+        fsspec.filesystem.assert_called_once_with("ftp", host="ftp.cdc.noaa.gov", port=21)
+
+    def test_constructor_with_host(self, mocker):
+        fsspec = mocker.patch("dc_etl.fetchers.cpc.fsspec")
+        fetcher = CPCFetcher("global_precip", host="localhost", port=2121)
+        assert fetcher._fs == fsspec.filesystem.return_value
+        fsspec.filesystem.assert_called_once_with("ftp", host="localhost", port=2121)
+
+    def test_connection_per_process(self, mocker):
+        fsspec = mocker.patch("dc_etl.fetchers.cpc.fsspec")
+        fsspec.filesystem.side_effect = lambda *args, **kwargs: object()
+        getpid = mocker.patch("dc_etl.fetchers.cpc.os.getpid", return_value=1)
+        fetcher = CPCFetcher("global_precip")
+        parent = fetcher._fs
+        assert fetcher._fs is parent
+
+        getpid.return_value = 2  # As in a forked process
+        child = fetcher._fs
+        assert child is not parent
+        assert fetcher._fs is child
+        assert fsspec.filesystem.call_count == 2
 
     def test_constructor_with_bad_dataset(self):
         with pytest.raises(MissingConfigurationError):
@@ -53,9 +76,11 @@ class TestCPCFetcher:
         assert span.end == numpy.datetime64("1972-12-31")
 
         prefetched = os.listdir(tmpdir)
-        assert len(prefetched) == 2
+        assert len(prefetched) == 4
         assert "precip.V1.0.1970.nc" in prefetched
+        assert "precip.V1.0.1970.json" in prefetched
         assert "precip.V1.0.1972.nc" in prefetched
+        assert "precip.V1.0.1972.json" in prefetched
 
         # This time it should use the cache
         fetcher = CPCFetcher("us_precip", cache)  # Bust functools.cache decorator on get_remote_timespan
@@ -79,9 +104,11 @@ class TestCPCFetcher:
         fetcher.prefetch(span)
 
         prefetched = os.listdir(tmpdir)
-        assert len(prefetched) == 2
+        assert len(prefetched) == 4
         assert "precip.V1.0.1971.nc" in prefetched
+        assert "precip.V1.0.1971.json" in prefetched
         assert "precip.V1.0.1972.nc" in prefetched
+        assert "precip.V1.0.1972.json" in prefetched
 
     @pytest.mark.usefixtures("patch_fs")
     def test_fetch(self, mockfs):
@@ -148,6 +175,177 @@ class TestCPCFetcher:
             list(fetcher.fetch(span))
 
 
+class TestCPCFetcherOverFTP:
+    def test_get_remote_timespan(self, ftp):
+        fetcher = CPCFetcher("global_precip", host=ftp.host, port=ftp.port)
+        span = fetcher.get_remote_timespan()
+        assert span.start == numpy.datetime64("1979-01-01")
+        assert span.end == numpy.datetime64("1980-12-31")
+
+    def test_fetch_with_cache(self, ftp, tmpdir):
+        cache = file(tmpdir)
+        fetcher = CPCFetcher("global_precip", cache, host=ftp.host, port=ftp.port)
+        span = Timespan(numpy.datetime64("1979-05-12"), numpy.datetime64("1980-07-07"))
+
+        files = list(fetcher.fetch(span))
+        assert [file.name for file in files] == ["precip.1979.nc", "precip.1980.nc"]
+        assert sorted(os.listdir(tmpdir)) == [
+            "precip.1979.json",
+            "precip.1979.nc",
+            "precip.1980.json",
+            "precip.1980.nc",
+        ]
+        assert ftp.commands["RETR"] == 2
+
+        fetched = xarray.open_dataset(files[1].open())
+        assert fetched.time.data[-1] == numpy.datetime64("1980-12-31")
+
+        # Cached, so downloaded only once
+        list(CPCFetcher("global_precip", cache, host=ftp.host, port=ftp.port).fetch(span))
+        assert ftp.commands["RETR"] == 2
+
+    def test_fetch_dropped_connection(self, ftp, tmpdir):
+        ftp.drop_after = 1000
+        ftp.drops = 1
+        cache = file(tmpdir)
+        span = Timespan(numpy.datetime64("1979-05-12"), numpy.datetime64("1979-07-07"))
+
+        with pytest.raises(ftplib.all_errors):
+            list(CPCFetcher("global_precip", cache, host=ftp.host, port=ftp.port).fetch(span))
+
+        # Nothing was cached that could be mistaken for the whole file
+        assert not [name for name in os.listdir(tmpdir) if name.endswith(".nc")]
+
+        files = list(CPCFetcher("global_precip", cache, host=ftp.host, port=ftp.port).fetch(span))
+        fetched = xarray.open_dataset(files[0].open())
+        assert fetched.time.data[-1] == numpy.datetime64("1979-12-31")
+
+    def test_get_remote_state(self, tmp_path):
+        folder = tmp_path / "ftp" / "Datasets" / "cpc_global_precip"
+        synthetic.cpc_files(folder, 2, 6, 12)
+        with FTPServer(tmp_path / "ftp") as ftp:
+            fetcher = CPCFetcher("global_precip", host=ftp.host, port=ftp.port)
+            state = fetcher.get_remote_state()
+            assert sorted(state) == [
+                "/Datasets/cpc_global_precip/precip.1979.nc",
+                "/Datasets/cpc_global_precip/precip.1980.nc",
+            ]
+            assert (
+                state["/Datasets/cpc_global_precip/precip.1979.nc"]["size"]
+                == (folder / "precip.1979.nc").stat().st_size
+            )
+            assert state["/Datasets/cpc_global_precip/precip.1979.nc"]["start"] == "1979-01-01"
+            assert state["/Datasets/cpc_global_precip/precip.1979.nc"]["end"] == "1979-12-31"
+            assert fetcher.get_remote_timespan().end == numpy.datetime64("1980-12-31")
+
+            # Unchanged, so nothing more than a listing
+            retrieved = ftp.commands["RETR"]
+            assert fetcher.get_remote_state() == state
+            assert fetcher.get_remote_timespan().end == numpy.datetime64("1980-12-31")
+            assert ftp.commands["RETR"] == retrieved
+
+            # A new year of data
+            synthetic.cpc_files(folder, 1, 6, 12, start_year=1981)
+            assert fetcher.get_remote_state() != state
+            assert fetcher.get_remote_timespan().end == numpy.datetime64("1981-12-31")
+
+    def test_get_remote_state_removes_stale_cache(self, tmp_path):
+        folder = tmp_path / "ftp" / "Datasets" / "cpc_global_precip"
+        synthetic.cpc_files(folder, 1, 6, 12)
+        cache = file(tmp_path / "cache", auto_mkdir=True)
+        span = Timespan(numpy.datetime64("1979-01-01"), numpy.datetime64("1979-12-31"))
+        with FTPServer(tmp_path / "ftp") as ftp:
+            fetcher = CPCFetcher("global_precip", cache, host=ftp.host, port=ftp.port)
+            fetcher.get_remote_state()
+            list(fetcher.fetch(span))
+            assert ftp.commands["RETR"] == 1
+
+            # Unchanged, so the cached copy is still good
+            fetcher.get_remote_state()
+            list(fetcher.fetch(span))
+            assert ftp.commands["RETR"] == 1
+
+            # Rewritten upstream, eg with more data
+            (folder / "precip.1979.nc").unlink()
+            synthetic.cpc_files(folder, 1, 8, 16)
+            fetcher.get_remote_state()
+            (fetched,) = fetcher.fetch(span)
+            assert ftp.commands["RETR"] == 2
+            assert xarray.open_dataset(fetched.open()).sizes["lat"] == 8
+
+            # Revised upstream, with the same size but a new modification time
+            (folder / "precip.1979.nc").unlink()
+            synthetic.cpc_files(folder, 1, 8, 16, seed=1)
+            os.utime(folder / "precip.1979.nc", (0, 0))
+            fetcher.get_remote_state()
+            (fetched,) = fetcher.fetch(span)
+            assert ftp.commands["RETR"] == 3
+
+    def test_get_remote_state_removes_stale_cache_in_new_process(self, tmp_path):
+        folder = tmp_path / "ftp" / "Datasets" / "cpc_global_precip"
+        synthetic.cpc_files(folder, 1, 6, 12)
+        cache = file(tmp_path / "cache", auto_mkdir=True)
+        span = Timespan(numpy.datetime64("1979-01-01"), numpy.datetime64("1979-12-31"))
+        with FTPServer(tmp_path / "ftp") as ftp:
+            list(CPCFetcher("global_precip", cache, host=ftp.host, port=ftp.port).fetch(span))
+            assert ftp.commands["RETR"] == 1
+
+            # A new fetcher, as in a new process, finds the cached copy is still good
+            fetcher = CPCFetcher("global_precip", cache, host=ftp.host, port=ftp.port)
+            fetcher.get_remote_state()
+            list(fetcher.fetch(span))
+            assert ftp.commands["RETR"] == 1
+
+            # Revised upstream, with the same size but a new modification time, before the next process starts
+            (folder / "precip.1979.nc").unlink()
+            (revised,) = synthetic.cpc_files(folder, 1, 6, 12, seed=1)
+            os.utime(revised, (0, 0))
+            fetcher = CPCFetcher("global_precip", cache, host=ftp.host, port=ftp.port)
+            fetcher.get_remote_state()
+            (fetched,) = fetcher.fetch(span)
+            assert ftp.commands["RETR"] == 2
+            assert fetched.fs.cat(fetched.path) == revised.read_bytes()
+
+    def test_get_remote_state_removes_cache_without_listing(self, tmp_path):
+        folder = tmp_path / "ftp" / "Datasets" / "cpc_global_precip"
+        synthetic.cpc_files(folder, 1, 6, 12)
+        cache = file(tmp_path / "cache", auto_mkdir=True)
+        span = Timespan(numpy.datetime64("1979-01-01"), numpy.datetime64("1979-12-31"))
+        with FTPServer(tmp_path / "ftp") as ftp:
+            list(CPCFetcher("global_precip", cache, host=ftp.host, port=ftp.port).fetch(span))
+            (tmp_path / "cache" / "precip.1979.json").unlink()
+
+            # There's no telling which version of the file was cached, so it's downloaded again
+            fetcher = CPCFetcher("global_precip", cache, host=ftp.host, port=ftp.port)
+            fetcher.get_remote_state()
+            list(fetcher.fetch(span))
+            assert ftp.commands["RETR"] == 2
+
+    @pytest.mark.usefixtures("patch_fs")
+    def test_get_remote_state_with_mockfs(self):
+        fetcher = CPCFetcher("us_precip")
+        state = fetcher.get_remote_state()
+        assert sorted(state) == [
+            "/Datasets/cpc_us_precip/RT/precip.V1.0.1971.nc",
+            "/Datasets/cpc_us_precip/RT/precip.V1.0.1972.nc",
+            "/Datasets/cpc_us_precip/precip.V1.0.1970.nc",
+            "/Datasets/cpc_us_precip/precip.V1.0.1971.nc",
+        ]
+
+
+@pytest.fixture(scope="module")
+def ftp_root(tmp_path_factory):
+    root = tmp_path_factory.mktemp("ftp")
+    synthetic.cpc_files(root / "Datasets" / "cpc_global_precip", 2, 6, 12)
+    return root
+
+
+@pytest.fixture
+def ftp(ftp_root):
+    with FTPServer(ftp_root) as server:
+        yield server
+
+
 @pytest.fixture(scope="session")
 def mockfs():
     return MockFilesystem(
@@ -0,0 +1,26 @@
+from multiformats import CID, multihash
+
+
+class MockStore:
+    """An in-memory stand-in for a py-hamt store that records calls."""
+
+    def __init__(self):
+        self.blocks = {}
+        self.loads = []
+        self.saves = []
+
+    def save_raw(self, data):
+        return self._save(data, "raw")
+
+    def save_dag_cbor(self, data):
+        return self._save(data, "dag-cbor")
+
+    def _save(self, data, codec):
+        cid = CID("base32", 1, codec, multihash.digest(data, "blake3", size=32))
+        self.saves.append(cid)
+        self.blocks[cid] = data
+        return cid
+
+    def load(self, id):
+        self.loads.append(id)
+        return self.blocks[id]
@@ -0,0 +1,163 @@
+import os
+
+from unittest import mock
+
+from dc_etl.ipld.cache import BlockCache, NodeCache
+
+from .conftest import MockStore
+
+
+def test_get_put(tmpdir):
+    cid = MockStore().save_raw(b"hello")
+    cache = BlockCache(tmpdir)
+    assert cache.get(cid) is None
+    cache.put(cid, b"hello")
+    assert cache.get(cid) == b"hello"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Shared with other caches using the same folder
+    other = BlockCache(tmpdir)
+    assert other.get(cid) == b"hello"
+    other.put(cid, b"hello")
+    assert (other.hits, other.misses) == (1, 0)
+
+
+def test_evict_least_recently_used(tmpdir):
+    store = MockStore()
+    cids = [store.save_raw(bytes([i]) * 10) for i in range(4)]
+    cache = BlockCache(tmpdir, max_bytes=30)
+    for i, cid in enumerate(cids[:3]):
+        cache.put(cid, store.blocks[cid])
+        os.utime(cache._path(cid), ns=(i, i))
+
+    # Use the oldest, so the second oldest is evicted
+    cache.get(cids[0])
+    cache.put(cids[3], store.blocks[cids[3]])
+
+    assert cache.get(cids[0]) is not None
+    assert cache.get(cids[1]) is None
+    assert cache.get(cids[2]) is not None
+    assert cache.get(cids[3]) is not None
+    assert cache._size == 30
+
+    # Size is computed from whatever is already in the folder
+    cache = BlockCache(tmpdir, max_bytes=30)
+    cache.put(cids[1], store.blocks[cids[1]])
+    assert cache._size == 30
+    assert len(list(cache._entries())) == 3
+
+
+def test_evict_without_listing(tmpdir):
+    store = MockStore()
+    cids = [store.save_raw(bytes([i]) * 10) for i in range(5)]
+    cache = BlockCache(tmpdir, max_bytes=30)
+    cache.put(cids[0], store.blocks[cids[0]])
+    with mock.patch.object(cache, "_entries") as entries:
+        for cid in cids[1:]:
+            cache.put(cid, store.blocks[cid])
+        entries.assert_not_called()
+
+    assert [cache.get(cid) is not None for cid in cids] == [False, False, True, True, True]
+    assert cache._size == 30
+
+
+def test_shared_with_other_processes(tmpdir):
+    store = MockStore()
+    cids = [store.save_raw(bytes([i]) * 10) for i in range(4)]
+    cache = BlockCache(tmpdir, max_bytes=30)
+    other = BlockCache(tmpdir, max_bytes=30)
+    cache.put(cids[0], store.blocks[cids[0]])
+    other.put(cids[1], store.blocks[cids[1]])
+
+    # Blocks put by other processes are tracked once they are read
+    assert cache.get(cids[1]) is not None
+    assert cache._size == 20
+
+    # Blocks evicted by other processes are forgotten once they are missed
+    os.unlink(cache._path(cids[0]))
+    assert cache.get(cids[0]) is None
+    assert cache._size == 10
+
+    # Blocks evicted by other processes since they were last read are skipped
+    os.unlink(cache._path(cids[1]))
+    for cid in cids[2:]:
+        cache.put(cid, store.blocks[cid])
+    cache.put(cids[0], store.blocks[cids[0]])
+    assert cache._size == 30
+
+
+def test_evicted_while_reading(tmpdir):
+    cid = MockStore().save_raw(b"hello")
+    cache = BlockCache(tmpdir)
+    cache.put(cid, b"hello")
+    with mock.patch("dc_etl.ipld.cache.os.utime", side_effect=FileNotFoundError):
+        assert cache.get(cid) == b"hello"
+
+
+def test_too_big(tmpdir):
+    cid = MockStore().save_raw(b"x" * 40)
+    cache = BlockCache(tmpdir, max_bytes=30)
+    cache.put(cid, b"x" * 40)
+    assert cache.get(cid) is None
+    assert cache._size == 0
+
+
+def test_ignores_stray_files(tmpdir):
+    cid = MockStore().save_raw(b"hello")
+    tmpdir.join("README").write("hi")
+    folder = tmpdir.mkdir(str(cid)[-2:])
+    folder.join(".something.tmp").write("partial")
+    folder.join("evicted").mksymlinkto(folder / "nothing")
+    cache = BlockCache(tmpdir)
+    cache.put(cid, b"hello")
+    assert [path.name for path, _, _ in cache._entries()] == [str(cid)]
+
+
+def test_empty(tmpdir):
+    cache = BlockCache(tmpdir / "not" / "yet")
+    assert list(cache._entries()) == []
+
+
+class TestNodeCache:
+    def test_get_put(self):
+        store = MockStore()
+        cid = store.save_dag_cbor(b"node")
+        cache = NodeCache()
+        assert cache.get(cid) is None
+        cache.put(cid, b"node")
+        assert cache.get(cid) == b"node"
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        cache.put(cid, b"node")
+        assert cache._size == 4
+
+    def test_only_nodes(self):
+        store = MockStore()
+        cid = store.save_raw(b"chunk")
+        cache = NodeCache()
+        cache.put(cid, b"chunk")
+        assert cache.get(cid) is None
+
+        cache = NodeCache(codecs=("raw", "dag-cbor"))
+        cache.put(cid, b"chunk")
+        assert cache.get(cid) == b"chunk"
+
+    def test_evict_least_recently_used(self):
+        store = MockStore()
+        cids = [store.save_dag_cbor(bytes([i]) * 10) for i in range(4)]
+        cache = NodeCache(max_bytes=30)
+        for cid in cids[:3]:
+            cache.put(cid, store.blocks[cid])
+
+        cache.get(cids[0])
+        cache.put(cids[3], store.blocks[cids[3]])
+
+        assert cache.get(cids[1]) is None
+        assert all(cache.get(cid) is not None for cid in (cids[0], cids[2], cids[3]))
+
+    def test_too_big(self):
+        store = MockStore()
+        cid = store.save_dag_cbor(b"x" * 40)
+        cache = NodeCache(max_bytes=30)
+        cache.put(cid, b"x" * 40)
+        assert cache.get(cid) is None
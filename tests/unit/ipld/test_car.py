@@ -0,0 +1,142 @@
+import dag_cbor
+import numpy
+import pytest
+import xarray
+
+from multiformats import CID, varint
+
+from dc_etl.fetch import Timespan
+from dc_etl.ipld.car import CARStore
+from dc_etl.ipld.memory import MemoryIPLDLoader
+from dc_etl.ipld.stores import block_cid
+from tests.conftest import npdate
+from tests.unit.conftest import mock_dataset
+
+
+def read_car(path):
+    """Minimal independent CARv1 reader."""
+    data = path.read_bytes()
+    length, prefix, _ = varint.decode_raw(data)
+    header = dag_cbor.decode(data[prefix : prefix + length])
+    offset = prefix + length
+    blocks = {}
+    while offset < len(data):
+        length, prefix, _ = varint.decode_raw(data[offset:])
+        section = data[offset + prefix : offset + prefix + length]
+        cid_length = 36 if section[0] == 1 else 34
+        blocks[CID.decode(section[:cid_length])] = section[cid_length:]
+        offset += prefix + length
+
+    return header, blocks
+
+
+def test_save_load_flush(tmp_path):
+    path = tmp_path / "sub" / "dataset.car"
+    store = CARStore(path)
+    assert store.root is None
+
+    raw = store.save_raw(b"hello")
+    node = store.save_dag_cbor(dag_cbor.encode({"hello": raw}))
+    assert raw == block_cid(b"hello", "raw")
+    assert store.save_raw(b"hello") == raw
+    assert store.load(raw) == b"hello"
+    assert dag_cbor.decode(store.load(node)) == {"hello": raw}
+
+    store.flush(node)
+    assert store.root == node
+    header, blocks = read_car(path)
+    assert header == {"roots": [node], "version": 1}
+    assert blocks == {raw: b"hello", node: dag_cbor.encode({"hello": raw})}
+    store.close()
+
+
+def test_reopen_and_append(tmp_path):
+    path = tmp_path / "dataset.car"
+    store = CARStore(path)
+    first = store.save_raw(b"one")
+    store.flush(first)
+    store.close()
+
+    store = CARStore(path)
+    assert store.root == first
+    assert store.load(first) == b"one"
+    second = store.save_raw(b"two")
+    store.flush(second)
+    store.flush(second)
+    store.close()
+
+    header, blocks = read_car(path)
+    assert header["roots"] == [second]
+    assert blocks == {first: b"one", second: b"two"}
+
+
+def test_flush_without_root(tmp_path):
+    path = tmp_path / "dataset.car"
+    store = CARStore(path)
+    store.save_raw(b"one")
+    store.flush()
+    assert store.root is None
+    assert len(read_car(path)[1]) == 1
+
+
+def test_root_of_different_length(tmp_path):
+    path = tmp_path / "dataset.car"
+    store = CARStore(path)
+    block = store.save_raw(b"one")
+    root = CID.decode("QmdfTbBqBPQ7VNxZEYEj14VmRuZBkqFbiwReogJgS1zR1n")  # CIDv0, shorter
+    store.flush(root)
+    assert store.load(block) == b"one"
+    store.close()
+
+    store = CARStore(path)
+    assert store.root == root
+    assert store.load(block) == b"one"
+    header, blocks = read_car(path)
+    assert header["roots"] == [root]
+    assert blocks == {block: b"one"}
+
+
+def test_read_cidv0_blocks(tmp_path):
+    # Written by other tools, eg `ipfs dag export` of data added without `--cid-version 1`
+    path = tmp_path / "dataset.car"
+    cid = CID.decode("QmdfTbBqBPQ7VNxZEYEj14VmRuZBkqFbiwReogJgS1zR1n")
+    header = dag_cbor.encode({"roots": [cid], "version": 1})
+    section = bytes(cid) + b"hello"
+    path.write_bytes(varint.encode(len(header)) + header + varint.encode(len(section)) + section)
+
+    store = CARStore(path)
+    assert store.root == cid
+    assert store.load(cid) == b"hello"
+    store.close()
+
+
+def test_bad_version(tmp_path):
+    path = tmp_path / "dataset.car"
+    header = dag_cbor.encode({"roots": [], "version": 2})
+    path.write_bytes(varint.encode(len(header)) + header)
+    with pytest.raises(ValueError):
+        CARStore(path)
+
+
+def test_loader(tmp_path):
+    time = numpy.arange(
+        numpy.datetime64("2000-01-01", "ns"), numpy.datetime64("2000-03-01", "ns"), numpy.timedelta64(1, "D")
+    )
+    dataset = mock_dataset(data=("data", numpy.random.randn(len(time), 3)), dims=[("tempo", time), ("x", range(3))])
+    dataset.data.encoding["chunks"] = (10, 3)
+    store = CARStore(tmp_path / "dataset.car")
+    loader = MemoryIPLDLoader("tempo", store=store, concurrency=2)
+
+    # The store is passed in, so it's still open after each write
+    loader.initial(dataset, Timespan(npdate(2000, 1, 1), npdate(2000, 1, 31)))
+    loader.append(dataset, Timespan(npdate(2000, 2, 1), npdate(2000, 2, 29)))
+    replaced = dataset.copy(deep=True)
+    replaced.data[12] = 42.0
+    loader.replace(replaced, Timespan(npdate(2000, 1, 11), npdate(2000, 1, 20)))
+    xarray.testing.assert_equal(loader.dataset().load(), replaced)
+    assert store.root == loader.publisher.retrieve()
+    store.close()
+
+    loader = MemoryIPLDLoader("tempo", store=CARStore(tmp_path / "dataset.car"))
+    loader.publisher.publish(store.root)
+    xarray.testing.assert_equal(loader.dataset().load(), replaced)
@@ -1,11 +1,23 @@
 from unittest import mock
 
+import dask
 import numpy
 import pytest
+import xarray
+import zarr
 
+from numcodecs.compat import ensure_bytes
+
+from dc_etl import transformers
 from dc_etl.config import _Configuration
+from dc_etl.errors import MissingConfigurationError
 from dc_etl.fetch import Timespan
-from dc_etl.ipld.loader import IPLDLoader
+from dc_etl.ipld.cache import BlockCache, NodeCache
+from dc_etl.ipld.loader import IPLDLoader, IPLDPublisher
+from dc_etl.ipld.memory import MemoryIPLDPublisher
+from dc_etl.ipld.stores import BorrowedStore, BulkStore, CachingStore, Link, LinkingStore, PipelinedStore, block_cid
+from dc_etl.mappers import LockedMapper
+from dc_etl.stats import Statistics
 from tests.conftest import npdate
 from tests.unit.conftest import mock_dataset
 
@@ -19,69 +31,453 @@ class TestIPLDLoader:
         assert loader.time_dim == "nation time"
         assert loader.publisher.foo == "bar"
 
+    def test__from_config_without_publisher(self):
+        config = _Configuration({"time_dim": "nation time"}, "some/file", [])
+        with pytest.raises(MissingConfigurationError):
+            IPLDLoader._from_config(config)
+
+    def test__from_config_with_cache(self, tmpdir):
+        config = _Configuration(
+            {
+                "time_dim": "nation time",
+                "publisher": {"name": "testing"},
+                "cache": {"path": str(tmpdir), "max_bytes": 42},
+            },
+            "some/file",
+            [],
+        )
+        loader = IPLDLoader._from_config(config)
+        assert isinstance(loader.cache, BlockCache)
+        assert loader.cache.path == tmpdir
+        assert loader.cache.max_bytes == 42
+
+    def test__from_config_with_node_cache(self):
+        config = _Configuration(
+            {"time_dim": "nation time", "publisher": {"name": "testing"}, "node_cache": {"max_bytes": 42}},
+            "some/file",
+            [],
+        )
+        loader = IPLDLoader._from_config(config)
+        assert isinstance(loader.node_cache, NodeCache)
+        assert loader.node_cache.max_bytes == 42
+
+    def test__from_config_with_store(self):
+        config = _Configuration(
+            {
+                "time_dim": "nation time",
+                "publisher": {"name": "testing"},
+                "store": {"name": "testing", "path": "dataset.car"},
+            },
+            "some/file",
+            [],
+        )
+        loader = IPLDLoader._from_config(config)
+        assert loader.store.path == "dataset.car"
+
     def test_initial(self):
         publisher = mock.Mock()
         mapper = mock.Mock()
-        dataset = mock.Mock()
+        dataset = mock.Mock(variables={})
         span = (42, 53)
 
         selected = dataset.sel.return_value
+        selected.variables = {}
+        selected.attrs = {}
         mapper.root_node_id = "contentid"
 
         loader = IPLDLoader(time_dim="tempo", publisher=publisher)
         loader._mapper = mock.Mock(return_value=mapper)
+        loader._store = mock.Mock()
         loader.initial(dataset, span)
 
         dataset.sel.assert_called_once_with(tempo=slice(*span))
-        selected.to_zarr.assert_called_once_with(store=mapper, consolidated=True)
+        selected.to_zarr.assert_called_once_with(store=mock.ANY, consolidated=True)
+        assert isinstance(selected.to_zarr.call_args.kwargs["store"], LockedMapper)
+        assert selected.to_zarr.call_args.kwargs["store"].store.store is mapper
         publisher.publish.assert_called_once_with("contentid")
-        loader._mapper.assert_called_once_with()
+        loader._mapper.assert_called_once_with(store=loader._store.return_value)
+        loader._store.assert_called_once_with(write=True)
+
+    def test_initial_bulk(self):
+        publisher = mock.Mock()
+        dataset = mock.Mock(variables={})
+        dataset.sel.return_value.variables = {}
+        dataset.sel.return_value.attrs = {}
+        inner = mock.Mock()
+        mapper = mock.Mock()
+
+        loader = IPLDLoader(time_dim="tempo", publisher=publisher, bulk=True)
+        loader._mapper = mock.Mock(return_value=mapper)
+        loader._store = mock.Mock(return_value=inner)
+        loader.initial(dataset, (42, 53))
+
+        store = loader._mapper.call_args.kwargs["store"]
+        assert isinstance(store, BulkStore)
+        assert store.store is inner
+        assert store.root() is mapper.root_node_id
+        inner.flush.assert_called_once_with(mapper.root_node_id)
+        publisher.publish.assert_called_once_with(mapper.root_node_id)
 
     def test_append(self):
         publisher = mock.Mock()
         mapper = mock.Mock()
-        dataset = mock.Mock()
+        dataset = mock.Mock(variables={})
         span = (42, 53)
 
         selected = dataset.sel.return_value
+        selected.variables = {}
+        selected.attrs = {}
         mapper.root_node_id = "contentid"
 
         loader = IPLDLoader(time_dim="tempo", publisher=publisher)
         loader._mapper = mock.Mock(return_value=mapper)
+        loader._store = mock.Mock()
         loader.append(dataset, span)
 
         dataset.sel.assert_called_once_with(tempo=slice(*span))
-        selected.to_zarr.assert_called_once_with(store=mapper, consolidated=True, append_dim="tempo")
+        selected.to_zarr.assert_called_once_with(store=mock.ANY, consolidated=True, append_dim="tempo")
+        assert selected.to_zarr.call_args.kwargs["store"].store.store is mapper
         publisher.publish.assert_called_once_with("contentid")
-        loader._mapper.assert_called_once_with(publisher.retrieve.return_value)
+        loader._mapper.assert_called_once_with(publisher.retrieve.return_value, loader._store.return_value)
 
-    def test_replace(self):
+    def test_append_fails(self):
         publisher = mock.Mock()
-        mapper = mock.Mock()
-        dataset = mock.Mock()
-        original_dataset = mock.Mock()
-        span = Timespan(42, 53)
+        dataset = mock.Mock(variables={})
+        selected = dataset.sel.return_value
+        selected.variables = {}
+        selected.attrs = {}
+        selected.to_zarr.side_effect = RuntimeError("oops")
 
-        def mock_time_to_integer(dataset, timestmap):
-            assert dataset is original_dataset
-            return timestmap * 2
+        loader = IPLDLoader(time_dim="tempo", publisher=publisher)
+        loader._mapper = mock.Mock()
+        loader._store = mock.Mock()
+        with pytest.raises(RuntimeError):
+            loader.append(dataset, (42, 53))
 
-        selected = dataset.sel.return_value
-        selected.dims = ["one", "tempo", "two"]
-        dropped = selected.drop_vars.return_value
-        mapper.root_node_id = "contentid"
+        loader._store.return_value.close.assert_called_once_with()
+        publisher.publish.assert_not_called()
+
+    def test_initial_threads(self, dataset):
+        mapper = MockMapper()
+        loader = IPLDLoader(time_dim="tempo", publisher=mock.Mock(), scheduler="threads", num_workers=4)
+        loader._mapper = mock.Mock(return_value=mapper)
+        loader._store = mock.Mock()
+        loader.initial(dataset, Timespan(npdate(2000, 1, 1), npdate(2000, 12, 31)))
+
+        assert len([key for key in mapper.written if key.startswith("data/") and "/." not in key]) == 13
+        written = xarray.open_zarr(mapper, consolidated=True)
+        assert written.data.encoding["chunks"] == (30,)
+        assert numpy.array_equal(written.data.values, dataset.data.values)
+
+    def test_append_threads(self, dataset):
+        mapper = MockMapper(dataset.sel(tempo=slice(None, npdate(2000, 2, 14))))
+        loader = IPLDLoader(time_dim="tempo", publisher=mock.Mock(), scheduler="threads")
+        loader._mapper = mock.Mock(return_value=mapper)
+        loader._store = mock.Mock()
+        mapper.written.clear()
+        loader.append(dataset, Timespan(npdate(2000, 2, 15), npdate(2000, 12, 31)))
+
+        # The second chunk is completed, then the rest are written whole
+        assert "data/1" in mapper.written
+        assert "data/0" not in mapper.written
+        written = xarray.open_zarr(mapper, consolidated=True)
+        assert numpy.array_equal(written.data.values, dataset.data.values)
+
+    def test_replace_threads(self, dataset):
+        mapper = MockMapper(dataset)
+        span = Timespan(npdate(2000, 3, 1), npdate(2000, 3, 3))
+
+        replace_dataset = dataset.copy(deep=True)
+        replace_dataset.data[:] = 42.0
+
+        loader = IPLDLoader(time_dim="tempo", publisher=mock.Mock(), scheduler="threads")
+        loader._mapper = mock.Mock(return_value=mapper)
+        loader._store = mock.Mock()
+        loader.replace(replace_dataset, span)
+
+        written = xarray.open_zarr(mapper, consolidated=True)
+        assert numpy.all(written.data.values[60:63] == 42.0)
+        assert numpy.array_equal(written.data.values[:60], dataset.data.values[:60])
+        assert numpy.array_equal(written.data.values[63:], dataset.data.values[63:])
+
+    @pytest.mark.parametrize("scheduler", [None, "threads"])
+    def test_statistics(self, dataset, scheduler):
+        mapper = MockMapper()
+        publisher = MemoryIPLDPublisher()
+        loader = IPLDLoader(time_dim="tempo", publisher=publisher, scheduler=scheduler, statistics=True)
+        loader._mapper = mock.Mock(return_value=mapper)
+        loader._store = mock.Mock()
+        loader.initial(dataset, Timespan(npdate(2000, 1, 1), npdate(2000, 6, 30)))
+        statistics = Statistics.from_dict(publisher.manifest["statistics"]["data"])
+        expected = Statistics.of(dataset.data.values[:182])
+        assert statistics.count == expected.count
+        assert statistics.mean == pytest.approx(expected.mean)
+
+        loader.append(dataset, Timespan(npdate(2000, 7, 1), npdate(2000, 12, 31)))
+        statistics = Statistics.from_dict(publisher.manifest["statistics"]["data"])
+        expected = Statistics.of(dataset.data.values)
+        assert statistics.count == expected.count
+        assert statistics.minimum == expected.minimum
+        assert statistics.maximum == expected.maximum
+        assert statistics.mean == pytest.approx(expected.mean)
+        assert statistics.variance == pytest.approx(expected.variance)
+
+        replaced = dataset.copy(deep=True)
+        replaced.data[60:63] = 42.0
+        loader.replace(replaced, Timespan(npdate(2000, 3, 1), npdate(2000, 3, 3)))
+        statistics = Statistics.from_dict(publisher.manifest["statistics"]["data"])
+        expected = Statistics.of(replaced.data.values)
+        assert statistics.count == expected.count
+        assert statistics.maximum == expected.maximum == 42.0
+        assert statistics.mean == pytest.approx(expected.mean)
+        assert statistics.variance == pytest.approx(expected.variance)
+
+    @pytest.mark.parametrize("scheduler", [None, "threads"])
+    def test_chunk_index(self, dataset, scheduler):
+        mapper = MockMapper()
+        publisher = MemoryIPLDPublisher()
+        loader = IPLDLoader(time_dim="tempo", publisher=publisher, scheduler=scheduler, chunk_index=True)
+        loader._mapper = mock.Mock(return_value=mapper)
+        loader._store = mock.Mock()
+        loader.initial(dataset, Timespan(npdate(2000, 1, 1), npdate(2000, 6, 30)))
+        loader.append(dataset, Timespan(npdate(2000, 7, 1), npdate(2000, 12, 31)))
+        replace_dataset = dataset.copy(deep=True)
+        replace_dataset.data[60:63] = 42.0
+        loader.replace(replace_dataset, Timespan(npdate(2000, 3, 1), npdate(2000, 3, 3)))
+
+        data = replace_dataset.data.values
+        index = zarr.open_consolidated(mapper, mode="r")["_chunk_index/data"][...]
+        assert index.shape == (13, 3)
+        for i, (minimum, maximum, fill) in enumerate(index):
+            assert minimum == data[i * 30 : (i + 1) * 30].min()
+            assert maximum == data[i * 30 : (i + 1) * 30].max()
+            assert fill == 0.0
+
+        assert loader.candidate_chunks("data", minimum=42.0) == [{"tempo": slice(60, 90)}]
+        assert list(publisher.manifest["variables"]) == ["data", "tempo"]
+
+    @pytest.mark.parametrize("scheduler", [None, "threads"])
+    def test_overviews(self, spatial_dataset, scheduler):
+        dataset = spatial_dataset
+        mapper = MockMapper()
+        publisher = MemoryIPLDPublisher()
+        loader = IPLDLoader(time_dim="tempo", publisher=publisher, scheduler=scheduler, shards={"tempo": 2})
+        loader._mapper = mock.Mock(return_value=mapper)
+        loader._store = mock.Mock()
+        loader.initial(dataset, Timespan(npdate(2000, 1, 1), npdate(2000, 1, 15)))
+        loader.append(dataset, Timespan(npdate(2000, 1, 16), npdate(2000, 1, 31)))
+        replace_dataset = dataset.copy(deep=True)
+        replace_dataset.data[:] = 42.0
+        loader.replace(replace_dataset, Timespan(npdate(2000, 1, 8), npdate(2000, 1, 9)))
+
+        expected = dataset.copy(deep=True)
+        expected.data[7:9] = 42.0
+        for factor in (2, 4):
+            coarsened = expected.coarsen(latitude=factor, longitude=factor, boundary="pad").mean()
+            xarray.testing.assert_allclose(loader.overview(factor).data.load(), coarsened.data)
+        assert list(publisher.manifest["variables"]) == ["data", "latitude", "longitude", "tempo"]
+        assert "overview_2/data/shards/0.0.0" in mapper
+
+    def test_shards(self, dataset):
+        mapper = MockMapper()
+        loader = IPLDLoader(time_dim="tempo", publisher=mock.Mock(), shards={"tempo": 4})
+        loader._mapper = mock.Mock(return_value=mapper)
+        loader._store = mock.Mock()
+        loader.initial(dataset, Timespan(npdate(2000, 1, 1), npdate(2000, 6, 30)))
+        loader.append(dataset, Timespan(npdate(2000, 7, 1), npdate(2000, 12, 31)))
+
+        replace_dataset = dataset.copy(deep=True)
+        replace_dataset.data[:] = 42.0
+        loader.replace(replace_dataset, Timespan(npdate(2000, 3, 1), npdate(2000, 3, 3)))
+
+        # 13 chunks in 4 shards
+        assert sorted(key for key in mapper if key.startswith("data/shards/")) == [
+            f"data/shards/{i}" for i in range(4)
+        ]
+        assert not any(key.startswith("data/0") for key in mapper)
+
+        loader._mapper = mock.Mock(return_value=mapper)
+        written = loader.dataset()
+        expected = dataset.data.values.copy()
+        expected[60:63] = 42.0
+        assert numpy.array_equal(written.data.values, expected)
+
+    @pytest.fixture
+    def gridded(self):
+        time = numpy.arange(
+            numpy.datetime64("2000-01-01", "ns"), numpy.datetime64("2000-03-01", "ns"), numpy.timedelta64(1, "D")
+        )
+        dataset = mock_dataset(
+            data=("data", numpy.random.randn(len(time), 7)), dims=[("tempo", time), ("x", numpy.arange(7))]
+        )
+        dataset["other"] = dataset.data * 2
+        dataset["series"] = dataset.data.isel(x=0, drop=True)
+        for name in ("data", "other"):
+            dataset[name].encoding["chunks"] = (10, 2)
+        dataset.series.encoding["chunks"] = (10,)
+        return dataset
+
+    @pytest.mark.parametrize(
+        "dim, partitions, lazy", [("x", 3, False), ("x", 5, False), (None, 2, False), ("x", 2, True)]
+    )
+    def test_partitions(self, gridded, dim, partitions, lazy):
+        if lazy:
+            gridded = gridded.assign_coords(label=("x", numpy.arange(7) * 2)).chunk(tempo=10)
+        mappers = {}
+
+        def _mapper(root=None, store=None):
+            if root is None:
+                mapper = MockMapper()
+                mapper.root_node_id = f"root{len(mappers)}"
+                mappers[mapper.root_node_id] = mapper
+                return mapper
+
+            return mappers[root]
+
+        publisher = mock.Mock()
+        loader = IPLDLoader(time_dim="tempo", publisher=publisher)
+        loader._mapper = _mapper
+        loader._store = mock.Mock()
+        span = Timespan(npdate(2000, 1, 1), npdate(2000, 2, 29))
+        roots = [loader.initial_partition(gridded, span, i, partitions, dim) for i in range(partitions)]
+
+        # Each chunk is written by exactly one partition
+        chunks = [key for root in roots for key in mappers[root] if not key.rpartition("/")[2].startswith(".")]
+        chunks = [key for key in chunks if key.split("/")[0] in ("data", "other", "series")]
+        assert len(chunks) == len(set(chunks)) == 6 * 4 * 2 + 6
+
+        loader.merge_partitions(roots)
+        merged = mappers[publisher.publish.call_args.args[0]]
+        written = xarray.open_zarr(merged, consolidated=True)
+        xarray.testing.assert_equal(written.load(), gridded)
+
+    def test_partition_chunks_must_match(self, gridded):
+        gridded.other.encoding["chunks"] = (10, 3)
+        loader = IPLDLoader(time_dim="tempo", publisher=None)
+        loader._mapper = mock.Mock(return_value=MockMapper())
+        loader._store = mock.Mock()
+        with pytest.raises(ValueError):
+            loader.initial_partition(gridded, Timespan(npdate(2000, 1, 1), npdate(2000, 2, 29)), 0, 2, "x")
+
+    def test_unsupported_scheduler(self):
+        with pytest.raises(ValueError):
+            IPLDLoader(time_dim="tempo", publisher=None, scheduler="processes")
+
+    def test__compute(self, dataset):
+        loader = IPLDLoader(time_dim="tempo", publisher=None, scheduler="threads", num_workers=8, memory_limit=1000)
+        dataset = dataset.chunk({"tempo": 30})
+        with loader._compute(dataset):
+            assert dask.config.get("scheduler") == "threads"
+            assert dask.config.get("num_workers") == 2  # 240 byte chunks
+
+    def test__compute_no_scheduler(self, dataset):
+        loader = IPLDLoader(time_dim="tempo", publisher=None)
+        with loader._compute(dataset):
+            assert dask.config.get("scheduler", None) is None
+
+    def test_replace(self, dataset):
+        publisher = mock.Mock()
+        mapper = MockMapper(dataset)
+        span = Timespan(npdate(2000, 3, 1), npdate(2000, 3, 3))
+
+        replace_dataset = dataset.copy(deep=True)
+        replace_dataset.data[:] = 42.0
 
         loader = IPLDLoader(time_dim="tempo", publisher=publisher)
         loader._mapper = mock.Mock(return_value=mapper)
-        loader.dataset = mock.Mock(return_value=original_dataset)
-        loader._time_to_integer = mock_time_to_integer
-        loader.replace(dataset, span)
+        loader._store = mock.Mock()
+        loader.replace(replace_dataset, span)
 
-        dataset.sel.assert_called_once_with(tempo=slice(*span))
-        selected.drop_vars.assert_called_once_with(["one", "two"])
-        dropped.to_zarr.assert_called_once_with(store=mapper, consolidated=True, region={"tempo": slice(84, 107)})
+        replaced = xarray.open_zarr(mapper, consolidated=True)
+        assert (replaced.data.values[60:63] == 42.0).all()
+        assert (replaced.data.values[:60] == dataset.data.values[:60]).all()
+        assert (replaced.data.values[63:] == dataset.data.values[63:]).all()
+        publisher.publish.assert_called_once_with("contentid")
+        loader._mapper.assert_called_once_with(publisher.retrieve.return_value, loader._store.return_value)
+
+    def test_replace_exact_match_required(self, dataset):
+        publisher = mock.Mock()
+        span = Timespan(numpy.datetime64("2000-03-01T12:00"), npdate(2000, 3, 3))
+
+        loader = IPLDLoader(time_dim="tempo", publisher=publisher, method=None)
+        loader._mapper = mock.Mock(return_value=MockMapper(dataset))
+        loader._store = mock.Mock()
+        with pytest.raises(KeyError):
+            loader.replace(dataset, span)
+
+        publisher.publish.assert_not_called()
+
+    def test_replace_nearest(self, dataset):
+        publisher = mock.Mock()
+        mapper = MockMapper(dataset)
+        span = Timespan(numpy.datetime64("2000-03-01T11:00"), numpy.datetime64("2000-03-03T13:00"))
+
+        replace_dataset = dataset.copy(deep=True)
+        replace_dataset.data[:] = 42.0
+
+        loader = IPLDLoader(time_dim="tempo", publisher=publisher)
+        loader._mapper = mock.Mock(return_value=mapper)
+        loader._store = mock.Mock()
+        loader.replace(replace_dataset, span)
+
+        replaced = xarray.open_zarr(mapper, consolidated=True)
+        assert (replaced.data.values[60:64] == 42.0).all()
+        assert replaced.data.values[59] != 42.0
+        assert replaced.data.values[64] != 42.0
+
+    def test_replace_many(self, dataset):
+        publisher = mock.Mock()
+        mapper = MockMapper(dataset)
+        spans = [
+            Timespan(npdate(2000, 3, 1), npdate(2000, 3, 3)),
+            Timespan(npdate(2000, 3, 6), npdate(2000, 3, 7)),
+            Timespan(npdate(2000, 3, 2), npdate(2000, 3, 4)),
+            Timespan(npdate(2000, 11, 1), npdate(2000, 11, 1)),
+        ]
+
+        replace_dataset = dataset.copy(deep=True)
+        replace_dataset.data[:] = 42.0
+
+        loader = IPLDLoader(time_dim="tempo", publisher=publisher)
+        loader._mapper = mock.Mock(return_value=mapper)
+        loader._store = mock.Mock()
+        mapper.written.clear()
+        loader.replace_many(replace_dataset, spans)
+
+        replaced = xarray.open_zarr(mapper, consolidated=True)
+        expected = dataset.data.values.copy()
+        expected[60:64] = 42.0
+        expected[65:67] = 42.0  # 2000-03-05 is left alone, even though its neighbors share its chunk
+        expected[305] = 42.0
+        numpy.testing.assert_array_equal(replaced.data.values, expected)
+
+        assert sorted(set(key for key in mapper.written if key[0] != ".")) == ["data/10", "data/2"]
+        publisher.publish.assert_called_once_with("contentid")
+        loader._mapper.assert_called_once_with(publisher.retrieve.return_value, loader._store.return_value)
+
+    def test_replace_many_diff(self, dataset):
+        publisher = mock.Mock()
+        mapper = MockMapper(dataset)
+        spans = [Timespan(npdate(2000, 3, 1), npdate(2000, 3, 3)), Timespan(npdate(2000, 11, 1), npdate(2000, 11, 1))]
+
+        replace_dataset = dataset.copy(deep=True)
+        replace_dataset.data[305] = 42.0
+
+        # Compared with what's stored by CID, through a LinkingStore
+        links = {key: Link(block_cid(ensure_bytes(value), "raw")) for key, value in mapper.items()}
+
+        loader = IPLDLoader(time_dim="tempo", publisher=publisher, diff=True)
+        loader._mapper = mock.Mock(
+            side_effect=lambda root, store: links if isinstance(store, LinkingStore) else mapper
+        )
+        loader._store = mock.Mock()
+        mapper.written.clear()
+        counts = loader.replace_many(replace_dataset, spans)
+
+        assert counts == (1, 1)
+        assert mapper.written == ["data/10"]
+        assert xarray.open_zarr(mapper, consolidated=True).data.values[305] == 42.0
         publisher.publish.assert_called_once_with("contentid")
-        loader._mapper.assert_called_once_with(publisher.retrieve.return_value)
 
     def test_dataset(self, mocker):
         xarray = mocker.patch("dc_etl.ipld.loader.xarray")
@@ -92,11 +488,30 @@ class TestIPLDLoader:
 
         loader = IPLDLoader(time_dim="tempo", publisher=publisher)
         loader._mapper = mock.Mock(return_value=mapper)
+        loader._store = mock.Mock()
         assert loader.dataset() is xarray.open_zarr.return_value
 
-        loader._mapper.assert_called_once_with(root="thiscontenthere")
+        loader._mapper.assert_called_once_with("thiscontenthere", loader._store.return_value)
         publisher.retrieve.assert_called_once_with()
-        xarray.open_zarr.assert_called_once_with(store=mapper, consolidated=True)
+        xarray.open_zarr.assert_called_once_with(store=mock.ANY, consolidated=True)
+        assert xarray.open_zarr.call_args.kwargs["store"].store is mapper
+
+    def test_dataset_not_published(self):
+        publisher = mock.Mock()
+        publisher.retrieve.return_value = None
+        loader = IPLDLoader(time_dim="tempo", publisher=publisher)
+        assert loader.dataset() is None
+
+    def test_dataset_prefetch(self, mocker):
+        mocker.patch("dc_etl.ipld.loader.xarray")
+        prefetch = mocker.patch("dc_etl.ipld.loader.prefetch")
+        publisher = mock.Mock()
+        loader = IPLDLoader(time_dim="tempo", publisher=publisher, prefetch=3)
+        loader._mapper = mock.Mock()
+        loader._store = mock.Mock()
+        loader.dataset()
+
+        prefetch.assert_called_once_with(loader._store.return_value, publisher.retrieve.return_value, 3)
 
     def test__mapper_w_root(self, mocker):
         HAMT = mocker.patch("dc_etl.ipld.loader.HAMT")
@@ -106,9 +521,106 @@ class TestIPLDLoader:
         loader = IPLDLoader(time_dim="tempo", publisher=None)
         assert loader._mapper("potato") is mapper
 
-    def test__time_to_integer(self, dataset):
+    def test__mapper_w_store(self, mocker):
+        HAMT = mocker.patch("dc_etl.ipld.loader.HAMT")
+        loader = IPLDLoader(time_dim="tempo", publisher=None)
+        assert loader._mapper("potato", "store") is HAMT.return_value
+        HAMT.assert_called_once_with(store="store", root_node_id="potato")
+
+    def test__store(self, mocker):
+        IPFSStore = mocker.patch("dc_etl.ipld.loader.IPFSStore")
         loader = IPLDLoader(time_dim="tempo", publisher=None)
-        assert loader._time_to_integer(dataset, npdate(2000, 7, 7)) == 188
+        assert loader._store() is IPFSStore.return_value
+
+    def test__store_w_store(self, mocker):
+        IPFSStore = mocker.patch("dc_etl.ipld.loader.IPFSStore")
+        loader = IPLDLoader(time_dim="tempo", publisher=None, store="store")
+        assert loader._store() == "store"
+        IPFSStore.assert_not_called()
+
+        store = loader._store(write=True)
+        assert isinstance(store, BorrowedStore)
+        assert store.store == "store"
+
+    def test__store_w_cache(self, mocker, tmpdir):
+        IPFSStore = mocker.patch("dc_etl.ipld.loader.IPFSStore")
+        cache = BlockCache(tmpdir)
+        loader = IPLDLoader(time_dim="tempo", publisher=None, cache=cache)
+        store = loader._store()
+        assert isinstance(store, CachingStore)
+        assert store.store is IPFSStore.return_value
+        assert store.cache is cache
+
+    def test__store_w_node_cache(self, mocker, tmpdir):
+        IPFSStore = mocker.patch("dc_etl.ipld.loader.IPFSStore")
+        cache = BlockCache(tmpdir)
+        node_cache = NodeCache()
+        loader = IPLDLoader(time_dim="tempo", publisher=None, cache=cache, node_cache=node_cache)
+        store = loader._store()
+        assert store.cache is node_cache
+        assert store.store.cache is cache
+        assert store.store.store is IPFSStore.return_value
+
+    def test__store_w_concurrency(self, mocker, tmpdir):
+        IPFSStore = mocker.patch("dc_etl.ipld.loader.IPFSStore")
+        cache = BlockCache(tmpdir)
+        loader = IPLDLoader(time_dim="tempo", publisher=None, cache=cache, concurrency=4)
+        assert isinstance(loader._store(), CachingStore)
+
+        store = loader._store(write=True)
+        assert isinstance(store, PipelinedStore)
+        assert store.concurrency == 4
+        assert isinstance(store.store, CachingStore)
+        assert store.store.store is IPFSStore.return_value
+
+    def test__publish(self, dataset, mocker):
+        publisher = MemoryIPLDPublisher()
+        mocker.spy(publisher, "publish")
+        mapper = mock.Mock()
+        store = mock.Mock()
+
+        def flush(root):
+            assert root is mapper.root_node_id
+            assert publisher.cid is None
+
+        store.flush = flush
+        loader = IPLDLoader(time_dim="tempo", publisher=publisher)
+        loader._publish(mapper, store, MockMapper(dataset))
+        publisher.publish.assert_called_once_with(mapper.root_node_id)
+
+        manifest = publisher.retrieve_manifest()
+        assert manifest["time"] == {
+            "start": "2000-01-01T00:00:00.000000000",
+            "end": "2000-12-31T00:00:00.000000000",
+            "length": 366,
+        }
+        assert manifest["dims"] == {"tempo": 366}
+        assert manifest["variables"]["data"]["chunks"] == [30]
+        assert "source" not in manifest
+
+    def test__publish_with_state(self, dataset):
+        publisher = MemoryIPLDPublisher()
+        loader = IPLDLoader(time_dim="tempo", publisher=publisher)
+        loader._publish(mock.Mock(), mock.Mock(), MockMapper(dataset), {"a": 1})
+        assert publisher.retrieve_manifest()["source"] == {"a": 1}
+
+    def test__publish_without_manifests(self, mocker):
+        dataset_manifest = mocker.patch("dc_etl.ipld.loader.dataset_manifest")
+
+        class Publisher(IPLDPublisher):
+            def publish(self, cid):
+                self.cid = cid
+
+        publisher = Publisher()
+        loader = IPLDLoader(time_dim="tempo", publisher=publisher)
+        loader._publish(mock.Mock(root_node_id="contentid"), mock.Mock(), mock.Mock())
+        assert publisher.cid == "contentid"
+        dataset_manifest.assert_not_called()
+
+    def test_manifest(self):
+        publisher = mock.Mock()
+        loader = IPLDLoader(time_dim="tempo", publisher=publisher)
+        assert loader.manifest() is publisher.retrieve_manifest.return_value
 
 
 @pytest.fixture
@@ -117,4 +629,34 @@ def dataset():
         numpy.datetime64("2000-01-01", "ns"), numpy.datetime64("2001-01-01", "ns"), numpy.timedelta64(1, "D")
     )
     data = numpy.random.randn(len(time))
-    return mock_dataset(data=("data", data), dims=[("tempo", time)])
+    dataset = mock_dataset(data=("data", data), dims=[("tempo", time)])
+    dataset.data.encoding["chunks"] = (30,)
+    return dataset
+
+
+@pytest.fixture
+def spatial_dataset():
+    time = numpy.arange(
+        numpy.datetime64("2000-01-01", "ns"), numpy.datetime64("2000-02-01", "ns"), numpy.timedelta64(1, "D")
+    )
+    data = numpy.random.default_rng(0).normal(10.0, 2.0, (len(time), 4, 6))
+    dataset = mock_dataset(
+        data=("data", data), dims=[("tempo", time), ("latitude", numpy.arange(4.0)), ("longitude", numpy.arange(6.0))]
+    )
+    dataset.data.encoding["chunks"] = (5, 4, 6)
+    return transformers.multiscales([2, 4])(dataset)
+
+
+class MockMapper(dict):
+    """Stands in for a HAMT, with an existing dataset already written to it."""
+
+    root_node_id = "contentid"
+
+    def __init__(self, dataset=None):
+        self.written = []
+        if dataset is not None:
+            dataset.to_zarr(store=self, consolidated=True)
+
+    def __setitem__(self, key, value):
+        self.written.append(key)
+        super().__setitem__(key, value)
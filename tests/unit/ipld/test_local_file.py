@@ -13,3 +13,30 @@ class TestLocalFileIPLDPublisher:
         assert publisher.retrieve() is None
         publisher.publish(cid)
         assert publisher.retrieve() == cid
+
+    @staticmethod
+    def test_manifest(tmpdir):
+        cid = CID.decode("bafyreic5rlxomntm5as6dwi3nwsfueq7vqcfqoqwqu5y3xuu6w5nyichpq")
+        path = file(tmpdir) / "test.cid"
+        publisher = LocalFileIPLDPublisher(path)
+        assert publisher.retrieve_manifest() is None
+
+        publisher.publish(cid)
+        assert publisher.retrieve_manifest() is None
+
+        publisher.publish_manifest(cid, {"time": {"end": "2000-01-01"}})
+        publisher.publish(cid)
+        assert publisher.retrieve() == cid
+        assert publisher.retrieve_manifest() == {"time": {"end": "2000-01-01"}}
+        assert (file(tmpdir) / "test.manifest.json").exists()
+
+    @staticmethod
+    def test_stale_manifest(tmpdir):
+        cid = CID.decode("bafyreic5rlxomntm5as6dwi3nwsfueq7vqcfqoqwqu5y3xuu6w5nyichpq")
+        other = CID.decode("bafyreidykglsfhoixmivffc5uwhcgshx4j465xwqntbmu43nb2dzqwfvae")
+        path = file(tmpdir) / "test.cid"
+        publisher = LocalFileIPLDPublisher(path)
+        publisher.publish_manifest(cid, {"time": {"end": "2000-01-01"}})
+        publisher.publish(cid)
+        publisher.publish(other)
+        assert publisher.retrieve_manifest() is None
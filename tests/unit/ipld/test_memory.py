@@ -0,0 +1,147 @@
+import numpy
+import pytest
+import xarray
+
+from multiformats import CID
+from py_hamt import HAMT
+
+from dc_etl import transformers
+from dc_etl.config import _Configuration
+from dc_etl.fetch import Timespan
+from dc_etl.ipld.memory import MemoryIPLDLoader, MemoryIPLDPublisher, MemoryStore
+from dc_etl.ipld.stores import LinkingStore, block_cid, linked_block
+from dc_etl.stats import Statistics
+from tests.conftest import npdate
+from tests.unit.conftest import mock_dataset
+
+from .conftest import MockStore
+
+
+@pytest.fixture
+def dataset():
+    time = numpy.arange(
+        numpy.datetime64("2000-01-01", "ns"), numpy.datetime64("2000-03-01", "ns"), numpy.timedelta64(1, "D")
+    )
+    dataset = mock_dataset(
+        data=("data", numpy.random.randn(len(time), 7)), dims=[("tempo", time), ("x", numpy.arange(7))]
+    )
+    dataset.data.encoding["chunks"] = (10, 2)
+    return dataset
+
+
+class TestMemoryStore:
+    def test_save_load(self):
+        store = MemoryStore()
+        raw = store.save_raw(b"hello")
+        node = store.save_dag_cbor(b"\xa0")
+        assert raw == block_cid(b"hello", "raw")
+        assert node == block_cid(b"\xa0", "dag-cbor")
+        assert store.load(raw) == b"hello"
+        assert store.load(node) == b"\xa0"
+
+
+class TestMemoryIPLDPublisher:
+    def test_publish_retrieve(self):
+        cid = CID.decode("bafyreic5rlxomntm5as6dwi3nwsfueq7vqcfqoqwqu5y3xuu6w5nyichpq")
+        publisher = MemoryIPLDPublisher()
+        assert publisher.retrieve() is None
+        assert publisher.retrieve_manifest() is None
+
+        publisher.publish_manifest(cid, {"time": {}})
+        publisher.publish(cid)
+        assert publisher.retrieve() == cid
+        assert publisher.retrieve_manifest() == {"time": {}}
+
+        # Only the manifest published with the current CID
+        publisher.publish(CID.decode("bafyreidykglsfhoixmivffc5uwhcgshx4j465xwqntbmu43nb2dzqwfvae"))
+        assert publisher.retrieve_manifest() is None
+
+
+class TestMemoryIPLDLoader:
+    def test_defaults(self):
+        loader = MemoryIPLDLoader("tempo", diff=True)
+        assert isinstance(loader.publisher, MemoryIPLDPublisher)
+        assert isinstance(loader.store, MemoryStore)
+        assert loader._store() is loader.store
+        assert loader.diff
+
+    def test_as_component(self):
+        config = _Configuration(
+            {"name": "memory", "time_dim": "tempo", "publisher": {"name": "testing", "foo": "bar"}}, "some/file", []
+        )
+        loader = config.as_component("loader")
+        assert isinstance(loader, MemoryIPLDLoader)
+        assert loader.publisher.foo == "bar"
+        assert isinstance(loader.store, MemoryStore)
+
+    def test_as_component_without_publisher(self):
+        config = _Configuration({"name": "memory", "time_dim": "tempo"}, "some/file", [])
+        loader = config.as_component("loader")
+        assert isinstance(loader.publisher, MemoryIPLDPublisher)
+
+    def test_bulk_initial_append(self, dataset):
+        loader = MemoryIPLDLoader("tempo", bulk=True)
+        loader.initial(dataset, Timespan(npdate(2000, 1, 1), npdate(2000, 1, 31)))
+        loader.append(dataset, Timespan(npdate(2000, 2, 1), npdate(2000, 2, 29)))
+        xarray.testing.assert_equal(loader.dataset().load(), dataset)
+
+    def test_merge_partitions(self, dataset):
+        loader = MemoryIPLDLoader("tempo")
+        span = Timespan(npdate(2000, 1, 1), npdate(2000, 2, 29))
+        roots = [loader.initial_partition(dataset, span, i, 2, "x") for i in range(2)]
+        raw = {cid for cid in loader.store.blocks if cid.codec.name == "raw"}
+
+        loader.merge_partitions(roots)
+        xarray.testing.assert_equal(loader.dataset().load(), dataset)
+
+        # Data is linked to, not saved again, and the consolidated metadata is the same as the partitions'
+        assert {cid for cid in loader.store.blocks if cid.codec.name == "raw"} == raw
+
+    def test_replace_diff_compares_by_cid(self, dataset):
+        dataset = dataset.isel(x=slice(0, 6))
+        store = MockStore()
+        loader = MemoryIPLDLoader("tempo", store=store, diff=True)
+        loader.initial(dataset, Timespan(npdate(2000, 1, 1), npdate(2000, 2, 29)))
+        linked = HAMT(store=LinkingStore(store), root_node_id=loader.publisher.retrieve())
+        chunks = {linked_block(linked[key]) for key in linked if key.startswith("data/") and "/." not in key}
+
+        store.loads.clear()
+        assert loader.replace(dataset, Timespan(npdate(2000, 1, 11), npdate(2000, 1, 30))) == (0, 6)
+        assert chunks.isdisjoint(store.loads)
+
+    def test_replace_diff_counts_only_data_chunks(self, dataset):
+        dataset = transformers.multiscales([2], ["x"])(dataset)
+        loader = MemoryIPLDLoader("tempo", diff=True, chunk_index=True)
+        loader.initial(dataset, Timespan(npdate(2000, 1, 1), npdate(2000, 2, 29)))
+
+        replaced = dataset.copy(deep=True)
+        replaced.data[12, 0] = 42.0
+        replaced.data[12, 6] = 42.0
+        assert loader.replace(replaced, Timespan(npdate(2000, 1, 11), npdate(2000, 1, 20))) == (2, 2)
+        assert loader.dataset().data.values[12, 6] == 42.0
+
+    @pytest.mark.parametrize("chunk_index", [False, True])
+    def test_statistics_append_after_replace(self, dataset, chunk_index):
+        loader = MemoryIPLDLoader("tempo", statistics=True, chunk_index=chunk_index)
+        loader.initial(dataset, Timespan(npdate(2000, 1, 1), npdate(2000, 1, 31)))
+
+        # The largest value so far is replaced, so the new one can only be found with the chunk index
+        time, x = numpy.unravel_index(int(numpy.argmax(dataset.data.values[:31])), (31, 7))
+        replaced = dataset.copy(deep=True)
+        replaced.data[time, x] = -1.0
+        replaced.data[0, 0] = numpy.nan
+        loader.replace_many(replaced, [Timespan(dataset.tempo.values[t], dataset.tempo.values[t]) for t in (0, time)])
+        loader.append(replaced, Timespan(npdate(2000, 2, 1), npdate(2000, 2, 29)))
+        xarray.testing.assert_equal(loader.dataset().load(), replaced)
+
+        statistics = Statistics.from_dict(loader.manifest()["statistics"]["data"])
+        expected = Statistics.of(replaced.data.values)
+        assert statistics.count == expected.count
+        assert statistics.nan_count == expected.nan_count == 1
+        assert statistics.minimum == expected.minimum
+        assert statistics.mean == pytest.approx(expected.mean)
+        assert statistics.variance == pytest.approx(expected.variance)
+        if chunk_index:
+            assert statistics.maximum == expected.maximum
+        else:
+            assert numpy.isnan(statistics.maximum)
@@ -0,0 +1,488 @@
+import threading
+
+import dag_cbor
+
+from unittest import mock
+
+import pytest
+
+from py_hamt import HAMT
+
+from dc_etl.errors import BlockStoreError
+from dc_etl.ipld.cache import BlockCache, NodeCache
+from dc_etl.ipld.stores import (
+    BorrowedStore,
+    BulkStore,
+    CachingStore,
+    CopyingStore,
+    Link,
+    LinkingStore,
+    PipelinedStore,
+    block_cid,
+    close,
+    closing,
+    flush,
+    linked_block,
+    prefetch,
+    same_block,
+)
+
+from .conftest import MockStore
+
+
+def test_block_cid():
+    store = MockStore()
+    assert block_cid(b"hello", "raw") == store.save_raw(b"hello")
+    assert block_cid(b"\xa0", "dag-cbor") == store.save_dag_cbor(b"\xa0")
+    assert block_cid(b"hello", "raw", "sha2-256") != store.save_raw(b"hello")
+
+
+def test_flush():
+    store = mock.Mock()
+    flush(store, "root")
+    store.flush.assert_called_once_with("root")
+
+    flush(object())  # No flush method, no problem
+
+
+def test_close():
+    store = mock.Mock()
+    close(store)
+    store.close.assert_called_once_with()
+
+    close(object())  # No close method, no problem
+
+
+def test_closing():
+    store = CachingStore(mock.Mock(), NodeCache())
+    with pytest.raises(RuntimeError):
+        with closing(store) as closed:
+            assert closed is store
+            raise RuntimeError("oops")
+
+    store.store.close.assert_called_once_with()
+
+
+def test_borrowed_store():
+    inner = mock.Mock()
+    store = CachingStore(BorrowedStore(inner), NodeCache())
+    with closing(store):
+        store.save_raw(b"hello")
+
+    inner.save_raw.assert_called_once_with(b"hello")
+    inner.close.assert_not_called()
+
+
+def test_prefetch():
+    inner = MockStore()
+    tree = MockTree(inner)
+    for path in ("aaa", "aab", "aba", "baa", "bbb"):
+        tree.insert(path, path.encode())
+
+    store = CachingStore(inner, NodeCache())
+    inner.loads.clear()
+    prefetch(store, tree.root_node_id, 2)
+    assert len(inner.loads) == 3  # Root, "a", and "b"
+
+    inner.loads.clear()
+    assert tree.get("aba") == b"aba"
+    tree.store = store
+    assert tree.get("aba") == b"aba"
+    assert [cid.codec.name for cid in inner.loads] == ["dag-cbor", "dag-cbor", "dag-cbor", "raw", "dag-cbor", "raw"]
+
+    # Stops at the leaves
+    inner.loads.clear()
+    prefetch(store, tree.root_node_id, 10)
+    assert all(cid.codec.name == "dag-cbor" for cid in inner.loads)
+
+
+class TestCachingStore:
+    def test_load_node_cache(self):
+        inner = MockStore()
+        raw = inner.save_raw(b"hello")
+        node = inner.save_dag_cbor(b"\xa0")
+        store = CachingStore(inner, NodeCache())
+
+        for _ in range(2):
+            assert store.load(raw) == b"hello"
+            assert store.load(node) == b"\xa0"
+
+        assert inner.loads == [raw, node, raw]
+
+    def test_load(self, tmpdir):
+        inner = MockStore()
+        cid = inner.save_raw(b"hello")
+        store = CachingStore(inner, BlockCache(tmpdir))
+
+        assert store.load(cid) == b"hello"
+        assert store.load(cid) == b"hello"
+        assert inner.loads == [cid]
+        assert (store.cache.hits, store.cache.misses) == (1, 1)
+
+    def test_save(self, tmpdir):
+        inner = MockStore()
+        store = CachingStore(inner, BlockCache(tmpdir))
+        raw = store.save_raw(b"hello")
+        node = store.save_dag_cbor(b"\xa0")
+
+        assert store.load(raw) == b"hello"
+        assert store.load(node) == b"\xa0"
+        assert inner.loads == []
+
+    def test_passthrough(self, tmpdir):
+        inner = MockStore()
+        store = CachingStore(inner, BlockCache(tmpdir))
+        assert store.blocks is inner.blocks
+
+
+class TestCopyingStore:
+    def test_copy_by_reference(self):
+        inner = MockStore()
+        tree = MockTree(inner)
+        for path in ("aa", "ab", "ba"):
+            tree.insert(path, path.encode())
+        inner.loads.clear()
+        inner.saves.clear()
+
+        source = MockTree(LinkingStore(inner))
+        source.root_node_id = tree.root_node_id
+        copy = MockTree(CopyingStore(inner))
+        for path in ("ab", "ba"):
+            copy.insert(path, source.get(path))
+
+        # Only nodes are loaded and saved
+        assert all(cid.codec.name == "dag-cbor" for cid in inner.loads + inner.saves)
+        assert copy.get("ab") == b"ab"
+        assert copy.get("ba") == b"ba"
+
+    def test_copy_decoded_link(self):
+        inner = MockStore()
+        cid = inner.save_raw(dag_cbor.encode(b"hello"))
+        inner.saves.clear()
+
+        # A HAMT which decodes values reads the link as a CID, and encodes it again when it is written
+        link = dag_cbor.decode(LinkingStore(inner).load(cid))
+        assert CopyingStore(inner).save_raw(dag_cbor.encode(link)) == cid
+        assert inner.saves == []
+
+    def test_save_as_usual(self):
+        inner = MockStore()
+        store = CopyingStore(inner)
+        assert store.save_raw(b"new") == block_cid(b"new", "raw")
+        assert inner.saves == [block_cid(b"new", "raw")]
+
+
+class TestLinkingStore:
+    def test_load(self):
+        inner = MockStore()
+        raw = inner.save_raw(b"hello")
+        node = inner.save_dag_cbor(b"\xa0")
+
+        store = LinkingStore(inner)
+        link = store.load(raw)
+        assert isinstance(link, Link)
+        assert link.cid == raw
+        assert dag_cbor.decode(link) == raw
+        assert store.load(node) == b"\xa0"
+        assert inner.loads == [node]
+
+
+def test_linked_block():
+    cid = block_cid(b"hello", "raw")
+    assert linked_block(Link(cid)) == cid
+    assert linked_block(cid) == cid
+    assert linked_block(dag_cbor.encode(cid)) == cid
+    assert linked_block(b"hello") is None
+    assert linked_block(dag_cbor.encode(b"hello")) is None
+
+    # Looks like an encoded CID, but isn't one
+    assert linked_block(b"\xd8\x2a\x58\x05\x00\x01\x99\x99\x99") is None
+    assert linked_block(b"\xd8\x2a\x58\x05\x00\x01\x55\x1e\x20") is None
+
+
+def test_same_block():
+    inner = MockStore()
+    raw = inner.save_raw(b"hello")
+    store = LinkingStore(inner)
+    assert same_block(store.load(raw), b"hello")
+    assert not same_block(store.load(raw), b"goodbye")
+
+    # Read from a HAMT which decodes values, so saved them encoded
+    encoded = inner.save_raw(dag_cbor.encode(b"hello"))
+    assert same_block(dag_cbor.decode(store.load(encoded)), b"hello")
+    assert not same_block(dag_cbor.decode(store.load(encoded)), b"goodbye")
+    assert inner.loads == []
+
+
+class BlockingStore(MockStore):
+    """Holds saves until released, so tests can observe them in flight."""
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def _save(self, data, codec):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        self.release.wait()
+        with self.lock:
+            self.in_flight -= 1
+
+        return super()._save(data, codec)
+
+
+class TestPipelinedStore:
+    def test_save_and_flush(self):
+        inner = BlockingStore()
+        store = PipelinedStore(inner, concurrency=2)
+
+        raw = store.save_raw(b"hello")
+        node = store.save_dag_cbor(b"\xa0")
+        assert raw == block_cid(b"hello", "raw")
+        assert node == block_cid(b"\xa0", "dag-cbor")
+
+        # Still in flight, so loaded from memory
+        assert store.load(raw) == b"hello"
+        assert inner.loads == []
+        assert inner.blocks == {}
+
+        inner.release.set()
+        store.flush()
+        assert inner.blocks == {raw: b"hello", node: b"\xa0"}
+        assert store._pending == {}
+        assert store._pool is None
+
+        assert store.load(raw) == b"hello"
+        assert inner.loads == [raw]
+
+    def test_bounded(self):
+        inner = BlockingStore()
+        store = PipelinedStore(inner, concurrency=3)
+        threading.Timer(0.1, inner.release.set).start()
+        cids = [store.save_raw(bytes([i])) for i in range(10)]
+        store.flush()
+
+        assert inner.max_in_flight == 3
+        assert set(inner.blocks) == set(cids)
+
+    def test_save_same_block_twice(self):
+        inner = BlockingStore()
+        store = PipelinedStore(inner, concurrency=2)
+        store.save_raw(b"hello")
+        store.save_raw(b"hello")
+        inner.release.set()
+        store.flush()
+        assert len(inner.saves) == 1
+
+    def test_flush_flushes_wrapped_store(self):
+        inner = mock.Mock()
+        store = PipelinedStore(inner, concurrency=2)
+        store.flush("root")
+        inner.flush.assert_called_once_with("root")
+
+    def test_close(self):
+        inner = BlockingStore()
+        store = PipelinedStore(inner, concurrency=2)
+        raw = store.save_raw(b"hello")
+        threading.Timer(0.1, inner.release.set).start()
+        store.close()
+
+        assert inner.blocks == {raw: b"hello"}
+        assert store._pool is None
+
+        store.close()  # Nothing to do
+
+    def test_mismatched_cid(self):
+        inner = MockStore()
+        store = PipelinedStore(inner, concurrency=2, hasher="sha2-256")
+        store.save_raw(b"hello")
+        with pytest.raises(BlockStoreError):
+            store.flush()
+
+    def test_error_raised_on_next_save(self):
+        inner = mock.Mock()
+        inner.save_raw.side_effect = ConnectionError("oops")
+        store = PipelinedStore(inner, concurrency=1)
+        store.save_raw(b"hello")
+        store._pool.shutdown(wait=True)
+        with pytest.raises(ConnectionError):
+            store.save_raw(b"goodbye")
+
+        store.flush()  # Error was already raised
+
+
+class MockTree:
+    """A persistent tree that rewrites the path from the root for every insertion, the way a HAMT does."""
+
+    def __init__(self, store):
+        self.store = store
+        self.root_node_id = None
+
+    def insert(self, path: str, value: bytes):
+        leaf = self.store.save_raw(value)
+        self.root_node_id = self._insert(self.root_node_id, path, leaf)
+
+    def _insert(self, node_id, path, leaf):
+        node = dag_cbor.decode(self.store.load(node_id)) if node_id else {}
+        if len(path) == 1:
+            node[path] = leaf
+        else:
+            node[path[0]] = self._insert(node.get(path[0]), path[1:], leaf)
+
+        return self.store.save_dag_cbor(dag_cbor.encode(node))
+
+    def get(self, path):
+        node = dag_cbor.decode(self.store.load(self.root_node_id))
+        for key in path[:-1]:
+            node = dag_cbor.decode(self.store.load(node[key]))
+
+        return self.store.load(node[path[-1]])
+
+
+class TestBulkStore:
+    PATHS = ["aaa", "aab", "aba", "abb", "baa", "bab", "bba", "bbb"]
+
+    def build(self, store):
+        tree = MockTree(store)
+        if isinstance(store, BulkStore):
+            store.root = lambda: tree.root_node_id
+
+        for path in self.PATHS:
+            tree.insert(path, path.encode())
+
+        return tree
+
+    def test_only_final_nodes_written(self):
+        unbuffered = MockStore()
+        expected = self.build(unbuffered)
+        expected_nodes = {cid for cid in unbuffered.saves if cid.codec.name == "dag-cbor"}
+
+        inner = MockStore()
+        store = BulkStore(inner)
+        tree = self.build(store)
+        assert tree.root_node_id == expected.root_node_id
+        assert inner.saves == [block_cid(path.encode(), "raw") for path in self.PATHS]
+
+        store.flush(tree.root_node_id)
+        nodes = [cid for cid in inner.saves if cid.codec.name == "dag-cbor"]
+        assert len(nodes) == len(set(nodes)) == 7
+        assert set(nodes) < expected_nodes
+        assert nodes[-1] == tree.root_node_id
+        assert store._nodes == {}
+
+        # Once flushed, nodes are loaded from the wrapped store
+        assert store.load(tree.root_node_id) == inner.blocks[tree.root_node_id]
+
+        tree = MockTree(inner)
+        tree.root_node_id = expected.root_node_id
+        assert [tree.get(path) for path in self.PATHS] == [path.encode() for path in self.PATHS]
+
+    def test_compact(self):
+        inner = MockStore()
+        store = BulkStore(inner, compact_bytes=1)
+        tree = self.build(store)
+        assert len(store._nodes) < 15
+
+        store.compact()
+        assert len(store._nodes) == 7
+
+        store.flush(tree.root_node_id)
+        assert len([cid for cid in inner.saves if cid.codec.name == "dag-cbor"]) == 7
+
+    def test_compact_keeps_nodes_saved_after_root(self):
+        store = BulkStore(MockStore())
+        root = store.save_dag_cbor(dag_cbor.encode({}))
+        orphan = store.save_dag_cbor(dag_cbor.encode({"a": 1}))
+        in_progress = store.save_dag_cbor(dag_cbor.encode({"b": 2}))
+        store.root = lambda: orphan
+        store.compact()
+        assert list(store._nodes) == [orphan, in_progress]
+
+        store.root = lambda: None
+        store.compact()
+        assert list(store._nodes) == [orphan, in_progress]
+
+        store.root = lambda: in_progress
+        store.compact()
+        assert list(store._nodes) == [in_progress]
+        assert root not in store._nodes
+
+    def test_flush_without_root(self):
+        inner = mock.Mock()
+        store = BulkStore(inner)
+        store.save_dag_cbor(dag_cbor.encode({}))
+        store.flush()
+        inner.save_dag_cbor.assert_not_called()
+        inner.flush.assert_called_once_with(None)
+
+    def test_mismatched_cid(self):
+        store = BulkStore(MockStore(), hasher="sha2-256")
+        root = store.save_dag_cbor(dag_cbor.encode({}))
+        with pytest.raises(BlockStoreError):
+            store.flush(root)
+
+    def test_links_in_lists(self):
+        inner = MockStore()
+        store = BulkStore(inner)
+        child = store.save_dag_cbor(dag_cbor.encode({}))
+        root = store.save_dag_cbor(dag_cbor.encode({"children": [child, child]}))
+        store.flush(root)
+        assert inner.saves == [child, root]
+
+
+class TestWithHAMT:
+    """The wrappers with a real py-hamt HAMT, rather than :class:`MockTree`, so that the way py-hamt encodes values and
+    links nodes is covered."""
+
+    KEYS = [f"data/{i}.{j}" for i in range(10) for j in range(3)]
+
+    def build(self, store):
+        hamt = HAMT(store=store)
+        if isinstance(store, BulkStore):
+            store.root = lambda: hamt.root_node_id
+
+        for key in self.KEYS:
+            hamt[key] = key.encode()
+
+        return hamt
+
+    def test_bulk_store(self):
+        expected = self.build(MockStore())
+
+        inner = MockStore()
+        store = BulkStore(inner, compact_bytes=1 << 10)
+        hamt = self.build(store)
+        store.flush(hamt.root_node_id)
+        assert hamt.root_node_id == expected.root_node_id
+
+        nodes = [cid for cid in inner.saves if cid.codec.name == "dag-cbor"]
+        assert len(nodes) == len(set(nodes))
+        assert nodes[-1] == hamt.root_node_id
+
+        hamt = HAMT(store=inner, root_node_id=hamt.root_node_id)
+        assert sorted(hamt) == sorted(self.KEYS)
+        assert all(hamt[key] == key.encode() for key in self.KEYS)
+
+    def test_linking_and_copying_stores(self):
+        inner = MockStore()
+        source = self.build(inner)
+        inner.loads.clear()
+        inner.saves.clear()
+
+        linked = HAMT(store=LinkingStore(inner), root_node_id=source.root_node_id)
+        copy = HAMT(store=CopyingStore(inner))
+        for key in linked:
+            copy[key] = linked[key]
+            assert same_block(linked[key], key.encode())
+
+        # Only nodes are loaded and saved
+        assert all(cid.codec.name == "dag-cbor" for cid in inner.loads + inner.saves)
+
+        copy = HAMT(store=inner, root_node_id=copy.root_node_id)
+        assert sorted(copy) == sorted(self.KEYS)
+        assert all(copy[key] == key.encode() for key in self.KEYS)
@@ -0,0 +1,172 @@
+import numpy
+import pytest
+import xarray
+import zarr
+
+from dc_etl import transformers
+from dc_etl.config import _Configuration
+from dc_etl.fetch import Timespan
+from dc_etl.filespec import file
+from dc_etl.loaders.directory import DirectoryLoader
+from dc_etl.stats import Statistics
+from tests.conftest import npdate
+from tests.unit.conftest import mock_dataset
+
+
+@pytest.fixture
+def dataset():
+    time = numpy.arange(
+        numpy.datetime64("2000-01-01", "ns"), numpy.datetime64("2001-01-01", "ns"), numpy.timedelta64(1, "D")
+    )
+    dataset = mock_dataset(data=("data", numpy.random.randn(len(time))), dims=[("tempo", time)])
+    dataset.data.encoding["chunks"] = (30,)
+    return dataset
+
+
+@pytest.fixture
+def spatial_dataset():
+    time = numpy.arange(
+        numpy.datetime64("2000-01-01", "ns"), numpy.datetime64("2000-02-01", "ns"), numpy.timedelta64(1, "D")
+    )
+    data = numpy.random.default_rng(0).normal(10.0, 2.0, (len(time), 4, 6))
+    dataset = mock_dataset(
+        data=("data", data), dims=[("tempo", time), ("latitude", numpy.arange(4.0)), ("longitude", numpy.arange(6.0))]
+    )
+    dataset.data.encoding["chunks"] = (5, 4, 6)
+    return transformers.multiscales([2, 4])(dataset)
+
+
+class TestDirectoryLoader:
+    def test_as_component(self, tmpdir):
+        config = _Configuration({"name": "directory", "path": file(tmpdir), "time_dim": "tempo"}, "some/file", [])
+        loader = config.as_component("loader")
+        assert isinstance(loader, DirectoryLoader)
+        assert loader.time_dim == "tempo"
+
+    def test_initial_append_replace(self, tmpdir, dataset):
+        loader = DirectoryLoader(file(tmpdir) / "dataset.zarr", "tempo")
+        assert loader.dataset() is None
+
+        loader.initial(dataset, Timespan(npdate(2000, 1, 1), npdate(2000, 6, 30)))
+        assert loader.dataset().tempo[-1] == npdate(2000, 6, 30)
+
+        loader.append(dataset, Timespan(npdate(2000, 7, 1), npdate(2000, 12, 31)))
+        xarray.testing.assert_equal(loader.dataset().load(), dataset)
+
+        replace_dataset = dataset.copy(deep=True)
+        replace_dataset.data[:] = 42.0
+        loader.replace(replace_dataset, Timespan(npdate(2000, 3, 1), npdate(2000, 3, 3)))
+        loader.replace_many(
+            replace_dataset,
+            [Timespan(npdate(2000, 5, 1), npdate(2000, 5, 1)), Timespan(npdate(2000, 11, 1), npdate(2000, 11, 2))],
+        )
+
+        expected = dataset.data.values.copy()
+        expected[[60, 61, 62, 121, 305, 306]] = 42.0
+        numpy.testing.assert_array_equal(loader.dataset().data.values, expected)
+        assert (tmpdir / "dataset.zarr" / "data" / "0").exists()
+
+    def test_manifest(self, tmpdir, dataset):
+        loader = DirectoryLoader(file(tmpdir) / "dataset.zarr", "tempo")
+        assert loader.manifest() is None
+
+        loader.initial(dataset, Timespan(npdate(2000, 1, 1), npdate(2000, 6, 30)), state={"a": 1})
+        manifest = loader.manifest()
+        assert manifest["time"]["end"] == "2000-06-30T00:00:00.000000000"
+        assert manifest["source"] == {"a": 1}
+        assert (tmpdir / "dataset.manifest.json").exists()
+
+        loader.append(dataset, Timespan(npdate(2000, 7, 1), npdate(2000, 12, 31)), state={"a": 2})
+        assert loader.manifest()["time"]["length"] == 366
+        assert loader.manifest()["source"] == {"a": 2}
+
+        loader.replace(dataset, Timespan(npdate(2000, 3, 1), npdate(2000, 3, 3)))
+        assert "source" not in loader.manifest()
+
+    def test_statistics(self, tmpdir, dataset):
+        loader = DirectoryLoader(file(tmpdir) / "dataset.zarr", "tempo", statistics=True)
+        loader.initial(dataset.chunk(tempo=30), Timespan(npdate(2000, 1, 1), npdate(2000, 6, 30)))
+        loader.append(dataset.chunk(tempo=30), Timespan(npdate(2000, 7, 1), npdate(2000, 12, 31)))
+        statistics = Statistics.from_dict(loader.manifest()["statistics"]["data"])
+        expected = Statistics.of(dataset.data.values)
+        assert statistics.count == expected.count == 366
+        assert statistics.minimum == expected.minimum
+        assert statistics.maximum == expected.maximum
+        assert statistics.mean == pytest.approx(expected.mean)
+        assert statistics.variance == pytest.approx(expected.variance)
+
+        replaced = dataset.copy(deep=True)
+        replaced.data[60:63] = 42.0
+        loader.replace(replaced, Timespan(npdate(2000, 3, 1), npdate(2000, 3, 3)))
+        statistics = Statistics.from_dict(loader.manifest()["statistics"]["data"])
+        expected = Statistics.of(replaced.data.values)
+        assert statistics.count == expected.count
+        assert statistics.maximum == expected.maximum == 42.0
+        assert statistics.mean == pytest.approx(expected.mean)
+        assert statistics.variance == pytest.approx(expected.variance)
+
+    @pytest.mark.parametrize("chunk_index", [False, True])
+    def test_statistics_append_after_replace(self, tmpdir, dataset, chunk_index):
+        loader = DirectoryLoader(file(tmpdir) / "dataset.zarr", "tempo", statistics=True, chunk_index=chunk_index)
+        loader.initial(dataset, Timespan(npdate(2000, 1, 1), npdate(2000, 6, 30)))
+
+        # The smallest value so far is replaced, so the new one can only be found with the chunk index
+        lowest = int(numpy.argmin(dataset.data.values[:182]))
+        replaced = dataset.copy(deep=True)
+        replaced.data[lowest] = 0.0
+        time = replaced.tempo.values[lowest]
+        loader.replace(replaced, Timespan(time, time))
+        loader.append(replaced, Timespan(npdate(2000, 7, 1), npdate(2000, 12, 31)))
+
+        statistics = Statistics.from_dict(loader.manifest()["statistics"]["data"])
+        expected = Statistics.of(replaced.data.values)
+        assert statistics.count == expected.count == 366
+        assert statistics.maximum == expected.maximum
+        assert statistics.mean == pytest.approx(expected.mean)
+        assert statistics.variance == pytest.approx(expected.variance)
+        if chunk_index:
+            assert statistics.minimum == expected.minimum
+        else:
+            assert numpy.isnan(statistics.minimum)
+
+    def test_chunk_index(self, tmpdir, dataset):
+        loader = DirectoryLoader(file(tmpdir) / "dataset.zarr", "tempo", chunk_index=True)
+        loader.initial(dataset, Timespan(npdate(2000, 1, 1), npdate(2000, 6, 30)))
+        loader.append(dataset, Timespan(npdate(2000, 7, 1), npdate(2000, 12, 31)))
+        replace_dataset = dataset.copy(deep=True)
+        replace_dataset.data[60:63] = 42.0
+        loader.replace(replace_dataset, Timespan(npdate(2000, 3, 1), npdate(2000, 3, 3)))
+
+        data = replace_dataset.data.values
+        index = zarr.open_consolidated(loader._store(), mode="r")["_chunk_index/data"][...]
+        assert index.shape == (13, 3)
+        for i, (minimum, maximum, fill) in enumerate(index):
+            assert minimum == data[i * 30 : (i + 1) * 30].min()
+            assert maximum == data[i * 30 : (i + 1) * 30].max()
+            assert fill == 0.0
+
+        assert loader.candidate_chunks("data", minimum=42.0) == [{"tempo": slice(60, 90)}]
+        assert list(loader.manifest()["variables"]) == ["data", "tempo"]
+        xarray.testing.assert_equal(loader.dataset().load(), replace_dataset)
+
+    def test_overviews(self, tmpdir, spatial_dataset):
+        dataset = spatial_dataset
+        loader = DirectoryLoader(file(tmpdir) / "dataset.zarr", "tempo")
+        loader.initial(dataset, Timespan(npdate(2000, 1, 1), npdate(2000, 1, 15)))
+        loader.append(dataset, Timespan(npdate(2000, 1, 16), npdate(2000, 1, 31)))
+        replace_dataset = dataset.copy(deep=True)
+        replace_dataset.data[:] = 42.0
+        loader.replace(replace_dataset, Timespan(npdate(2000, 1, 8), npdate(2000, 1, 9)))
+
+        expected = dataset.copy(deep=True)
+        expected.data[7:9] = 42.0
+        for factor in (2, 4):
+            coarsened = expected.coarsen(latitude=factor, longitude=factor, boundary="pad").mean()
+            xarray.testing.assert_allclose(loader.overview(factor).data.load(), coarsened.data)
+        assert list(loader.manifest()["variables"]) == ["data", "latitude", "longitude", "tempo"]
+
+    def test_initial_overwrites(self, tmpdir, dataset):
+        loader = DirectoryLoader(file(tmpdir), "tempo")
+        loader.initial(dataset, Timespan(npdate(2000, 1, 1), npdate(2000, 12, 31)))
+        loader.initial(dataset, Timespan(npdate(2000, 1, 1), npdate(2000, 1, 31)))
+        assert loader.dataset().sizes["tempo"] == 31
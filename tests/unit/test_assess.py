@@ -1,4 +1,16 @@
+import copy
+
+from unittest import mock
+
+import numpy
+import pytest
+import xarray
+
 from dc_etl import component
+from dc_etl.assessor import Assessment
+from dc_etl.assessors.freshness import FreshnessAssessor
+from dc_etl.fetch import Timespan
+from tests.conftest import npdate
 
 
 class TestDefaultAssessor:
@@ -6,3 +18,143 @@ class TestDefaultAssessor:
         assessor = component.assessor("default")
         assessor.start()
         assert True
+
+
+class TestAssessment:
+    def test_nothing(self):
+        assert Assessment().nothing
+        assert Assessment(state={"a": 1}).nothing
+        assert not Assessment(initial=Timespan(npdate(2000, 1, 1), npdate(2000, 12, 31))).nothing
+        assert not Assessment(append=Timespan(npdate(2000, 1, 1), npdate(2000, 12, 31))).nothing
+        assert not Assessment(replace=(Timespan(npdate(2000, 1, 1), npdate(2000, 12, 31)),)).nothing
+
+
+def year(year, size=100, modified="20000101000000"):
+    return {"size": size, "modified": modified, "start": f"{year}-01-01", "end": f"{year}-12-31"}
+
+
+@pytest.fixture
+def state():
+    return {"precip.1999.nc": year(1999), "precip.2000.nc": year(2000), "precip.2001.nc": year(2001)}
+
+
+@pytest.fixture
+def fetcher(state):
+    fetcher = mock.Mock()
+    fetcher.get_remote_state.return_value = state
+    fetcher.get_remote_timespan.return_value = Timespan(npdate(1999, 1, 1), npdate(2001, 6, 30))
+    return fetcher
+
+
+@pytest.fixture
+def loader(state):
+    loader = mock.Mock()
+    loader.manifest.return_value = {
+        "time": {"start": "1999-01-01T00:00:00.000000000", "end": "2001-06-30T00:00:00.000000000", "length": 912},
+        "source": copy.deepcopy(state),
+    }
+    return loader
+
+
+class TestFreshnessAssessor:
+    def test_as_component(self):
+        assessor = component.assessor("freshness", replace=False)
+        assert isinstance(assessor, FreshnessAssessor)
+        assert not assessor.replace
+        assert assessor.state
+
+    def test_unchanged(self, fetcher, loader, state):
+        assessment = FreshnessAssessor().start(fetcher=fetcher, loader=loader)
+        assert assessment == Assessment(state=state)
+        assert assessment.nothing
+        fetcher.get_remote_timespan.assert_not_called()
+
+    def test_initial(self, fetcher, loader, state):
+        loader.manifest.return_value = None
+        loader.dataset.return_value = None
+        assessment = FreshnessAssessor().start(fetcher=fetcher, loader=loader)
+        assert assessment == Assessment(initial=fetcher.get_remote_timespan.return_value, state=state)
+
+    def test_no_manifest(self, fetcher, loader, state):
+        loader.manifest.return_value = None
+        loader.time_dim = "tempo"
+        times = numpy.arange(npdate(1999, 1, 1), npdate(2001, 7, 1), numpy.timedelta64(1, "D")).astype(
+            "datetime64[ns]"
+        )
+        loader.dataset.return_value = xarray.Dataset(coords={"tempo": times})
+        fetcher.get_remote_timespan.return_value = Timespan(npdate(1999, 1, 1), npdate(2001, 7, 2))
+
+        # Without a recorded state, only new data can be found
+        assessment = FreshnessAssessor().start(fetcher=fetcher, loader=loader)
+        assert assessment == Assessment(append=Timespan(numpy_after(2001, 6, 30), npdate(2001, 7, 2)), state=state)
+
+    def test_no_manifest_empty_dataset(self, fetcher, loader, state):
+        loader.manifest.return_value = None
+        loader.time_dim = "tempo"
+        loader.dataset.return_value = xarray.Dataset(coords={"tempo": numpy.array([], dtype="datetime64[ns]")})
+        assessment = FreshnessAssessor().start(fetcher=fetcher, loader=loader)
+        assert assessment.initial == fetcher.get_remote_timespan.return_value
+
+    def test_initial_empty(self, fetcher, loader, state):
+        loader.manifest.return_value = {"time": {"start": None, "end": None, "length": 0}}
+        assessment = FreshnessAssessor().start(fetcher=fetcher, loader=loader)
+        assert assessment.initial == fetcher.get_remote_timespan.return_value
+
+    def test_append(self, fetcher, loader, state):
+        state["precip.2001.nc"] = year(2001, size=200)
+        fetcher.get_remote_timespan.return_value = Timespan(npdate(1999, 1, 1), npdate(2001, 7, 2))
+        assessment = FreshnessAssessor().start(fetcher=fetcher, loader=loader)
+        assert assessment.append == Timespan(numpy_after(2001, 6, 30), npdate(2001, 7, 2))
+        assert assessment.replace == ()
+        assert assessment.state is state
+
+    def test_replace(self, fetcher, loader, state):
+        state["precip.1999.nc"] = year(1999, modified="20010701000000")
+        state["precip.1999.RT.nc"] = year(1999)
+        state["precip.2000.nc"] = year(2000, size=200)
+        assessment = FreshnessAssessor().start(fetcher=fetcher, loader=loader)
+        assert assessment.append is None
+        assert assessment.replace == (
+            Timespan(npdate(1999, 1, 1), npdate(1999, 12, 31)),
+            Timespan(npdate(2000, 1, 1), npdate(2000, 12, 31)),
+        )
+
+    def test_replace_clipped_to_published_start(self, fetcher, loader, state):
+        loader.manifest.return_value["time"]["start"] = "2000-06-01T00:00:00.000000000"
+        state["precip.1999.nc"] = year(1999, size=200)
+        state["precip.2000.nc"] = year(2000, size=200)
+        assessment = FreshnessAssessor().start(fetcher=fetcher, loader=loader)
+        assert assessment.replace == (Timespan(npdate(2000, 6, 1), npdate(2000, 12, 31)),)
+
+    def test_replace_disabled(self, fetcher, loader, state):
+        state["precip.2000.nc"] = year(2000, size=200)
+        assessment = FreshnessAssessor(replace=False).start(fetcher=fetcher, loader=loader)
+        assert assessment.nothing
+
+    def test_entries_without_spans(self, fetcher, loader, state):
+        state["README"] = {"size": 42}
+        state["precip.2000.nc"] = year(2000, size=200)
+        assessment = FreshnessAssessor().start(fetcher=fetcher, loader=loader)
+        assert assessment.replace == (Timespan(npdate(2000, 1, 1), npdate(2000, 12, 31)),)
+
+    def test_no_recorded_state(self, fetcher, loader, state):
+        del loader.manifest.return_value["source"]
+        assessment = FreshnessAssessor().start(fetcher=fetcher, loader=loader)
+        assert assessment == Assessment(state=state)
+        fetcher.get_remote_timespan.assert_called_once_with()
+
+    def test_no_remote_state(self, fetcher, loader):
+        fetcher.get_remote_state.return_value = None
+        fetcher.get_remote_timespan.return_value = Timespan(npdate(1999, 1, 1), npdate(2001, 7, 1))
+        assessment = FreshnessAssessor().start(fetcher=fetcher, loader=loader)
+        assert assessment == Assessment(append=Timespan(numpy_after(2001, 6, 30), npdate(2001, 7, 1)))
+
+    def test_state_disabled(self, fetcher, loader):
+        assessment = FreshnessAssessor(state=False).start(fetcher=fetcher, loader=loader)
+        assert assessment == Assessment()
+        fetcher.get_remote_state.assert_not_called()
+
+
+def numpy_after(year, month, day):
+    """The smallest step after the start of a day."""
+    return npdate(year, month, day) + numpy.timedelta64(1, "ns")
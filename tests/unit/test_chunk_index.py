@@ -0,0 +1,184 @@
+import json
+
+import numpy
+import pytest
+import xarray
+import zarr
+
+from dc_etl import chunk_index, stats
+from dc_etl.load import align_chunks, dataset_manifest, encoding_chunks, zarr_chunks
+
+
+@pytest.fixture
+def dataset():
+    data = numpy.random.default_rng(0).normal(10.0, 2.0, (100, 6))
+    data[20:30] = numpy.nan
+    data[40, 1] = numpy.nan
+    dataset = xarray.Dataset({"data": (("time", "x"), data)}, coords={"time": numpy.arange(100), "x": numpy.arange(6)})
+    dataset.data.encoding["chunks"] = (10, 4)
+    return dataset
+
+
+def write(dataset, store, offsets=None, **kwargs):
+    """Write a dataset, the way loaders do, and update the chunk index."""
+    if offsets or "append_dim" in kwargs:
+        chunks = zarr_chunks(zarr.open_consolidated(store, mode="r"))
+    else:
+        chunks = encoding_chunks(dataset)
+    blocks = {}
+    stats.to_zarr(align_chunks(dataset, chunks, offsets), store=store, consolidated=True, blocks=blocks, **kwargs)
+    chunk_index.update(store, blocks, offsets, append="append_dim" in kwargs)
+
+
+def expected_index(store):
+    """Summarize every chunk by reading the whole dataset."""
+    data = xarray.open_zarr(store).data.values
+    index = numpy.full((10, 2, 3), numpy.nan)
+    for i in range(10):
+        for j in range(2):
+            chunk = data[i * 10 : (i + 1) * 10, j * 4 : (j + 1) * 4]
+            statistics = stats.Statistics.of(chunk)
+            index[i, j] = statistics.minimum, statistics.maximum, statistics.nan_count / chunk.size
+    return index
+
+
+def read_index(store):
+    return zarr.open_consolidated(store, mode="r")[f"{chunk_index.GROUP}/data"][...]
+
+
+def test_update(dataset):
+    store = {}
+    write(dataset, store)
+    numpy.testing.assert_array_equal(read_index(store), expected_index(store))
+
+    index = zarr.open_array(store, path=f"{chunk_index.GROUP}/data", mode="r")
+    assert index.attrs.asdict() == {
+        "variable": "data",
+        "dims": ["time", "x"],
+        "chunks": [10, 4],
+        "fields": ["min", "max", "fill"],
+    }
+
+    # The dataset itself is unchanged, as far as xarray is concerned
+    assert list(xarray.open_zarr(store).data_vars) == ["data"]
+    assert list(dataset_manifest(store, "time")["variables"]) == ["data", "time", "x"]
+
+
+def test_update_append(dataset):
+    store = {}
+    write(dataset.isel(time=slice(0, 45)), store)
+    write(dataset.isel(time=slice(45, 73)), store, {"time": 45}, append_dim="time")
+    write(dataset.isel(time=slice(73, 100)), store, {"time": 73}, append_dim="time")
+    assert read_index(store).shape == (10, 2, 3)
+    numpy.testing.assert_allclose(read_index(store), expected_index(store))
+
+
+def test_update_append_unknown(dataset):
+    store = {}
+    write(dataset.isel(time=slice(0, 45)), store)
+    zarr.open_array(store, path=f"{chunk_index.GROUP}/data", mode="r+")[4] = numpy.nan
+    write(dataset.isel(time=slice(45, 100)), store, {"time": 45}, append_dim="time")
+    numpy.testing.assert_allclose(read_index(store), expected_index(store))
+
+
+def test_update_append_not_extended(dataset):
+    store = {}
+    write(dataset, store)
+    zarr.open_array(store, path=f"{chunk_index.GROUP}/data", mode="r+")[4, 0] = 0.0
+
+    # Data which doesn't extend the chunk along any dimension can't be merged, so the chunk is read back
+    statistics = stats.Statistics.of(dataset.data.values[40:45, 0:4])
+    chunk_index.update(store, {"data": {((40, 45), (0, 4)): statistics}}, append=True)
+    numpy.testing.assert_array_equal(read_index(store), expected_index(store))
+
+
+def test_update_nothing_written(dataset):
+    store = {}
+    write(dataset, store)
+    before = dict(store)
+    chunk_index.update(store, {"data": {}})
+    assert store == before
+
+
+def test_update_replace(dataset):
+    store = {}
+    write(dataset, store)
+    replace = xarray.full_like(dataset.isel(time=slice(25, 52)).drop_vars(["time", "x"]), 100.0)
+    write(replace, store, {"time": 25}, region={"time": slice(25, 52)}, safe_chunks=False)
+    index = read_index(store)
+    numpy.testing.assert_array_equal(index, expected_index(store))
+    assert index[2, 0, 2] == 0.5
+    assert index[3, 0].tolist() == [100.0, 100.0, 0.0]
+
+
+def test_update_only_touches_written(dataset, monkeypatch):
+    monkeypatch.setattr(chunk_index, "_ENTRIES", 4)
+
+    store = {}
+    write(dataset, store)
+    before = dict(store)
+    more = dataset.isel(time=slice(90, 100)).assign_coords(time=numpy.arange(100, 110))
+    write(more, store, {"time": 100}, append_dim="time")
+
+    # Index chunks hold 2 x 2 entries, so only the new one is written
+    prefix = f"{chunk_index.GROUP}/data/"
+    changed = sorted(key for key, value in store.items() if key.startswith(prefix) and before.get(key) != value)
+    assert changed == [f"{prefix}.zarray", f"{prefix}5.0.0"]
+    metadata = json.loads(store[".zmetadata"])["metadata"]
+    assert metadata[f"{prefix}.zarray"]["shape"] == [11, 2, 3]
+    assert metadata[f"{prefix}.zarray"]["chunks"] == [2, 2, 3]
+    numpy.testing.assert_array_equal(read_index(store)[10], read_index(store)[9])
+
+
+def test_candidate_chunks(dataset):
+    store = {}
+    write(dataset, store)
+    data = dataset.data.values
+
+    candidates = chunk_index.candidate_chunks(store, "data")
+    assert len(candidates) == 18
+    assert {"time": slice(20, 30), "x": slice(0, 4)} not in candidates
+
+    for minimum, maximum in [(15.0, None), (None, 5.0), (9.9, 10.1), (100.0, None)]:
+        lower = minimum if minimum is not None else -numpy.inf
+        upper = maximum if maximum is not None else numpy.inf
+        candidates = chunk_index.candidate_chunks(store, "data", minimum, maximum)
+        expected = [
+            {"time": slice(i, i + 10), "x": slice(j, j + 4)}
+            for i in range(0, 100, 10)
+            for j in range(0, 8, 4)
+            if numpy.nanmax(data[i : i + 10, j : j + 4], initial=-numpy.inf) >= lower
+            and numpy.nanmin(data[i : i + 10, j : j + 4], initial=numpy.inf) <= upper
+        ]
+        assert candidates == expected
+
+        # No chunk with a matching value is ever skipped
+        for i, j in zip(*numpy.nonzero((data >= lower) & (data <= upper))):
+            assert any(
+                chunk["time"].start <= i < chunk["time"].stop and chunk["x"].start <= j < chunk["x"].stop
+                for chunk in candidates
+            )
+
+
+def test_candidate_chunks_unknown(dataset):
+    store = {}
+    write(dataset, store)
+    zarr.open_array(store, path=f"{chunk_index.GROUP}/data", mode="r+")[2, 0] = numpy.nan
+    assert {"time": slice(20, 30), "x": slice(0, 4)} in chunk_index.candidate_chunks(store, "data", 1000.0)
+
+
+def test_bounds(dataset):
+    store = {}
+    write(dataset, store)
+    assert chunk_index.bounds(store, "data") == (numpy.nanmin(dataset.data.values), numpy.nanmax(dataset.data.values))
+
+    zarr.open_array(store, path=f"{chunk_index.GROUP}/data", mode="r+")[2, 0] = numpy.nan
+    assert chunk_index.bounds(store, "data") is None
+
+
+def test_bounds_no_values(dataset):
+    dataset.data.values[:] = numpy.nan
+    store = {}
+    write(dataset, store)
+    lowest, highest = chunk_index.bounds(store, "data")
+    assert numpy.isnan(lowest) and numpy.isnan(highest)
@@ -59,7 +59,8 @@ class TestDefaultCombiner:
         kerchunk = mocker.patch("dc_etl.combine.combine")
         xarray = mocker.patch("dc_etl.combine.xarray")
         time = mocker.patch("dc_etl.combine.time")
-        time.time.return_value = 42
+        time.time_ns.return_value = 42
+        mocker.patch("dc_etl.combine.os.getpid", return_value=7)
 
         pre1 = mock.Mock(return_value="what's your name?")
         pre2 = mock.Mock(return_value="my name is george")
@@ -68,7 +69,7 @@ class TestDefaultCombiner:
 
         source1 = filespec.file("path/one")
         source2 = filespec.file("path/two")
-        outfile = filespec.file(tmpdir) / "combined_zarr_42.json"
+        outfile = filespec.file(tmpdir) / "combined_zarr_42_7.json"
 
         kerchunk.MultiZarrToZarr = MockMultiZarrToZarr(
             [source1.path, source2.path], "file", ["a", "b"], ["c", "d"], "my name is george", "i have a cheeseburger"
@@ -89,3 +90,14 @@ class TestDefaultCombiner:
         post2.assert_called_once_with("i have 5 dollars")
 
         assert orjson.loads(outfile.open().read()) == {"hi": "mom!"}
+        assert xarray.open_dataset.call_args.kwargs["chunks"] is None
+
+    def test___call___with_chunks(self, tmpdir, mocker):
+        kerchunk = mocker.patch("dc_etl.combine.combine")
+        kerchunk.MultiZarrToZarr.return_value.translate.return_value = {}
+        xarray = mocker.patch("dc_etl.combine.xarray")
+        source = filespec.file("path/one")
+        combine = combine_module.DefaultCombiner(filespec.file(tmpdir), ["a"], ["b"], chunks={})
+
+        assert combine([source]) == xarray.open_dataset.return_value
+        assert xarray.open_dataset.call_args.kwargs["chunks"] == {}
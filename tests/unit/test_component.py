@@ -55,3 +55,10 @@ def test_ipld_publisher():
     assert ipld_publisher.args == ("one", "two")
     assert ipld_publisher.foo == "bar"
     assert ipld_publisher.bar == "baz"
+
+
+def test_ipld_store():
+    ipld_store = component.ipld_store("testing", "one", "two", foo="bar", bar="baz")
+    assert ipld_store.args == ("one", "two")
+    assert ipld_store.foo == "bar"
+    assert ipld_store.bar == "baz"
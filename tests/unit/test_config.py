@@ -1,5 +1,10 @@
+import importlib.metadata
+
+from importlib.metadata import EntryPoint
+
 import pytest
 
+from dc_etl import config as config_module
 from dc_etl.config import _Configuration
 from dc_etl.errors import MissingConfigurationError
 from dc_etl.filespec import file
@@ -50,6 +55,42 @@ class Test_Configuration:
             config["two"][2].as_component("fetcher")
 
 
+class TestRegistry:
+    @pytest.fixture(autouse=True)
+    def refresh(self):
+        config_module.refresh_registry()
+        yield
+        config_module.refresh_registry()
+
+    def test_entry_points_scanned_once(self, config, mocker):
+        entry_points = mocker.spy(importlib.metadata, "entry_points")
+        config["two"][0].as_component("fetcher")
+        config["two"][0].as_component("extractor")
+        with pytest.raises(MissingConfigurationError):
+            config["two"][2].as_component("fetcher")
+
+        entry_points.assert_called_once_with()
+
+    def test_refresh_registry(self, config, mocker):
+        plugin = EntryPoint("plugin", "tests.unit.test_config:MockComponent", "fetcher")
+        with pytest.raises(MissingConfigurationError):
+            config_module._get_component("fetcher", "plugin", (), {})
+
+        entry_points = importlib.metadata.entry_points()
+        mocker.patch("importlib.metadata.entry_points", return_value=list(entry_points) + [plugin])
+        with pytest.raises(MissingConfigurationError):
+            config_module._get_component("fetcher", "plugin", (), {})
+
+        config_module.refresh_registry()
+        component = config_module._get_component("fetcher", "plugin", (), {"foo": "bar"})
+        assert isinstance(component, MockComponent)
+
+    def test_component_not_imported_until_built(self, mocker):
+        load = mocker.patch.object(EntryPoint, "load")
+        assert "testing" in config_module._entry_points("fetcher")
+        load.assert_not_called()
+
+
 class MockComponent:
     @classmethod
     def _from_config(cls, config):
@@ -0,0 +1,10 @@
+from dc_etl.fetch import Fetcher
+
+
+class SomeFetcher(Fetcher):
+    fetch = None
+    get_remote_timespan = None
+
+
+def test_get_remote_state_default():
+    assert SomeFetcher().get_remote_state() is None
@@ -0,0 +1,55 @@
+"""Guards against heavy dependencies creeping back into the modules that are imported just to start a pipeline.
+
+Each check runs in a fresh interpreter, since by the time the tests run everything has already been imported.
+"""
+
+import json
+import pathlib
+import subprocess
+import sys
+
+HERE = pathlib.Path(__file__).absolute().parent
+ROOT = HERE.parent.parent
+
+HEAVY = ("dask", "fsspec", "kerchunk", "multiformats", "numcodecs", "numpy", "py_hamt", "xarray", "yaml", "zarr")
+
+# Generous, so as not to be flaky on slow machines, but an order of magnitude under importing xarray and friends
+IMPORT_BUDGET = 0.25
+FROM_YAML_BUDGET = 0.5
+
+
+def run(code):
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, check=True, text=True)
+    return json.loads(result.stdout)
+
+
+def test_import_component_is_light():
+    imported = run(
+        "import json, sys\n"
+        "import dc_etl.component, dc_etl.pipeline\n"
+        f"print(json.dumps([name for name in {HEAVY!r} if name in sys.modules]))\n"
+    )
+    assert imported == []
+
+
+def test_import_component_time():
+    elapsed = run(
+        "import json, time\n"
+        "start = time.perf_counter()\n"
+        "import dc_etl.component\n"
+        "print(json.dumps(time.perf_counter() - start))\n"
+    )
+    assert elapsed < IMPORT_BUDGET
+
+
+def test_pipeline_from_yaml_time():
+    # The testing components are mocks, so their module is imported up front to leave only the cost of dc_etl itself
+    elapsed = run(
+        "import json, time\n"
+        "import tests.unit.conftest\n"
+        "start = time.perf_counter()\n"
+        "from dc_etl.pipeline import Pipeline\n"
+        "Pipeline.from_yaml('tests/unit/etc/pipeline_no_transformer.yaml')\n"
+        "print(json.dumps(time.perf_counter() - start))\n"
+    )
+    assert elapsed < FROM_YAML_BUDGET
@@ -0,0 +1,240 @@
+import json
+
+from unittest import mock
+
+import numpy
+import pytest
+import xarray
+import zarr
+
+from dc_etl.fetch import Timespan
+from dc_etl.load import (
+    Loader,
+    align_chunks,
+    dataset_manifest,
+    encoding_chunks,
+    merge_regions,
+    partition_bounds,
+    replace_regions,
+    time_coordinate,
+    time_regions,
+    zarr_chunks,
+)
+from tests.conftest import npdate
+from tests.unit.conftest import mock_dataset
+
+
+@pytest.fixture
+def times():
+    return numpy.arange(
+        numpy.datetime64("2000-01-01", "ns"), numpy.datetime64("2001-01-01", "ns"), numpy.timedelta64(1, "D")
+    )
+
+
+class Test_time_regions:
+    def test_single_span(self, times):
+        regions = time_regions(times, Timespan(npdate(2000, 7, 7), npdate(2000, 7, 9)))
+        assert regions.tolist() == [[188, 191]]
+
+    def test_many_spans(self, times):
+        spans = [
+            Timespan(npdate(2000, 1, 1), npdate(2000, 1, 1)),
+            Timespan(npdate(2000, 7, 7), npdate(2000, 7, 9)),
+            Timespan(npdate(2000, 12, 1), npdate(2000, 12, 31)),
+        ]
+        regions = time_regions(times, spans)
+        assert regions.tolist() == [[0, 1], [188, 191], [335, 366]]
+
+    def test_exact_match_required(self, times):
+        span = Timespan(numpy.datetime64("2000-07-07T06:00"), npdate(2000, 7, 9))
+        with pytest.raises(KeyError):
+            time_regions(times, span)
+
+    def test_out_of_range(self, times):
+        with pytest.raises(KeyError):
+            time_regions(times, Timespan(npdate(2000, 7, 7), npdate(2001, 1, 1)))
+
+    def test_nearest(self, times):
+        spans = [
+            Timespan(numpy.datetime64("2000-07-07T06:00"), numpy.datetime64("2000-07-09T18:00")),
+            Timespan(numpy.datetime64("2000-07-07T12:00"), numpy.datetime64("2000-07-09T12:00")),
+        ]
+        regions = time_regions(times, spans, method="nearest")
+        assert regions.tolist() == [[188, 192], [189, 192]]
+
+    def test_nearest_tie_matches_xarray(self, times):
+        dataset = xarray.Dataset(coords={"time": times})
+        ties = [numpy.datetime64("2000-07-07T12:00"), numpy.datetime64("2000-12-30T12:00")]
+        regions = time_regions(times, Timespan(*ties), method="nearest")
+        expected = [int(numpy.argmax(times == dataset.time.sel(time=tie, method="nearest").values)) for tie in ties]
+        assert regions.tolist() == [[expected[0], expected[1] + 1]]
+        assert expected == [189, 365]
+
+    def test_nearest_out_of_range(self, times):
+        span = Timespan(npdate(1999, 12, 1), npdate(2001, 2, 1))
+        regions = time_regions(times, span, method="nearest")
+        assert regions.tolist() == [[0, 366]]
+
+    def test_nearest_one_timestamp(self, times):
+        regions = time_regions(times[:1], Timespan(npdate(1999, 12, 1), npdate(2001, 2, 1)), method="nearest")
+        assert regions.tolist() == [[0, 1]]
+
+    def test_empty_times(self, times):
+        with pytest.raises(KeyError):
+            time_regions(times[:0], Timespan(npdate(2000, 7, 7), npdate(2000, 7, 9)))
+
+    def test_backwards_span(self, times):
+        with pytest.raises(ValueError):
+            time_regions(times, Timespan(npdate(2000, 7, 9), npdate(2000, 7, 7)))
+
+    def test_bad_method(self, times):
+        with pytest.raises(ValueError):
+            time_regions(times, Timespan(npdate(2000, 7, 7), npdate(2000, 7, 9)), method="backfill")
+
+
+class RecordingStore(dict):
+    def __init__(self):
+        self.read = []
+
+    def __getitem__(self, key):
+        self.read.append(key)
+        return super().__getitem__(key)
+
+
+@pytest.fixture
+def store(times):
+    store = RecordingStore()
+    data = numpy.random.randn(len(times), 3)
+    dataset = mock_dataset(data=("data", data), dims=[("tempo", times), ("x", numpy.arange(3))])
+    dataset.data.encoding["chunks"] = (30, 3)
+    dataset.to_zarr(store=store, consolidated=True)
+    store.read.clear()
+    return store
+
+
+def test_time_coordinate(store, times):
+    decoded = time_coordinate(zarr.open_consolidated(store, mode="r"), "tempo")
+
+    numpy.testing.assert_array_equal(decoded, times)
+    assert not any(key.startswith("data/") for key in store.read)
+    assert not any(key.startswith("x/") for key in store.read)
+
+
+def test_replace_regions(store, times):
+    dataset = mock_dataset(data=("data", numpy.ones((len(times), 3))), dims=[("tempo", times), ("x", numpy.arange(3))])
+    spans = [
+        Timespan(npdate(2000, 3, 6), npdate(2000, 3, 7)),
+        Timespan(npdate(2000, 3, 1), npdate(2000, 3, 4)),
+        Timespan(npdate(2000, 3, 2), npdate(2000, 3, 3)),
+    ]
+    regions = replace_regions(zarr.open_consolidated(store, mode="r"), dataset, spans, "tempo")
+
+    assert [(start, stop) for start, stop, _ in regions] == [(60, 64), (65, 67)]
+    for start, stop, region in regions:
+        assert list(region.variables) == ["data"]
+        assert region.data.shape == (stop - start, 3)
+    assert not any(key.startswith("data/") for key in store.read)
+
+
+def test_dataset_manifest(store):
+    manifest = dataset_manifest(store, "tempo")
+    assert manifest["time"] == {
+        "start": "2000-01-01T00:00:00.000000000",
+        "end": "2000-12-31T00:00:00.000000000",
+        "length": 366,
+    }
+    assert manifest["dims"] == {"tempo": 366, "x": 3}
+    assert manifest["variables"]["data"] == {
+        "dims": ["tempo", "x"],
+        "shape": [366, 3],
+        "chunks": [30, 3],
+        "dtype": "<f8",
+        "compressor": None,
+        "filters": None,
+        "fill_value": "NaN",
+    }
+    assert set(manifest["variables"]) == {"data", "tempo", "x"}
+    assert not any(key.startswith("data/") for key in store.read)
+    json.dumps(manifest)
+
+
+def test_zarr_chunks(store):
+    chunks = zarr_chunks(zarr.open_consolidated(store, mode="r"))
+    assert chunks["data"] == (30, 3)
+    assert chunks["x"] == (3,)
+
+
+def test_encoding_chunks(times):
+    dataset = mock_dataset(
+        data=("data", numpy.zeros((len(times), 3))), dims=[("tempo", times), ("x", numpy.arange(3))]
+    )
+    dataset.data.encoding["chunks"] = (30, 3)
+    assert encoding_chunks(dataset) == {"data": (30, 3)}
+
+
+class Test_align_chunks:
+    @pytest.fixture
+    def dataset(self, times):
+        data = numpy.zeros((len(times), 3))
+        return mock_dataset(data=("data", data), dims=[("tempo", times), ("x", numpy.arange(3))])
+
+    def test_align(self, dataset):
+        aligned = align_chunks(dataset, {"data": (100, 2)})
+        assert aligned.data.chunks == ((100, 100, 100, 66), (2, 1))
+        assert dataset.data.chunks is None
+        assert aligned.tempo.chunks is None
+
+    def test_offset(self, dataset):
+        aligned = align_chunks(dataset, {"data": (100, 3)}, {"tempo": 250})
+        assert aligned.data.chunks == ((50, 100, 100, 100, 16), (3,))
+
+    def test_offset_within_chunk(self, dataset):
+        aligned = align_chunks(dataset.isel(tempo=slice(0, 20)), {"data": (100, 3)}, {"tempo": 250})
+        assert aligned.data.chunks == ((20,), (3,))
+
+    def test_missing_variable(self, dataset):
+        aligned = align_chunks(dataset, {"nope": (100,)})
+        assert aligned.data.chunks is None
+
+
+def test_partition_bounds():
+    assert partition_bounds(10, 3, 2) == [(0, 6), (6, 10)]
+    assert partition_bounds(12, 3, 2) == [(0, 6), (6, 12)]
+    assert partition_bounds(12, 3, 4) == [(0, 3), (3, 6), (6, 9), (9, 12)]
+    assert partition_bounds(4, 3, 3) == [(0, 0), (0, 3), (3, 4)]
+
+
+class Test_merge_regions:
+    def test_merge_overlapping_and_contiguous(self):
+        regions = numpy.array([[50, 60], [10, 20], [15, 25], [25, 30]])
+        assert merge_regions(regions) == [(10, 30), (50, 60)]
+
+    def test_gap_in_shared_chunk(self):
+        regions = numpy.array([[2, 4], [7, 9], [9, 14]])
+        assert merge_regions(regions) == [(2, 4), (7, 14)]
+
+
+class TestLoader:
+    def test_replace_many(self):
+        class MyLoader(Loader):
+            initial = append = None
+            replace = mock.Mock()
+
+        loader = MyLoader()
+        loader.replace_many("dataset", ["span1", "span2"], foo="bar")
+        assert loader.replace.call_args_list == [
+            mock.call("dataset", "span1", foo="bar"),
+            mock.call("dataset", "span2", foo="bar"),
+        ]
+
+    def test_manifest(self):
+        class MyLoader(Loader):
+            initial = append = replace = None
+
+        assert MyLoader().manifest() is None
+
+    def test_dataset(self):
+        class MyLoader(Loader):
+            initial = append = replace = None
+
+        assert MyLoader().dataset() is None
@@ -0,0 +1,337 @@
+import json
+import threading
+
+import numpy
+import pytest
+import xarray
+import zarr
+
+from dc_etl.ipld.stores import Link, block_cid
+from dc_etl.mappers import DiffMapper, LockedMapper, ShardedMapper
+from tests.unit.conftest import mock_dataset
+
+
+class RecordingStore(dict):
+    def __init__(self):
+        self.written = []
+
+    def __setitem__(self, key, value):
+        self.written.append(key)
+        super().__setitem__(key, value)
+
+
+class TestDiffMapper:
+    def test_skip_unchanged(self):
+        store = RecordingStore()
+        data = numpy.arange(40.0)
+        dataset = mock_dataset(data=("data", data), dims=[("x", numpy.arange(40))])
+        dataset.data.encoding["chunks"] = (10,)
+        dataset.to_zarr(store=store)
+
+        dataset.data[15] = -1.0
+        store.written.clear()
+        mapper = DiffMapper(store)
+        dataset.drop_vars("x").to_zarr(store=mapper, region={"x": slice(0, 40)})
+
+        assert mapper.counts == (1, 3)
+        assert store.written == ["data/1"]
+        assert store["data/1"] == mapper["data/1"]
+
+    def test_partial_chunk(self):
+        store = RecordingStore()
+        dataset = mock_dataset(data=("data", numpy.arange(40.0)), dims=[("x", numpy.arange(40))])
+        dataset.data.encoding["chunks"] = (10,)
+        dataset.to_zarr(store=store)
+
+        store.written.clear()
+        mapper = DiffMapper(store)
+        dataset.isel(x=slice(5, 25)).drop_vars("x").to_zarr(store=mapper, region={"x": slice(5, 25)})
+
+        assert mapper.counts == (0, 3)
+        assert store.written == []
+
+    def test_new_keys_and_mapping_methods(self):
+        store = {"a/.zarray": b"{}"}
+        mapper = DiffMapper(store)
+        mapper["a/0"] = b"new"
+        mapper["a/.zarray"] = b"{}"
+        mapper["a/.zattrs"] = b"{}"
+
+        assert mapper.counts == (1, 0)
+        assert "a/0" in mapper
+        assert sorted(mapper) == ["a/.zarray", "a/.zattrs", "a/0"]
+        assert len(mapper) == 3
+
+        mapper["a/0"]
+        del mapper["a/0"]
+        assert store == {"a/.zarray": b"{}", "a/.zattrs": b"{}"}
+
+    def test_compare_links(self):
+        store = UnreadableStore({"a/0": b"old", "a/1": b"old", "a/2": b"old"})
+        links = {key: Link(block_cid(value, "raw")) for key, value in store.items() if key != "a/2"}
+        mapper = DiffMapper(store, links)
+        mapper["a/0"] = b"old"
+        mapper["a/1"] = b"new"
+        assert mapper.counts == (1, 1)
+        assert store.read == []
+
+        # Not linked to, eg because it's in a shard, so read to compare
+        mapper["a/2"] = b"old"
+        assert mapper.counts == (1, 2)
+        assert store.read == ["a/2"]
+
+    def test_only_top_level_chunks_counted(self):
+        mapper = DiffMapper({})
+        for key in ("data/0.0", "overview_2/data/0.0", "_chunk_index/data/0.0", "data/.zarray"):
+            mapper[key] = b"new"
+
+        assert mapper.counts == (1, 0)
+
+
+class UnreadableStore(dict):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.read = []
+
+    def get(self, key, default=None):
+        self.read.append(key)
+        return super().get(key, default)
+
+
+class ExclusiveStore(dict):
+    """Fails if it is used by more than one thread at a time."""
+
+    def __init__(self):
+        self.using = threading.Lock()
+
+    def __setitem__(self, key, value):
+        assert self.using.acquire(blocking=False)
+        try:
+            super().__setitem__(key, value)
+        finally:
+            self.using.release()
+
+
+class TestLockedMapper:
+    def test_concurrent_writes(self):
+        store = ExclusiveStore()
+        mapper = LockedMapper(store)
+
+        def write(n):
+            for i in range(200):
+                mapper[f"{n}/{i}"] = b"x"
+
+        threads = [threading.Thread(target=write, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(mapper) == 1600
+
+    def test_mapping_methods(self):
+        store = {"a": b"1"}
+        mapper = LockedMapper(store)
+        mapper["b"] = b"2"
+
+        assert mapper["a"] == b"1"
+        assert "b" in mapper
+        assert sorted(mapper) == ["a", "b"]
+
+        del mapper["a"]
+        assert store == {"b": b"2"}
+
+
+class CountingStore(dict):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.read = []
+        self.written = []
+
+    def __getitem__(self, key):
+        self.read.append(key)
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __setitem__(self, key, value):
+        self.written.append(key)
+        super().__setitem__(key, value)
+
+
+class TestShardedMapper:
+    @pytest.fixture
+    def dataset(self):
+        time = numpy.arange(
+            numpy.datetime64("2000-01-01", "ns"), numpy.datetime64("2001-01-01", "ns"), numpy.timedelta64(1, "D")
+        )
+        dataset = mock_dataset(
+            data=("data", numpy.random.randn(len(time), 7)), dims=[("tempo", time), ("x", numpy.arange(7))]
+        )
+        dataset.data.encoding["chunks"] = (10, 3)
+        return dataset
+
+    def test_write_and_read(self, dataset):
+        store = CountingStore()
+        mapper = ShardedMapper(store, {"tempo": 4, "x": 2})
+        dataset.to_zarr(mapper, consolidated=True)
+        mapper.flush()
+
+        # 37 x 3 chunks in 10 x 2 shards, each written once
+        shards = [key for key in store.written if key.startswith("data/shards/")]
+        assert len(shards) == len(set(shards)) == 20
+        assert json.loads(store["data/.zshard"]) == {"chunks_per_shard": [4, 2]}
+        assert not any(key.startswith("data/0") for key in store)
+
+        written = xarray.open_zarr(ShardedMapper(store), consolidated=True)
+        numpy.testing.assert_array_equal(written.data.values, dataset.data.values)
+
+    def test_shard_layout(self):
+        store = {}
+        mapper = ShardedMapper(store, {"x": 4})
+        array = zarr.open_array(mapper, mode="w", shape=(10,), chunks=(2,), dtype="u1", compressor=None)
+        array.attrs["_ARRAY_DIMENSIONS"] = ["x"]
+        array[:] = numpy.arange(10)
+        mapper.flush()
+
+        # Two chunks in the first shard, one in the second, plus index
+        shard = store["shards/0"]
+        index = numpy.frombuffer(shard[-64:], dtype="<u8").reshape(4, 2)
+        assert index.tolist() == [[0, 2], [2, 2], [4, 2], [6, 2]]
+        assert shard[:8] == bytes(range(8))
+
+        index = numpy.frombuffer(store["shards/1"][-64:], dtype="<u8").reshape(4, 2)
+        assert index[0].tolist() == [0, 2]
+        assert (index[1:] == 2**64 - 1).all()
+
+        assert sorted(ShardedMapper(store)) == [".zarray", ".zattrs", ".zshard", "0", "1", "2", "3", "4"]
+
+    def test_append_completes_shard(self, dataset):
+        store = {}
+        mapper = ShardedMapper(store, {"tempo": 4})
+        dataset.isel(tempo=slice(0, 25)).to_zarr(mapper, consolidated=True)
+        mapper.flush()
+
+        mapper = ShardedMapper(store, {"tempo": 4})
+        dataset.isel(tempo=slice(25, None)).to_zarr(mapper, consolidated=True, append_dim="tempo")
+        mapper.flush()
+
+        written = xarray.open_zarr(ShardedMapper(store), consolidated=True)
+        numpy.testing.assert_array_equal(written.data.values, dataset.data.values)
+        assert len([key for key in store if key.startswith("data/shards/")]) == 30
+
+    def test_existing_arrays_not_sharded(self, dataset):
+        store = {}
+        dataset.to_zarr(store, consolidated=True)
+        mapper = ShardedMapper(store, {"tempo": 4})
+        dataset.to_zarr(mapper, consolidated=True, mode="a", append_dim="tempo")
+        mapper.flush()
+
+        assert "data/.zshard" not in store
+        assert "data/72.2" in store
+
+    def test_not_sharded(self, dataset):
+        store = {}
+        mapper = ShardedMapper(store)
+        dataset.to_zarr(mapper, consolidated=True)
+        assert "data/.zshard" not in store
+        assert "data/0.0" in store
+
+    def test_region_reads_shard_once(self, dataset):
+        store = CountingStore()
+        mapper = ShardedMapper(store, {"tempo": 8})
+        dataset.to_zarr(mapper, consolidated=True)
+        mapper.flush()
+
+        store.read.clear()
+        store.written.clear()
+        replace = dataset.isel(tempo=slice(5, 35)).drop_vars(["tempo", "x"]) * 0
+        mapper = ShardedMapper(store)
+        replace.to_zarr(mapper, region={"tempo": slice(5, 35)})
+        mapper.flush()
+
+        # The first four chunks in each column of chunks are all in the first shard of that column
+        assert [key for key in store.written if key.startswith("data/shards/")] == [
+            "data/shards/0.0",
+            "data/shards/0.1",
+            "data/shards/0.2",
+        ]
+        assert [key for key in store.read if key.startswith("data/shards/")] == [
+            "data/shards/0.0",
+            "data/shards/0.1",
+            "data/shards/0.2",
+        ]
+        expected = dataset.data.values.copy()
+        expected[5:35] = 0
+        written = xarray.open_zarr(ShardedMapper(store), consolidated=True)
+        numpy.testing.assert_array_equal(written.data.values, expected)
+
+    def test_delete(self):
+        store = {}
+        mapper = ShardedMapper(store, {"x": 4})
+        array = zarr.open_array(mapper, mode="w", shape=(10,), chunks=(2,), dtype="u1", compressor=None)
+        array.attrs["_ARRAY_DIMENSIONS"] = ["x"]
+        array[:] = 1
+        mapper.flush()
+
+        del mapper["1"]
+        assert "1" not in mapper
+        assert sorted(mapper) == [".zarray", ".zattrs", ".zshard", "0", "2", "3", "4"]
+        with pytest.raises(KeyError):
+            mapper["1"]
+        with pytest.raises(KeyError):
+            del mapper["1"]
+
+        mapper.flush()
+        assert "1" not in ShardedMapper(store)
+        assert ShardedMapper(store)["2"] == b"\x01\x01"
+        index = numpy.frombuffer(store["shards/0"][-64:], dtype="<u8").reshape(4, 2)
+        assert (index[1] == 2**64 - 1).all()
+
+        # Deleting every chunk in a shard removes the shard
+        del mapper["4"]
+        mapper.flush()
+        assert "shards/1" not in store
+        assert sorted(ShardedMapper(store)) == [".zarray", ".zattrs", ".zshard", "0", "1", "2", "3"]
+
+    def test_iterate_pending(self):
+        store = {}
+        mapper = ShardedMapper(store, {"x": 4})
+        array = zarr.open_array(mapper, mode="w", shape=(10,), chunks=(2,), dtype="u1", compressor=None)
+        array.attrs["_ARRAY_DIMENSIONS"] = ["x"]
+        array[:3] = 1
+
+        assert "shards/0" not in store
+        assert sorted(mapper) == [".zarray", ".zattrs", ".zshard", "0", "1"]
+
+    def test_no_dimension_names(self):
+        store = {}
+        mapper = ShardedMapper(store, {"x": 4})
+        array = zarr.open_array(mapper, mode="w", shape=(10,), chunks=(2,), dtype="u1", compressor=None)
+        array[:] = 1
+        assert ".zshard" not in store
+        assert "4" in store
+
+    def test_delete_unsharded(self):
+        store = {".zarray": b"{}", "0": b"chunk"}
+        mapper = ShardedMapper(store, {"x": 4})
+        del mapper["0"]
+        del mapper[".zarray"]
+        assert store == {}
+        with pytest.raises(KeyError):
+            del mapper["0"]
+
+    def test_iterate_without_reading_shards(self, dataset):
+        store = CountingStore()
+        mapper = ShardedMapper(store, {"tempo": 4, "x": 2})
+        dataset.to_zarr(mapper, consolidated=True)
+        mapper.flush()
+
+        store.read.clear()
+        keys = list(ShardedMapper(store))
+        assert not any(key.startswith("data/shards/") for key in store.read)
+        assert (
+            len([key for key in keys if key.startswith("data/") and "." not in key.rpartition("/")[2][:1]]) == 37 * 3
+        )
+        assert "data/36.2" in keys
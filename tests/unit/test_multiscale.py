@@ -0,0 +1,165 @@
+import json
+
+import numpy
+import pytest
+import xarray
+import zarr
+
+from dc_etl import multiscale
+
+
+@pytest.fixture
+def dataset():
+    data = numpy.random.default_rng(0).normal(10.0, 2.0, (40, 8, 12))
+    dataset = xarray.Dataset(
+        {"data": (("time", "latitude", "longitude"), data)},
+        coords={"time": numpy.arange(40), "latitude": numpy.arange(8.0), "longitude": numpy.arange(12.0)},
+        attrs={"multiscales": multiscale.metadata([2, 4], ["latitude", "longitude"])},
+    )
+    dataset.data.encoding["chunks"] = (10, 4, 4)
+    return dataset
+
+
+class RecordingStore(dict):
+    def __init__(self):
+        self.written = []
+
+    def __setitem__(self, key, value):
+        self.written.append(key)
+        super().__setitem__(key, value)
+
+
+def coarsen(dataset, factor, method="mean"):
+    return getattr(dataset.coarsen(latitude=factor, longitude=factor, boundary="pad"), method)()
+
+
+def test_metadata():
+    assert multiscale.metadata([2, 4, 8], ["latitude", "longitude"], "max") == [
+        {
+            "datasets": [
+                {"path": ".", "factor": 1},
+                {"path": "overview_2", "factor": 2},
+                {"path": "overview_4", "factor": 4},
+                {"path": "overview_8", "factor": 8},
+            ],
+            "type": "max",
+            "metadata": {
+                "method": "xarray.Dataset.coarsen",
+                "kwargs": {"dims": ["latitude", "longitude"], "boundary": "pad"},
+            },
+        }
+    ]
+
+
+@pytest.mark.parametrize("factors", [[2, 3], [4, 2], [1, 2]])
+def test_metadata_bad_factors(factors):
+    with pytest.raises(ValueError):
+        multiscale.metadata(factors, ["latitude", "longitude"])
+
+
+def test_metadata_bad_method():
+    with pytest.raises(ValueError):
+        multiscale.metadata([2], ["latitude", "longitude"], "median")
+
+
+@pytest.mark.parametrize("method", ["mean", "max"])
+def test_update(dataset, method):
+    dataset.attrs["multiscales"] = multiscale.metadata([2, 4], ["latitude", "longitude"], method)
+    store = {}
+    dataset.to_zarr(store, consolidated=True)
+    multiscale.update(store, "time")
+
+    for factor in (2, 4):
+        overview = multiscale.open_overview(store, factor)
+        xarray.testing.assert_allclose(overview.data.load(), coarsen(dataset, factor, method).data)
+        assert "multiscales" not in overview.attrs
+        assert overview.data.encoding["chunks"] == ((10, 4, 4) if factor == 2 else (10, 2, 3))
+
+    # Overviews are invisible to readers of the dataset itself
+    xarray.testing.assert_identical(xarray.open_zarr(store).load(), dataset)
+
+
+def test_update_no_multiscales(dataset):
+    del dataset.attrs["multiscales"]
+    store = {}
+    dataset.to_zarr(store, consolidated=True)
+    before = dict(store)
+    multiscale.update(store, "time")
+    assert store == before
+
+
+def test_update_append(dataset):
+    store = {}
+    dataset.isel(time=slice(0, 15)).to_zarr(store, consolidated=True)
+    multiscale.update(store, "time")
+    dataset.isel(time=slice(15, 40)).to_zarr(store, consolidated=True, append_dim="time")
+    before = dict(store)
+    multiscale.update(store, "time", 15, append=True)
+
+    for factor in (2, 4):
+        overview = multiscale.open_overview(store, factor).load()
+        xarray.testing.assert_allclose(overview, coarsen(dataset, factor).drop_attrs())
+
+    # Only the chunks of each overview covering appended data are written
+    changed = {key for key, value in store.items() if key.startswith("overview_4/data/") and before.get(key) != value}
+    assert changed == {
+        "overview_4/data/.zarray",
+        "overview_4/data/1.0.0",
+        "overview_4/data/2.0.0",
+        "overview_4/data/3.0.0",
+    }
+
+
+def test_update_consolidates_once(dataset):
+    store = RecordingStore()
+    dataset.isel(time=slice(0, 15)).to_zarr(store, consolidated=True)
+    multiscale.update(store, "time")
+    assert store.written.count(".zmetadata") == 2
+
+    dataset.isel(time=slice(15, 40)).to_zarr(store, consolidated=True, append_dim="time")
+    store.written.clear()
+    multiscale.update(store, "time", 15, append=True)
+    assert store.written.count(".zmetadata") == 1
+
+    # The consolidated metadata is the same as if the whole store had been consolidated
+    consolidated = json.loads(store[".zmetadata"])
+    zarr.consolidate_metadata(store)
+    assert consolidated == json.loads(store[".zmetadata"])
+
+
+@pytest.mark.parametrize("append", [True, False])
+def test_update_missing_overviews(dataset, append):
+    store = {}
+    without = dataset.copy()
+    del without.attrs["multiscales"]
+    without.isel(time=slice(0, 15)).to_zarr(store, consolidated=True)
+    if append:
+        dataset.isel(time=slice(15, 40)).to_zarr(store, consolidated=True, mode="a", append_dim="time")
+        multiscale.update(store, "time", 15, append=True)
+    else:
+        without.isel(time=slice(15, 40)).to_zarr(store, consolidated=True, append_dim="time")
+        zarr.open_group(store).attrs["multiscales"] = dataset.attrs["multiscales"]
+        zarr.consolidate_metadata(store)
+        multiscale.update(store, "time", 12, 25)
+
+    # Overviews that don't exist yet are built from the whole dataset
+    for factor in (2, 4):
+        overview = multiscale.open_overview(store, factor).load()
+        xarray.testing.assert_allclose(overview, coarsen(dataset, factor).drop_attrs())
+
+
+def test_update_region(dataset):
+    store = {}
+    dataset.to_zarr(store, consolidated=True)
+    multiscale.update(store, "time")
+
+    replaced = dataset.copy(deep=True)
+    replaced.data[12:25] = 42.0
+    region = replaced.isel(time=slice(12, 25)).drop_vars(["time", "latitude", "longitude"])
+    region.to_zarr(store, consolidated=True, region={"time": slice(12, 25)})
+    multiscale.update(store, "time", 12, 25)
+
+    for factor in (2, 4):
+        overview = multiscale.open_overview(store, factor).load()
+        xarray.testing.assert_allclose(overview, coarsen(replaced, factor).drop_attrs())
+        assert (overview.data.values[12:25] == 42.0).all()
@@ -1,12 +1,27 @@
-from dc_etl import combine
+import os
+
+from unittest import mock
+
+import numpy
+import pytest
+import xarray
+
+from dc_etl import combine, component
+from dc_etl.assessor import Assessment
 from dc_etl.extractors import netcdf
+from dc_etl.fetch import Timespan
 from dc_etl.fetchers import cpc
 from dc_etl.filespec import file
 from dc_etl.ipld.loader import IPLDLoader
 from dc_etl.ipld.local_file import LocalFileIPLDPublisher
+from dc_etl.loaders.directory import DirectoryLoader
 from dc_etl.pipeline import Pipeline
 from dc_etl.transform import identity
 
+from tests import synthetic
+from tests.conftest import npdate
+from tests.ftpserver import FTPServer
+
 from .conftest import HERE
 
 
@@ -63,3 +78,139 @@ class TestPipeline:
         assert precip_global.loader.time_dim == "time"
         assert isinstance(precip_global.loader.publisher, LocalFileIPLDPublisher)
         assert precip_global.loader.publisher.path == "cid/goes/here"
+
+    def test_assess(self):
+        pipeline = mock_pipeline(Assessment(state={"a": 1}))
+        assert pipeline.assess(foo="bar") == Assessment(state={"a": 1})
+        pipeline.assessor.start.assert_called_once_with(fetcher=pipeline.fetcher, loader=pipeline.loader, foo="bar")
+
+    def test_assess_false(self):
+        pipeline = mock_pipeline(False)
+        assert pipeline.assess() == Assessment()
+        pipeline.fetcher.get_remote_timespan.assert_not_called()
+
+    def test_assess_true(self):
+        pipeline = mock_pipeline(True)
+        pipeline.fetcher.get_remote_timespan.return_value = Timespan(npdate(2000, 1, 1), npdate(2000, 2, 1))
+        pipeline.loader.manifest.return_value = {
+            "time": {"start": "2000-01-01T00:00:00", "end": "2000-01-31T00:00:00", "length": 31}
+        }
+        assessment = pipeline.assess()
+        assert assessment.append == Timespan(npdate(2000, 1, 31) + numpy.timedelta64(1, "ns"), npdate(2000, 2, 1))
+        pipeline.fetcher.get_remote_state.assert_not_called()
+
+    def test_run_nothing(self):
+        pipeline = mock_pipeline(Assessment(state={"a": 1}))
+        assert pipeline.run().nothing
+        pipeline.fetcher.fetch.assert_not_called()
+        assert pipeline.loader.mock_calls == []
+
+    def test_run(self):
+        initial = Timespan(npdate(2000, 1, 1), npdate(2000, 1, 31))
+        replace = (Timespan(npdate(2000, 2, 1), npdate(2000, 2, 2)), Timespan(npdate(2000, 3, 1), npdate(2000, 3, 2)))
+        append = Timespan(npdate(2000, 4, 1), npdate(2000, 4, 30))
+        assessment = Assessment(initial=initial, replace=replace, append=append, state={"a": 1})
+        pipeline = mock_pipeline(assessment)
+        pipeline.fetcher.fetch.side_effect = lambda span: [f"source {span.start}"]
+        pipeline.extractor.side_effect = lambda source: [f"extracted {source}"]
+
+        assert pipeline.run() is assessment
+        assert pipeline.loader.mock_calls == [
+            mock.call.initial(pipeline.transformer.return_value, initial, state=None),
+            mock.call.replace_many(pipeline.transformer.return_value, replace, state=None),
+            mock.call.append(pipeline.transformer.return_value, append, state={"a": 1}),
+        ]
+        assert pipeline.combiner.call_args_list == [
+            mock.call(["extracted source 2000-01-01"]),
+            mock.call(["extracted source 2000-02-01", "extracted source 2000-03-01"]),
+            mock.call(["extracted source 2000-04-01"]),
+        ]
+
+    def test_run_state_recorded_by_last_step(self):
+        initial = Timespan(npdate(2000, 1, 1), npdate(2000, 1, 31))
+        replace = (Timespan(npdate(2000, 2, 1), npdate(2000, 2, 2)),)
+        pipeline = mock_pipeline(Assessment(initial=initial, replace=replace, state={"a": 1}))
+        pipeline.fetcher.fetch.return_value = ["source"]
+        pipeline.extractor.return_value = ["extracted"]
+        pipeline.run()
+        assert pipeline.loader.mock_calls == [
+            mock.call.initial(pipeline.transformer.return_value, initial, state=None),
+            mock.call.replace_many(pipeline.transformer.return_value, replace, state={"a": 1}),
+        ]
+
+        pipeline = mock_pipeline(Assessment(initial=initial, state={"a": 1}))
+        pipeline.fetcher.fetch.return_value = ["source"]
+        pipeline.extractor.return_value = ["extracted"]
+        pipeline.run()
+        assert pipeline.loader.mock_calls == [
+            mock.call.initial(pipeline.transformer.return_value, initial, state={"a": 1}),
+        ]
+
+    def test_run_append_fails(self):
+        replace = (Timespan(npdate(2000, 2, 1), npdate(2000, 2, 2)),)
+        append = Timespan(npdate(2000, 4, 1), npdate(2000, 4, 30))
+        pipeline = mock_pipeline(Assessment(replace=replace, append=append, state={"a": 1}))
+        pipeline.fetcher.fetch.return_value = ["source"]
+        pipeline.extractor.return_value = ["extracted"]
+        pipeline.loader.append.side_effect = ConnectionError("oops")
+
+        with pytest.raises(ConnectionError):
+            pipeline.run()
+
+        # The state wasn't recorded, so the next run will still find the new data to append
+        pipeline.loader.replace_many.assert_called_once_with(pipeline.transformer.return_value, replace, state=None)
+
+    def test_run_cpc(self, tmp_path):
+        folder = tmp_path / "ftp" / "Datasets" / "cpc_global_precip"
+        synthetic.cpc_files(folder, 1, 4, 8)
+        with FTPServer(tmp_path / "ftp") as ftp:
+            pipeline = Pipeline(
+                component.assessor("freshness"),
+                cpc.CPCFetcher("global_precip", file(tmp_path / "cache", auto_mkdir=True), ftp.host, ftp.port),
+                netcdf.NetCDFExtractor(output_folder=file(tmp_path / "extracted", auto_mkdir=True)),
+                combine.DefaultCombiner(
+                    output_folder=file(tmp_path / "combined", auto_mkdir=True),
+                    concat_dims=["time"],
+                    identical_dims=["lat", "lon"],
+                ),
+                identity,
+                DirectoryLoader(file(tmp_path / "dataset.zarr"), "time"),
+            )
+            assessment = pipeline.run()
+            assert assessment.initial == Timespan(npdate(1979, 1, 1), npdate(1979, 12, 31))
+            assert pipeline.loader.dataset().time[-1] == npdate(1979, 12, 31)
+
+            # Nothing new, so nothing is downloaded or even opened
+            ftp.reset_stats()
+            assert pipeline.run().nothing
+            assert ftp.commands["RETR"] == 0
+
+            # A new year of data
+            synthetic.cpc_files(folder, 1, 4, 8, start_year=1980)
+            assessment = pipeline.run()
+            assert assessment.append.end == npdate(1980, 12, 31)
+            assert not assessment.replace
+            assert pipeline.loader.dataset().time[-1] == npdate(1980, 12, 31)
+
+            # A revision of data already loaded
+            (folder / "precip.1979.nc").unlink()
+            (revised,) = synthetic.cpc_files(folder, 1, 4, 8, seed=1)
+            os.utime(revised, (0, 0))
+            assessment = pipeline.run()
+            assert assessment.append is None
+            assert assessment.replace == (Timespan(npdate(1979, 1, 1), npdate(1979, 12, 31)),)
+
+            dataset = pipeline.loader.dataset()
+            assert dataset.sizes["time"] == 731
+            expected = xarray.open_dataset(revised)
+            numpy.testing.assert_array_equal(dataset.precip[:365].values, expected.precip.values)
+
+            ftp.reset_stats()
+            assert pipeline.run().nothing
+            assert ftp.commands["RETR"] == 0
+
+
+def mock_pipeline(assessment):
+    pipeline = Pipeline(mock.Mock(), mock.Mock(), mock.Mock(), mock.Mock(), mock.Mock(), mock.Mock())
+    pipeline.assessor.start.return_value = assessment
+    return pipeline
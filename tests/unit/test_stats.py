@@ -0,0 +1,240 @@
+import collections
+import json
+
+import dask
+import dask.array
+import numpy
+import pytest
+import xarray
+
+from dc_etl import stats
+from dc_etl.stats import Statistics
+
+
+@pytest.fixture
+def values():
+    values = numpy.random.default_rng(0).normal(10.0, 2.0, 1000)
+    values[[3, 500, 501]] = numpy.nan
+    return values
+
+
+def assert_statistics(statistics, values):
+    assert statistics.count == numpy.count_nonzero(~numpy.isnan(values))
+    assert statistics.nan_count == numpy.count_nonzero(numpy.isnan(values))
+    assert statistics.minimum == numpy.nanmin(values)
+    assert statistics.maximum == numpy.nanmax(values)
+    assert statistics.mean == pytest.approx(numpy.nanmean(values), rel=1e-12)
+    assert statistics.variance == pytest.approx(numpy.nanvar(values), rel=1e-9)
+
+
+class TestStatistics:
+    def test_of(self, values):
+        assert_statistics(Statistics.of(values), values)
+
+    def test_of_ints(self):
+        statistics = Statistics.of(numpy.array([[1, 2], [3, 6]], dtype="int16"))
+        assert statistics == Statistics(count=4, nan_count=0, minimum=1.0, maximum=6.0, mean=3.0, m2=14.0)
+
+    def test_of_empty(self):
+        statistics = Statistics.of(numpy.array([numpy.nan, numpy.nan]))
+        assert statistics.count == 0
+        assert statistics.nan_count == 2
+        assert numpy.isnan(statistics.minimum)
+        assert numpy.isnan(statistics.mean)
+        assert numpy.isnan(statistics.variance)
+
+    def test_merge(self, values):
+        merged = Statistics()
+        for chunk in numpy.array_split(values, [0, 3, 4, 250, 500, 502, 999]):
+            merged = merged.merge(Statistics.of(chunk))
+
+        assert_statistics(merged, values)
+
+    def test_merge_empty(self, values):
+        statistics = Statistics.of(values)
+        empty = Statistics.of(numpy.array([numpy.nan]))
+        assert statistics.merge(empty) == statistics._replace(nan_count=4)
+        assert empty.merge(statistics) == statistics._replace(nan_count=4)
+
+    def test_merge_is_stable(self):
+        # Naive sums of squares lose all precision with a large offset like this
+        values = 1e6 + numpy.random.default_rng(0).normal(0.0, 1e-3, 10_000)
+        merged = Statistics()
+        for chunk in numpy.array_split(values, 100):
+            merged = merged.merge(Statistics.of(chunk))
+
+        assert merged.variance == pytest.approx(numpy.var(values), rel=1e-6)
+
+    def test_merge_unknown_bounds(self, values):
+        unknown = Statistics.of(values[:500])._replace(minimum=numpy.nan, maximum=numpy.nan)
+        merged = unknown.merge(Statistics.of(values[500:]))
+        assert numpy.isnan(merged.minimum)
+        assert numpy.isnan(merged.maximum)
+        assert merged.count == Statistics.of(values).count
+
+    def test_remove(self, values):
+        statistics = Statistics.of(values)
+        rest = statistics.remove(Statistics.of(values[200:300]))
+        expected = Statistics.of(numpy.concatenate([values[:200], values[300:]]))
+        assert rest.count == expected.count
+        assert rest.nan_count == expected.nan_count
+        assert rest.mean == pytest.approx(expected.mean, rel=1e-12)
+        assert rest.variance == pytest.approx(expected.variance, rel=1e-9)
+
+        # The minimum and maximum can't be taken out
+        assert (rest.minimum, rest.maximum) == (statistics.minimum, statistics.maximum)
+
+    def test_remove_empty(self, values):
+        statistics = Statistics.of(values)
+        assert statistics.remove(Statistics.of(numpy.array([numpy.nan]))) == statistics._replace(nan_count=2)
+        assert statistics.remove(statistics) == Statistics()
+
+    def test_to_dict_from_dict(self, values):
+        statistics = Statistics.of(values)
+        assert Statistics.from_dict(json.loads(json.dumps(statistics.to_dict()))) == statistics
+
+        empty = Statistics()
+        assert empty.to_dict() == {
+            "count": 0,
+            "nan_count": 0,
+            "minimum": None,
+            "maximum": None,
+            "mean": None,
+            "m2": 0.0,
+        }
+        assert numpy.isnan(Statistics.from_dict(empty.to_dict()).minimum)
+
+
+@pytest.fixture
+def dataset(values):
+    return xarray.Dataset(
+        {
+            "data": ("time", values),
+            "flags": ("time", numpy.arange(1000) % 3 == 0),
+            "names": ("time", numpy.array(["a"] * 1000)),
+        },
+        coords={"time": numpy.arange(1000)},
+    )
+
+
+def test_to_zarr(dataset, values):
+    store = {}
+    statistics = stats.to_zarr(dataset, store=store, consolidated=True)
+    assert sorted(statistics) == ["data", "flags"]
+    assert_statistics(statistics["data"], values)
+    assert statistics["flags"].count == 1000
+    assert statistics["flags"].mean == pytest.approx(334 / 1000)
+    xarray.testing.assert_identical(xarray.open_zarr(store).load(), dataset)
+
+
+def test_to_zarr_dask(dataset, values):
+    dataset["copy"] = dataset.data
+    dataset = dataset.chunk(time=100)
+    store = {}
+    statistics = stats.to_zarr(dataset, store=store, consolidated=True)
+    assert sorted(statistics) == ["copy", "data", "flags"]
+    assert_statistics(statistics["data"], values)
+    assert statistics["copy"] == statistics["data"]
+    assert statistics["flags"].count == 1000
+    xarray.testing.assert_identical(xarray.open_zarr(store).load(), dataset.load())
+
+
+def test_to_zarr_reads_once(dataset, values):
+    reads = collections.Counter()
+
+    def read(i):
+        reads[i] += 1
+        return values[i * 100 : (i + 1) * 100]
+
+    chunks = [dask.array.from_delayed(dask.delayed(read)(i), (100,), values.dtype) for i in range(10)]
+    dataset = dataset[["data"]].assign(data=("time", dask.array.concatenate(chunks)))
+
+    store = {}
+    statistics = stats.to_zarr(dataset, store=store, consolidated=True)
+    assert_statistics(statistics["data"], values)
+    assert reads == {i: 1 for i in range(10)}
+    numpy.testing.assert_array_equal(xarray.open_zarr(store).data.values, values)
+
+
+def test_of(dataset, values):
+    statistics = stats.of(dataset)
+    assert sorted(statistics) == ["data", "flags"]
+    assert_statistics(statistics["data"], values)
+    assert statistics["flags"].count == 1000
+
+    chunked = stats.of(dataset.chunk(time=100))
+    assert_statistics(chunked["data"], values)
+    assert chunked["flags"].count == 1000
+    assert chunked["flags"].mean == pytest.approx(statistics["flags"].mean)
+
+
+def test_combine(values):
+    first = {"data": Statistics.of(values[:400]), "other": Statistics.of(values[:10])}
+    combined = stats.combine(first, {"data": Statistics.of(values[400:])})
+    assert_statistics(combined["data"], values)
+    assert combined["other"] == first["other"]
+
+
+class Test_totals:
+    def test_not_computed(self):
+        assert stats.totals(None) is None
+        assert stats.totals(None, {"statistics": {}}, append=True) is None
+
+    def test_new(self, values):
+        assert stats.totals({"data": Statistics.of(values)}) == {"data": Statistics.of(values).to_dict()}
+
+    def test_append(self, values):
+        manifest = {"statistics": {"data": Statistics.of(values[:600]).to_dict()}}
+        totals = stats.totals({"data": Statistics.of(values[600:])}, manifest, append=True)
+        assert_statistics(Statistics.from_dict(totals["data"]), values)
+
+    def test_append_without_totals(self, values):
+        assert stats.totals({"data": Statistics.of(values)}, {"time": {}}, append=True) is None
+        assert stats.totals({"data": Statistics.of(values)}, None, append=True) is None
+
+    def test_replace(self, values):
+        # The smallest and largest values aren't replaced, so they are still known
+        assert numpy.nanargmin(values) not in range(600, 700)
+        assert numpy.nanargmax(values) not in range(600, 700)
+        new = values.copy()
+        new[600:700] = numpy.random.default_rng(1).normal(10.0, 2.0, 100)
+        manifest = {"statistics": {"data": Statistics.of(values).to_dict(), "other": {"count": 1}}}
+        totals = stats.totals(
+            {"data": Statistics.of(new[600:700])}, manifest, replaced={"data": Statistics.of(values[600:700])}
+        )
+        assert_statistics(Statistics.from_dict(totals["data"]), new)
+        assert totals["other"] == {"count": 1}
+
+    def test_replace_bounds(self, values):
+        manifest = {"statistics": {"data": Statistics.of(values).to_dict()}}
+        lowest = int(numpy.nanargmin(values))
+        new = values.copy()
+        new[lowest] = 10.0
+        region = slice(lowest, lowest + 1)
+        replaced = {"data": Statistics.of(values[region])}
+        written = {"data": Statistics.of(new[region])}
+
+        # The smallest value was replaced, so the new one isn't known without the bounds
+        totals = Statistics.from_dict(stats.totals(written, manifest, replaced=replaced)["data"])
+        assert numpy.isnan(totals.minimum)
+        assert totals.maximum == numpy.nanmax(new)
+        assert totals.mean == pytest.approx(numpy.nanmean(new), rel=1e-12)
+
+        bounds = {"data": (numpy.nanmin(new), numpy.nanmax(new))}
+        totals = stats.totals(written, manifest, replaced=replaced, bounds=bounds)
+        assert_statistics(Statistics.from_dict(totals["data"]), new)
+
+        totals = Statistics.from_dict(
+            stats.totals(written, manifest, replaced=replaced, bounds={"data": None})["data"]
+        )
+        assert numpy.isnan(totals.minimum)
+
+    def test_replace_all(self, values):
+        manifest = {"statistics": {"data": Statistics.of(values).to_dict()}}
+        new = values + 1.0
+        totals = stats.totals({"data": Statistics.of(new)}, manifest, replaced={"data": Statistics.of(values)})
+        assert_statistics(Statistics.from_dict(totals["data"]), new)
+
+    def test_replace_without_totals(self, values):
+        assert stats.totals({"data": Statistics.of(values)}, {"time": {}}, replaced={}) is None
+        assert stats.totals(None, {"statistics": {}}, replaced={}) is None
@@ -58,6 +58,28 @@ def test_compress(dataset):
     assert isinstance(dataset.data.encoding["compressor"], numcodecs.Blosc)
 
 
+def test_multiscales(dataset):
+    multiscales = transformers.multiscales([2, 4], method="max")
+    dataset = multiscales(dataset)
+
+    metadata = dataset.attrs["multiscales"][0]
+    assert [entry["path"] for entry in metadata["datasets"]] == [".", "overview_2", "overview_4"]
+    assert metadata["type"] == "max"
+    assert metadata["metadata"]["kwargs"]["dims"] == ["latitude", "longitude"]
+
+
+def test_multiscales_defaults(dataset):
+    metadata = transformers.multiscales()(dataset).attrs["multiscales"][0]
+    assert [entry["factor"] for entry in metadata["datasets"]] == [1, 2, 4, 8]
+    assert metadata["type"] == "mean"
+    assert metadata["metadata"]["kwargs"]["dims"] == ["latitude", "longitude"]
+
+
+def test_multiscales_bad_method():
+    with pytest.raises(ValueError):
+        transformers.multiscales(method="median")
+
+
 @pytest.fixture
 def dataset():
     latitude = numpy.arange(-50, 50, 10)